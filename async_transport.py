@@ -0,0 +1,270 @@
+import asyncio
+import threading
+import time
+
+import rtos_client
+from command_stats import STATS, command_name
+from serial_worker import END_MARKER, Request
+from task_upload import MAX_TASK_SIZE
+
+# ---------------- asyncio Transport ---------------- #
+#
+# AsyncDevice talks to one board from an asyncio event loop. Incoming bytes are
+# delivered by loop.add_reader() on the port's file descriptor (or by a blocking
+# reader thread where ports have no fd, e.g. Windows), never by sleep-polling.
+# Lines that arrive while a command is waiting and match its Request's accept
+# pattern (the same ones SerialWorker uses) form its reply; everything else is
+# unsolicited task output, available with `async for line in dev`.
+#
+# A command that is cancelled or times out mid-reply leaves the device
+# draining: the rest of the abandoned reply is discarded up to its <END> (or
+# an idle gap on firmware without one) before the next command is sent, so a
+# late tail never ends up in another command's reply.
+
+
+class AsyncDevice:
+    """ asyncio client for one RTOS board """
+
+    def __init__(self, ser, loop=None):
+        self.ser = ser
+        self.loop = loop or asyncio.get_running_loop()
+        self._buffer = b""
+        self._reply = None  # asyncio.Queue of the command waiting for its reply
+        self._accept = None  # Its Request's reply pattern
+        self._draining = False
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._drain_idle = 0.2
+        self._drain_timer = None
+        self._unsolicited = asyncio.Queue()
+        self._lock = asyncio.Lock()
+        self._closed = False
+        self._error = None  # Why the port was lost, if it was
+        self._reader_thread = None
+
+        try:
+            self.ser.timeout = 0  # Non-blocking reads, the loop tells us when data is ready
+            self.loop.add_reader(self.ser.fileno(), self._on_readable)
+        except (AttributeError, NotImplementedError, OSError, ValueError):
+            self.ser.timeout = 0.1
+            self._reader_thread = threading.Thread(target=self._read_thread, name="async-serial-reader", daemon=True)
+            self._reader_thread.start()
+
+    @classmethod
+    async def open(cls, port, baud_rate=rtos_client.DEFAULT_BAUD):
+        """ Open a port by device name or pyserial URL """
+        return cls(rtos_client.open_port(port, baud_rate, timeout=0))
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._reader_thread is None:
+            self.loop.remove_reader(self.ser.fileno())
+        else:
+            self._reader_thread.join(1)
+        self.ser.close()
+        self._unsolicited.put_nowait(None)  # Ends `async for`
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """ Next unsolicited line (task output) """
+        line = await self._unsolicited.get()
+        if line is None:
+            raise StopAsyncIteration
+        return line
+
+    # ---- incoming data ---- #
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except Exception as e:
+            self._lost(e)  # A dead fd stays readable: stop watching it rather than spin
+            return
+        if data:
+            self._feed(data)
+
+    def _read_thread(self):
+        while not self._closed:
+            try:
+                data = self.ser.read(1)
+                if data:
+                    data += self.ser.read(self.ser.in_waiting)
+            except Exception as e:
+                if not self._closed:
+                    self.loop.call_soon_threadsafe(self._lost, e)
+                return
+            if data:
+                self.loop.call_soon_threadsafe(self._feed, data)
+
+    def _lost(self, error):
+        """ The port failed: close the device, fail the waiting command and end `async for` """
+        if self._closed:
+            return
+        self._closed = True
+        self._error = error
+        if self._reader_thread is None:
+            self.loop.remove_reader(self.ser.fileno())
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+        self._end_drain()
+        if self._reply is not None:
+            self._reply.put_nowait(None)
+        self._unsolicited.put_nowait(None)
+
+    def _feed(self, data):
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        if self._draining:
+            self._restart_drain_timer()
+        for raw in lines:
+            line = raw.decode("utf-8", errors="ignore").strip()
+            if not line:
+                continue
+            if self._draining:
+                if line == END_MARKER:
+                    self._end_drain()
+                continue  # Tail of an abandoned reply
+            if line == END_MARKER:
+                if self._reply is not None:
+                    self._reply.put_nowait(line)
+                continue  # A stray <END> is the tail of a reply that already ended
+            if self._reply is not None and (self._accept is None or self._accept.search(line)):
+                self._reply.put_nowait(line)
+            else:
+                self._unsolicited.put_nowait(line)
+
+    def _start_drain(self, idle_timeout):
+        """ Discard what is left of an abandoned reply, up to its <END> or an idle gap """
+        self._draining = True
+        self._drained.clear()
+        self._drain_idle = idle_timeout
+        self._restart_drain_timer()
+
+    def _restart_drain_timer(self):
+        if self._drain_timer is not None:
+            self._drain_timer.cancel()
+        self._drain_timer = self.loop.call_later(self._drain_idle, self._end_drain, True)
+
+    def _end_drain(self, idle=False):
+        if self._drain_timer is not None:
+            self._drain_timer.cancel()
+            self._drain_timer = None
+        if idle:
+            self._buffer = b""  # An unterminated last line of the abandoned reply
+        self._draining = False
+        self._drained.set()
+
+    # ---- commands ---- #
+
+    async def request(self, payload, end_markers=(END_MARKER,), timeout=2, idle_timeout=0.2, max_lines=None,
+                      accept=None):
+        """ Send a command and await its reply lines.
+
+        Ends on an end marker, after max_lines lines, after an idle gap once the
+        reply started, or at the timeout deadline. With an accept pattern, lines
+        that don't match it go to the unsolicited output instead. Commands are
+        serialised per device; cancelling the awaiting task (or the timeout)
+        abandons the reply, and its remaining lines are discarded.
+        """
+        async with self._lock:
+            if self._closed:
+                raise RuntimeError(f"Device connection lost: {self._error}" if self._error else "Device is closed")
+            if self._draining:
+                try:
+                    await asyncio.wait_for(self._drained.wait(), timeout)
+                except asyncio.TimeoutError:
+                    self._end_drain(idle=True)  # Still streaming: give up on the old reply
+            self._reply = reply = asyncio.Queue()
+            self._accept = accept
+            response = []
+            sent = time.perf_counter()
+            first_line = None
+            timed_out = False
+            complete = False
+            try:
+                self.ser.write(payload)
+                deadline = time.monotonic() + timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        timed_out = True
+                        break
+                    wait = min(remaining, idle_timeout) if response else remaining
+                    try:
+                        line = await asyncio.wait_for(reply.get(), wait)
+                    except asyncio.TimeoutError:
+                        if response:
+                            complete = True
+                            break  # Idle gap after the reply started
+                        continue
+                    if line is None:
+                        raise RuntimeError(f"Device connection lost: {self._error}")
+                    if line == END_MARKER:
+                        if not response:
+                            continue  # Late terminator of the previous reply
+                        complete = True
+                        break
+                    if first_line is None:
+                        first_line = time.perf_counter()
+                    response.append(line)
+                    if line in end_markers or (max_lines and len(response) >= max_lines):
+                        complete = True
+                        break
+            except BaseException:
+                STATS.record(command_name(payload), sent, time.perf_counter(), first_line, len(payload), error=True)
+                raise
+            finally:
+                self._reply = None
+                self._accept = None
+                if not complete and not self._closed:
+                    self._start_drain(idle_timeout)
+            STATS.record(command_name(payload), sent, time.perf_counter(), first_line, len(payload),
+                         sum(len(line) + 1 for line in response), timeouts=int(timed_out))
+            return response
+
+    async def run(self, request, timeout=None):
+        """ Send a serial_worker.Request (e.g. from rtos_client's *_request() builders) and return its result """
+        timeout = request.timeout if timeout is None else timeout
+        lines = await self.request(request.payload, request.end_markers, timeout, request.idle_timeout,
+                                   request.max_lines, request.accept)
+        return request.result(lines)
+
+    async def list_tasks(self, timeout=2):
+        return await self.run(rtos_client.list_request(), timeout)
+
+    async def debug_dump(self, timeout=10):
+        return await self.run(rtos_client.debug_request(timeout))
+
+    async def info(self, task_id, timeout=2):
+        """ Parsed <INFO:x> fields (empty dict when the board is silent or the task doesn't exist) """
+        record = await self.run(rtos_client.info_request(task_id), timeout)
+        return record.as_dict() if record else {}
+
+    async def edit(self, task_id, task_type, priority, status, timeout=2):
+        return await self.run(rtos_client.edit_request(task_id, task_type, priority, status), timeout)
+
+    async def delete(self, task_id=None, timeout=2):
+        return await self.run(rtos_client.delete_request(task_id), timeout)
+
+    async def upload(self, image, header, timeout=2):
+        """ Send <TASK:header+image> (header from task_upload.build_task_header); RuntimeError unless stored """
+        if len(image) > MAX_TASK_SIZE:
+            raise ValueError(f"Binary exceeds {MAX_TASK_SIZE}-byte task limit.")
+        return await self.run(Request(b"<TASK:" + header + image + b">", rtos_client.STATUS_REPLY, idle_timeout=0.5,
+                                      parse=lambda lines: rtos_client.check_upload_reply(header[0], lines)), timeout)
+
+    async def upload_task(self, task_id, task_type, priority, image, status=1, timeout=2):
+        """ Build the TaskHeader and upload the image """
+        return await self.run(rtos_client.upload_request(task_id, task_type, priority, image, status), timeout)
@@ -0,0 +1,213 @@
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import command_stats
+import rtos_client
+import task_compress
+from rtos_emulator import EmulatedSerial, RTOSEmulator
+from rtos_parser import LineParser
+from serial_worker import SerialWorker
+
+# Protocol benchmarks against the emulated RTOS, so transport regressions show up
+# as numbers in CI without hardware:  python benchmark.py --baud 9600 --json
+
+
+def _summary(samples):
+    """ Median/p95/max of a list of seconds, in milliseconds """
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def _timed(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start_time)
+    return samples
+
+
+def bench_round_trips(baud_rate, iterations):
+    """ Round-trip latency of LIST, INFO and EDIT on a board holding one task """
+    ser = EmulatedSerial(baud_rate=baud_rate)
+    rtos_client.upload_task_image(ser, 1, 0, 1, bytes(64))
+    return {
+        "list": _summary(_timed(lambda: rtos_client.list_tasks(ser), iterations)),
+        "info": _summary(_timed(lambda: rtos_client.task_info(ser, 1), iterations)),
+        "edit": _summary(_timed(lambda: rtos_client.edit_task(ser, 1, 0, 2, 1), iterations)),
+    }
+
+
+def bench_upload(baud_rate, iterations, size=512):
+    """ Upload throughput in image bytes per second: plain, chunked, LZ-compressed, and plain
+    on a negotiated high-speed link (including the time to switch rates and back)
+    """
+    image = bytes(range(256)) * (size // 256) + bytes(size % 256)
+    results = {}
+    for name, framed, compress in (("plain", False, False), ("framed", True, False), ("compressed", False, True)):
+        ser = EmulatedSerial(baud_rate=baud_rate)
+        samples = _timed(lambda: rtos_client.upload_task_image(ser, 2, 0, 1, image, framed, compress=compress),
+                         iterations)
+        results[name] = dict(_summary(samples), bytes_per_second=size / statistics.median(samples))
+
+    ser = EmulatedSerial(baud_rate=baud_rate)
+    links = []
+    samples = _timed(lambda: links.append(rtos_client.run_fast(ser, rtos_client.upload_task_image,
+                                                               2, 0, 1, image)[1]), iterations)
+    results["negotiated"] = dict(_summary(samples), bytes_per_second=size / statistics.median(samples),
+                                 link_baud_rate=links[-1]["baud_rate"],
+                                 link_bytes_per_second=statistics.median(link["bytes_per_second"] for link in links))
+    return results
+
+
+def bench_ui_blocking(baud_rate, iterations, tick=0.01):
+    """ How long the calling (UI) thread is blocked while commands run on the worker.
+
+    Mimics the Tk loop: every `tick` seconds it queues work and runs finished
+    callbacks; the reported times are how long each tick took and how late it ran.
+    """
+    ser = EmulatedSerial(baud_rate=baud_rate)
+    worker = SerialWorker(ser).start()
+    done = []
+    tick_times = []
+    lateness = []
+    next_tick = time.perf_counter()
+    try:
+        while len(done) < iterations:
+            now = time.perf_counter()
+            lateness.append(max(0.0, now - next_tick))
+            if worker.pending() == 0:
+                worker.submit(rtos_client.list_tasks, callback=done.append)
+            worker.process_callbacks()
+            tick_times.append(time.perf_counter() - now)
+            next_tick += tick
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+    finally:
+        worker.stop()
+    return {"tick": _summary(tick_times), "lateness": _summary(lateness)}
+
+
+def bench_cpu(baud_rate, seconds=1.0):
+    """ CPU used by an idle connected worker and by back-to-back commands, as % of one core """
+    results = {}
+    ser = EmulatedSerial(baud_rate=baud_rate)
+    worker = SerialWorker(ser).start()
+    try:
+        cpu, wall = time.process_time(), time.perf_counter()
+        time.sleep(seconds)
+        results["idle_percent"] = 100 * (time.process_time() - cpu) / (time.perf_counter() - wall)
+
+        cpu, wall = time.process_time(), time.perf_counter()
+        while time.perf_counter() - wall < seconds:
+            worker.submit(rtos_client.list_tasks).result()
+        results["busy_percent"] = 100 * (time.process_time() - cpu) / (time.perf_counter() - wall)
+    finally:
+        worker.stop()
+    return results
+
+
+def bench_parser(seconds=0.5, chunk_size=64, baud_rate=1000000):
+    """ LineParser throughput on mixed LIST/INFO/DEBUG output, against what baud_rate can deliver """
+    emulator = RTOSEmulator()
+    for task_id in range(0, 10, 2):
+        emulator.store(bytes([task_id, 0, 1, 64, 0, 1, 0, 0, 0, 0]), bytes(64))
+    stream = b"".join(emulator.feed(command) for command in (b"<LIST>", b"<INFO:2>", b"<DEBUG>", b"<INFO:3>"))
+    chunks = [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+
+    parser = LineParser()
+    parsed = 0
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < seconds:
+        for chunk in chunks:
+            parser.feed(chunk)
+        parsed += len(stream)
+    elapsed = time.perf_counter() - start_time
+
+    # Byte-at-a-time feeding, as from an unbuffered read(1) loop
+    single = LineParser()
+    byte_start = time.perf_counter()
+    for index in range(len(stream)):
+        single.feed(stream[index:index + 1])
+    byte_elapsed = time.perf_counter() - byte_start
+
+    wire_bytes_per_second = baud_rate / 10
+    return {
+        "bytes_per_second": parsed / elapsed,
+        "lines_per_second": parser.lines / elapsed,
+        "single_byte_bytes_per_second": len(stream) / byte_elapsed,
+        "realtime_factor": parsed / elapsed / wire_bytes_per_second,
+        "single_byte_realtime_factor": len(stream) / byte_elapsed / wire_bytes_per_second,
+        "malformed": parser.malformed + single.malformed,
+    }
+
+
+def run_benchmarks(baud_rate=9600, iterations=20):
+    return {
+        "baud_rate": baud_rate,
+        "round_trip": bench_round_trips(baud_rate, iterations),
+        "upload": bench_upload(baud_rate, max(1, iterations // 4)),
+        "ui_blocking": bench_ui_blocking(baud_rate, iterations),
+        "cpu": bench_cpu(baud_rate),
+        "parser": bench_parser(),
+        "compression": task_compress.bench_corpus(task_compress.corpus(), baud_rate),
+    }
+
+
+def format_report(report):
+    lines = [f"Emulated RTOS @ {report['baud_rate']} baud"]
+    for name, stats in report["round_trip"].items():
+        lines.append(f"  {name.upper():<7} median {stats['median_ms']:8.1f} ms   p95 {stats['p95_ms']:8.1f} ms")
+    for name, stats in report["upload"].items():
+        link = f"   (link {stats['link_baud_rate']} baud)" if "link_baud_rate" in stats else ""
+        lines.append(f"  upload {name:<10} {stats['bytes_per_second']:8.0f} B/s   median {stats['median_ms']:.1f} ms{link}")
+    ui = report["ui_blocking"]
+    lines.append(f"  UI tick max {ui['tick']['max_ms']:.2f} ms, max lateness {ui['lateness']['max_ms']:.2f} ms")
+    lines.append(f"  CPU idle {report['cpu']['idle_percent']:.1f}%, busy {report['cpu']['busy_percent']:.1f}%")
+    parser = report["parser"]
+    lines.append(f"  parser {parser['bytes_per_second'] / 1e6:.1f} MB/s ({parser['realtime_factor']:.0f}x 1 Mbaud), "
+                 f"byte-at-a-time {parser['single_byte_realtime_factor']:.1f}x 1 Mbaud")
+    compression = report["compression"]
+    images = compression["images"].values()
+    lines.append(f"  task corpus ({len(images)} images) {sum(image['size'] for image in images)} B, "
+                 f"LZ {sum(image['compressed_size'] for image in images)} B, "
+                 f"wire {compression['raw_wire_seconds']:.2f}s -> {compression['wire_seconds']:.2f}s "
+                 f"({compression['speedup']:.2f}x)")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the serial protocol against the emulated RTOS")
+    parser.add_argument("-b", "--baud", type=int, action="append", help="baud rate (repeatable, default 9600)")
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    parser.add_argument("--json", nargs="?", const="-", help="write JSON to a file (or stdout with no value)")
+    parser.add_argument("--stats", metavar="FILE", help="also write per-command statistics (.prom or JSON)")
+    args = parser.parse_args(argv)
+
+    if args.stats:
+        command_stats.STATS.enabled = True
+    reports = [run_benchmarks(baud, args.iterations) for baud in (args.baud or [9600])]
+    if args.json:
+        text = json.dumps(reports, indent=2)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(args.json, "w") as file:
+                file.write(text)
+    if args.stats:
+        command_stats.STATS.export(args.stats)
+    if args.json != "-":
+        for report in reports:
+            print(format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
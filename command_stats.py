@@ -0,0 +1,196 @@
+import bisect
+import json
+import os
+import re
+import threading
+import time
+
+# ---------------- Command Statistics ---------------- #
+#
+# Per-command timing and traffic of every protocol operation: time from send to
+# the first reply byte and to completion (as histograms), bytes out / in,
+# retries, timeouts and errors. The transports (serial_worker, rtos_client,
+# async_transport) record into STATS; while it is disabled recording is one
+# attribute check. Snapshots go to the GUI stats panel, JSON, or a Prometheus
+# text file (node_exporter textfile collector format) for bench dashboards.
+
+# Histogram bucket upper bounds in seconds (Prometheus "le"); +Inf is implicit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+_COMMAND = re.compile(rb"<([A-Za-z]+)")
+
+
+def command_name(payload):
+    """ Command of a payload: b"<INFO:3>" -> "INFO", raw bytes -> "RAW" """
+    match = _COMMAND.match(payload)
+    return match.group(1).decode().upper() if match else "RAW"
+
+
+class Histogram:
+    """ Fixed-bucket histogram of seconds """
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """ Upper bound of the bucket holding the q-quantile (the max for the +Inf bucket) """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+            "buckets": dict(zip([str(bound) for bound in self.bounds] + ["+Inf"], self.counts)),
+        }
+
+
+class CommandStats:
+    """ Counters and latency histograms of one command """
+    __slots__ = ("count", "errors", "timeouts", "retries", "bytes_out", "bytes_in", "first_byte", "latency")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.first_byte = Histogram()
+        self.latency = Histogram()
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "first_byte": self.first_byte.as_dict(),
+            "latency": self.latency.as_dict(),
+        }
+
+
+class StatsRegistry:
+    """ Thread-safe {command: CommandStats}; record() is a no-op while disabled """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started = time.time()
+        self._commands = {}
+        self._lock = threading.Lock()
+
+    def record(self, command, sent, done, first_byte=None, bytes_out=0, bytes_in=0, retries=0, timeouts=0,
+               error=False):
+        """ One finished operation; sent / first_byte / done are time.perf_counter() values """
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._commands.get(command)
+            if stats is None:
+                stats = self._commands[command] = CommandStats()
+            stats.count += 1
+            stats.errors += bool(error)
+            stats.timeouts += timeouts
+            stats.retries += retries
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+            if first_byte is not None:
+                stats.first_byte.observe(first_byte - sent)
+            if not error:
+                stats.latency.observe(done - sent)
+
+    def reset(self):
+        with self._lock:
+            self._commands = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        """ {"started", "commands": {command: counters and histograms}} """
+        with self._lock:
+            return {"started": self.started,
+                    "commands": {name: stats.as_dict() for name, stats in sorted(self._commands.items())}}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix="rtos_command"):
+        """ Prometheus text exposition format """
+        commands = self.snapshot()["commands"]
+        lines = []
+        for metric, key, help_text in (("first_byte_seconds", "first_byte", "Time from send to the first reply byte"),
+                                       ("latency_seconds", "latency", "Time from send to the complete reply")):
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} histogram")
+            for name, stats in commands.items():
+                histogram = stats[key]
+                cumulative = 0
+                for bound, count in histogram["buckets"].items():
+                    cumulative += count
+                    lines.append(f'{prefix}_{metric}_bucket{{command="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_{metric}_sum{{command="{name}"}} {histogram["sum"]:.6f}')
+                lines.append(f'{prefix}_{metric}_count{{command="{name}"}} {histogram["count"]}')
+
+        for metric, key, help_text in (("total", "count", "Commands sent"),
+                                       ("errors_total", "errors", "Commands that failed"),
+                                       ("timeouts_total", "timeouts", "Replies that timed out"),
+                                       ("retries_total", "retries", "Retransmitted frames / retried commands")):
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for name, stats in commands.items():
+                lines.append(f'{prefix}_{metric}{{command="{name}"}} {stats[key]}')
+
+        lines.append(f"# HELP {prefix}_bytes_total Bytes on the wire")
+        lines.append(f"# TYPE {prefix}_bytes_total counter")
+        for name, stats in commands.items():
+            lines.append(f'{prefix}_bytes_total{{command="{name}",direction="out"}} {stats["bytes_out"]}')
+            lines.append(f'{prefix}_bytes_total{{command="{name}",direction="in"}} {stats["bytes_in"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """ Write JSON, or Prometheus text for a .prom path; replaced atomically for scrapers """
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+
+
+STATS = StatsRegistry(enabled=os.environ.get("RTOS_STATS", "") not in ("", "0"))
+
+
+def format_stats(snapshot):
+    """ One line per command for the GUI panel / CLI """
+    lines = [f"{'command':<18}{'count':>6}{'first p50':>11}{'p50':>9}{'p95':>9}{'max':>9}"
+             f"{'out':>9}{'in':>9}{'retry':>7}{'t/o':>5}{'err':>5}"]
+    for name, stats in snapshot["commands"].items():
+        first, latency = stats["first_byte"], stats["latency"]
+        lines.append(f"{name:<18}{stats['count']:>6}{first['p50'] * 1000:>9.1f}ms{latency['p50'] * 1000:>7.1f}ms"
+                     f"{latency['p95'] * 1000:>7.1f}ms{latency['max'] * 1000:>7.1f}ms"
+                     f"{stats['bytes_out']:>9}{stats['bytes_in']:>9}{stats['retries']:>7}{stats['timeouts']:>5}"
+                     f"{stats['errors']:>5}")
+    return "\n".join(lines)
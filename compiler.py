@@ -1,55 +1,180 @@
 import customtkinter as ctk
 import serial
-import serial.tools.list_ports
-import time
 from tkinter import filedialog, messagebox
-from task_compiler import compile_task_file
+from serial_worker import SerialWorker
+from task_upload import format_upload_stats, MAX_TASK_SIZE
+import rtos_client
+from log_sink import LogSink, history_path
+from task_table import TaskTable, format_task
+from rtos_parser import parse_lines, TaskRecord, Malformed
+from eeprom_map import decode_dump, format_diff
+import wire_capture
+import command_stats
+import task_watch
+from port_supervisor import ConnectionSupervisor, PortScanner
 import os
-import tkinter as tk
-from tkinter import filedialog, messagebox
 import datetime
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
+# GUI client: the protocol lives in rtos_client, this module only builds the window
+# and queues rtos_client commands on the SerialWorker.
 
 
 # ---------------- Serial Communication ---------------- #
 ser = None
-
-def list_ports():
-    """ List available serial ports """
-    return [port.device for port in serial.tools.list_ports.comports()]
+worker = None  # Background thread that owns `ser`; every command goes through it
+supervisor = None  # Reopens the board when the cable glitches or the USB-UART re-enumerates
+port_scanner = PortScanner()  # Cached port enumeration, also watched for hotplug
+AUTO_PORT = "Auto (find board)"
+task_table = TaskTable()  # Cached slot table that the status panel and edit dialog read
+refresh_pending = False
+last_eeprom = None  # Image from the previous <DEBUG>, later dumps only report what changed
+connect_pool = ThreadPoolExecutor(max_workers=1)  # Opens / baud-probes ports off the Tk thread
+build_pool = ThreadPoolExecutor(max_workers=1)  # Task builds and budget checks (avr-gcc, avr-objdump) off the Tk thread
+monitor_sink = None   # Buffered writers for the monitor / terminal widgets
+terminal_sink = None
+source_watcher = task_watch.SourceWatcher()  # Sources redeployed on save while "Watch task sources" is on
+deployed_images = {}  # Task ID -> digest of the image the watch last uploaded there
 
 def refresh_ports():
     """Refresh the available serial ports and update the dropdown menu."""
-    ports = list_ports()  # Get available ports
+    ports = sorted(port_scanner.scan(force=True))  # Get available ports
     if ports:
-        port_menu.configure(values=ports)
+        port_menu.configure(values=ports + [AUTO_PORT])
         port_var.set(ports[0])  # Set to first available port
     else:
-        port_menu.configure(values=["No Ports Found"])
+        port_menu.configure(values=["No Ports Found", AUTO_PORT])
         port_var.set("No Ports Found")
     log_terminal("Ports refreshed.")
 
+def watch_ports():
+    """ Every 2 s: update the port list when a USB-UART is plugged in or removed """
+    when_done(connect_pool.submit(port_scanner.changes), show_port_changes)
+    root.after(2000, watch_ports)
+
+def show_port_changes(future):
+    try:
+        added, removed = future.result()
+    except Exception:
+        return  # Enumeration not available on this host
+    if not added and not removed:
+        return
+    for port in added:
+        log_terminal(f"Port added: {port}")
+    for port in removed:
+        log_terminal(f"Port removed: {port}")
+    ports = sorted(port_scanner.scan())
+    port_menu.configure(values=(ports or ["No Ports Found"]) + [AUTO_PORT])
+    if port_var.get() not in ports and port_var.get() != AUTO_PORT:
+        port_var.set(ports[0] if ports else "No Ports Found")
+
 def connect_serial():
-    """ Connect to the selected serial port """
-    global ser
+    """ Connect to the selected serial port (probing the baud rate when set to Auto) """
     selected_port = port_var.get()
-    baud_rate = int(baud_var.get())
-
+    baud_rate = None if baud_var.get() == "Auto" else int(baud_var.get())
+
+    disconnect_serial()
+    if selected_port == AUTO_PORT:
+        log_terminal("Looking for an RTOS board on the USB-UART ports...")
+    elif baud_rate is None:
+        log_terminal(f"Detecting baud rate on {selected_port}...")
+    capture = wire_capture.capture_path() if capture_var.get() else None
+    if capture:
+        log_terminal(f"Capturing wire traffic to {capture}")
+    session = ConnectionSupervisor(None if selected_port == AUTO_PORT else selected_port, baud_rate, capture,
+                                   port_scanner, on_event=log_terminal)
+    future = connect_pool.submit(session.connect)
+    when_done(future, lambda future: start_session(session, future))
+
+def start_session(session, future):
+    """ Take over the port opened by connect_serial (runs on the Tk thread) """
+    global ser, worker, supervisor, last_eeprom
     try:
-        ser = serial.Serial(selected_port, baud_rate, timeout=1)
-        log_terminal(f"Connected to {selected_port}")
-    except serial.SerialException as e:
+        opened = future.result()
+    except (serial.SerialException, RuntimeError, ValueError) as e:
         log_terminal(str(e))
         messagebox.showerror("Connection Error", str(e))
-        ser = None
+        return
+
+    disconnect_serial()
+    ser = opened
+    supervisor = session
+    worker = SerialWorker(ser, on_line=handle_device_output, reconnect=supervisor.reconnect,
+                          on_state=on_link_state).start()
+    log_terminal(f"Connected to {supervisor.port} at {ser.baudrate} baud")
+    task_table.invalidate()  # A different board may be on the other end
+    last_eeprom = None
+    deployed_images.clear()  # The watch doesn't know what that board holds
+    refresh_task_table()
+
+def when_done(future, callback):
+    """ Call callback(future) on the Tk thread once a background future has finished """
+    if future.done():
+        callback(future)
+    else:
+        root.after(50, when_done, future, callback)
+
+def on_link_state(event, detail):
+    """ Port lost / reopened by the supervisor (runs on the Tk thread); queued commands carry on """
+    global ser, last_eeprom
+    if event == "lost":
+        log_terminal(f"Connection lost ({detail}), reconnecting...")
+    elif event == "reconnected":
+        ser = detail
+        last_eeprom = None
+        deployed_images.clear()  # May be another board (or a reset one) now
+        log_terminal(f"Connection restored on {supervisor.port}")
+        refresh_task_table()
+    else:
+        log_terminal(f"Reconnect failed: {detail}")
+        disconnect_serial()
+    task_table.invalidate()  # The board may have reset
 
 def disconnect_serial():
     """ Disconnect the serial port """
-    global ser
+    global ser, worker, supervisor
+    if supervisor:
+        supervisor.stop()  # End a reconnect in progress
+        supervisor = None
+    if worker:
+        worker.stop()
+        worker.process_callbacks()  # Flush results of commands that already finished
+        worker = None
     if ser:
         ser.close()
         log_terminal("Disconnected")
         ser = None
+    task_table.invalidate()
+
+def process_worker_results():
+    """ Hand finished serial commands back to the Tk thread """
+    if worker:
+        worker.process_callbacks()
+    root.after(50, process_worker_results)
+
+def handle_device_output(line):
+    """ Unsolicited task output: log it and watch for events that change the slot table """
+    log_message(line)
+    task_table.on_device_line(line)
+
+def refresh_task_table():
+    """ Re-read the slot table with one background <LIST> if it is stale """
+    global refresh_pending
+    if refresh_pending or not task_table.stale or not worker or not worker.connected or not ser or not ser.is_open:
+        return
+    refresh_pending = True
+    generation = task_table.generation
+    worker.request(rtos_client.list_request(), callback=lambda future: load_task_table(generation, future))
+
+def load_task_table(generation, future):
+    """ Store the reply to the background <LIST> (runs on the Tk thread) """
+    global refresh_pending
+    refresh_pending = False
+    try:
+        task_table.load_list(future.result(), generation)
+    except Exception as e:
+        log_terminal(f"Task table refresh failed: {str(e)}")
 
 def list_task():
     global ser
@@ -58,30 +183,27 @@ def list_task():
         messagebox.showwarning("Error", "Not connected to serial port!")
         return
 
-    try:
-        ser.reset_input_buffer()  # Clear old data
-        ser.write(b"<LIST>\n")  # Send <LIST> command
-        log_terminal("Sending <LIST> Command...")  
-
-        # time.sleep(0.5)  # Short delay for MCU response
+    log_terminal("Sending <LIST> Command...")
+    generation = task_table.generation
+    worker.request(rtos_client.list_request(), callback=lambda future: show_task_list(generation, future))
 
-        start_time = time.time()
-        timeout_seconds = 2
+def show_task_list(generation, future):
+    """ Display the reply to <LIST> (runs on the Tk thread) """
+    try:
+        lines = future.result()
+        task_table.load_list(lines, generation)
         response = []
         found_task = False  # Track if any task is found
 
-        while time.time() - start_time < timeout_seconds:
-            if ser.in_waiting:
-                line = ser.readline().decode('utf-8', errors='ignore').strip()
-                if line:
-                    if "Slot" in line or "T ID" in line:
-                        log_message(line)
-                        found_task = True
-                    elif line != "List of Tasks:" and line != "No stored tasks found.":
-                        response.append(line)
-            else:
-                time.sleep(0.1)  # Prevent CPU overuse
-        
+        for line, record in zip(lines, parse_lines(lines)):
+            if isinstance(record, TaskRecord) or "T ID" in line:
+                log_message(line)
+                found_task = True
+            elif isinstance(record, Malformed):
+                log_message(f"[malformed] {line}")
+            elif line != "List of Tasks:" and line != "No stored tasks found.":
+                response.append(line)
+
         # Show first received line normally in the terminal
         if response:
             log_terminal(f"{response[0]}")  # Show first valid response
@@ -100,43 +222,54 @@ def debug_task():
         messagebox.showwarning("Error", "Not connected to serial port!")
         return
 
+    log_terminal("Sending <DEBUG> Command...")  # Show sent command in monitor
+    if fast_var.get():
+        worker.submit(rtos_client.run_fast, rtos_client.debug_dump,
+                      callback=lambda future: show_fast_result(future, show_debug_dump))
+    else:
+        worker.request(rtos_client.debug_request(), callback=show_debug_dump)
+
+def show_fast_result(future, show):
+    """ Log the measured link throughput of a run_fast() command, then display its result with show """
+    result = Future()
     try:
-        log_terminal("Sending <DEBUG> Command...")  # Show sent command in monitor
-        ser.write(b"<DEBUG>\n")  # Send the <DEBUG> command
+        value, link = future.result()
+        log_terminal(rtos_client.format_link_stats(link))
+        result.set_result(value)
+    except Exception as e:
+        result.set_exception(e)
+    show(result)
 
-        time.sleep(0.5)  # Short delay for MCU response
-        
-        # Wait and read response from ATMega328P
-        response = []
-        start_time = time.time()
-        while time.time() - start_time < 2:
-            line = ser.readline().decode('utf-8', errors='ignore').strip()
-            if line:
-                response.append(line)
+def show_debug_dump(future):
+    """ Display the reply to <DEBUG> (runs on the Tk thread) """
+    global last_eeprom
+    try:
+        response = future.result()
+        if not response:
+            log_message("No debug information received.")
+            return
 
-        # Display everything (sent command + received response) in monitor
-        if response:
+        image = decode_dump(response)
+        if last_eeprom is None:
+            # First dump: everything (sent command + received response) in monitor
             log_message("\n".join(response))  # Debug info only in monitor
+            log_message(image.memory_map())
         else:
-            log_message("No debug information received.")
+            changes = format_diff(image, last_eeprom)
+            if changes:
+                log_message(f"EEPROM: {len(changes)} changes since the last dump")
+                log_message("\n".join(changes))
+                log_message(image.memory_map())
+            else:
+                log_message("EEPROM unchanged since the last dump.")
+        if image.malformed:
+            log_terminal(f"EEPROM dump: {len(image.malformed)} malformed lines")
+        last_eeprom = image
 
     except Exception as e:
         log_message(f"Error: {str(e)}")  # Now errors also go to monitor
 
 
-def read_serial():
-    """ Read incoming data """
-    global ser
-    if ser and ser.is_open:
-        try:
-            while ser.in_waiting:
-                data = ser.readline().decode('utf-8', errors='ignore').strip()
-                if data:
-                    log_message(data)
-        except Exception as e:
-            log_message(f"Error: {str(e)}")
-    root.after(100, read_serial)
-
 def send_task_file():
     """ Send a precompiled binary task file to the RTOS with a proper header. """
     global ser
@@ -148,23 +281,28 @@ def send_task_file():
     if not file_path:
         return
 
+    if not file_path.endswith((".c", ".bin")):
+        messagebox.showerror("Invalid file", "Please select a .c or .bin file.")
+        return
+
+    # Compiles a .c file to .bin first, on the build thread
+    if file_path.endswith(".c"):
+        log_terminal(f"Building {os.path.basename(file_path)}...")
+    when_done(build_pool.submit(rtos_client.load_task_image, file_path),
+              lambda future: open_task_popup(file_path, future))
+
+def open_task_popup(file_path, build):
+    """ Ask for the task parameters of a built image and upload it (runs on the Tk thread) """
     try:
-        if file_path.endswith(".c"):
-            # Compile the C file to .bin first
-            bin_path = compile_task_file(file_path)
-        elif file_path.endswith(".bin"):
-            bin_path = file_path
-        else:
-            messagebox.showerror("Invalid file", "Please select a .c or .bin file.")
-            return
+        binary_data = build.result()
     except Exception as e:
         messagebox.showerror("Error", str(e))
         return
-        
+
     # --- Popup: Ask for Task Parameters ---
     popup = ctk.CTkToplevel(root)
     popup.title("Task Configuration")
-    popup.geometry("300x300")
+    popup.geometry("300x370")
 
     popup.lift()                # Bring to front
     popup.focus_force()         # Force focus on the popup
@@ -183,90 +321,162 @@ def send_task_file():
     priority_entry = ctk.CTkEntry(popup)
     priority_entry.pack()
 
+    # Chunked mode: CRC16 per chunk with ACK/NAK and selective retransmit
+    framed_var = ctk.BooleanVar(value=False)
+    ctk.CTkCheckBox(popup, text="Chunked upload (CRC)", variable=framed_var).pack(pady=(10, 0))
+
+    # Compressed: LZ-packed payload when that is smaller (firmware needs the decoder, see task_compress)
+    compress_var = ctk.BooleanVar(value=False)
+    ctk.CTkCheckBox(popup, text="Compressed upload", variable=compress_var).pack(pady=(10, 0))
+
+    # Placed: link the source for a free flash region of this board (needs FlashAddress support)
+    place_var = ctk.BooleanVar(value=False)
+    if file_path.endswith(".c"):
+        ctk.CTkCheckBox(popup, text="Place in flash", variable=place_var).pack(pady=(10, 0))
+
     def submit_task_info():
         try:
             task_id = int(id_entry.get())
             task_type = int(type_entry.get())
             task_priority = int(priority_entry.get())
 
-            if not (0 <= task_id <= 9):
-                raise ValueError("Task ID must be between 0–9")
-
-            with open(bin_path, "rb") as file:
-                binary_data = file.read()
+            rtos_client.check_task_id(task_id)
 
             binary_size = len(binary_data)
-            if binary_size > 512:
+            if binary_size > MAX_TASK_SIZE:
                 messagebox.showwarning("Too Large", "Binary exceeds 512-byte task limit.")
                 popup.destroy()
                 return
 
-            status = 1  # Running
-            flash_address = (0).to_bytes(4, 'little')  # Not used yet
-
-            header = bytes([
-                task_id,
-                task_type,
-                task_priority,
-                binary_size & 0xFF,
-                (binary_size >> 8) & 0xFF,
-                status
-            ]) + flash_address # 6 + 4 = 10 bytes total
-
-            full_packet = b"<TASK:" + header + binary_data + b">"
-            
-            ser.reset_input_buffer()
-            ser.write(full_packet)
-            filename = os.path.basename(file_path)
-            log_terminal(f"Sent task '{filename}' with ID={task_id}, Type={task_type}, Size={binary_size}")
-            
-            time.sleep(0.5)  # Give MCU time to process and respond
-
-            response = []
-            start_time = time.time()
-            while time.time() - start_time < 2:
-                if ser.in_waiting:
-                    line = ser.readline().decode('utf-8', errors='ignore').strip()
-                    if line:
-                        response.append(line)
-                else:
-                    time.sleep(0.05)
-
-            if response:
-                for line in response:
-                    log_message(line)
-            
-            popup.destroy()
+            if file_path.endswith(".c") and not place_var.get():
+                # Stack / CPU budget of the chosen priority, checked on the build thread
+                # (the image itself comes from the cache)
+                send_btn.configure(state="disabled")
+                check = build_pool.submit(rtos_client.load_task_image, file_path, None, task_priority)
+                when_done(check, lambda future: send_if_in_budget(future, task_id, task_type, task_priority))
+                return
+            send_task(task_id, task_type, task_priority)
 
         except Exception as e:
             messagebox.showerror("Error", f"Invalid input or file\n{str(e)}")
             popup.destroy()
 
+    def send_if_in_budget(check, task_id, task_type, task_priority):
+        if not popup.winfo_exists():
+            return  # Closed while the check ran
+        try:
+            check.result()
+        except ValueError as e:
+            messagebox.showwarning("Over Budget", str(e))
+            send_btn.configure(state="normal")
+            return
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+            popup.destroy()
+            return
+        send_task(task_id, task_type, task_priority)
+
+    def send_task(task_id, task_type, task_priority):
+        try:
+            if place_var.get():
+                place_task(file_path, task_id, task_type, task_priority, framed_var.get(), compress_var.get())
+            elif fast_var.get():
+                # Negotiate a faster rate for the transfer, then drop back
+                show = show_upload_result if framed_var.get() else show_upload_response
+                worker.submit(rtos_client.run_fast, rtos_client.upload_task_image, task_id, task_type,
+                              task_priority, binary_data, framed_var.get(), compress=compress_var.get(),
+                              callback=lambda future: show_fast_result(future, show))
+            elif framed_var.get():
+                worker.submit(rtos_client.upload_task_image, task_id, task_type, task_priority, binary_data, True,
+                              compress=compress_var.get(), callback=show_upload_result)
+            else:
+                worker.request(rtos_client.upload_request(task_id, task_type, task_priority, binary_data,
+                                                          compress=compress_var.get()),
+                               callback=show_upload_response)
+            if file_path.endswith(".c"):
+                # Watch mode redeploys this source with the same parameters on every save
+                task_watch.remember(file_path, task_id, task_type, task_priority, framed_var.get(), place_var.get(),
+                                    compress=compress_var.get())
+                deployed_images.pop(task_id, None)
+                if watch_var.get():
+                    source_watcher.add(file_path)
+            filename = os.path.basename(file_path)
+            log_terminal(f"Sent task '{filename}' with ID={task_id}, Type={task_type}, Size={len(binary_data)}")
+
+        except Exception as e:
+            messagebox.showerror("Error", f"Invalid input or file\n{str(e)}")
+        popup.destroy()
+
     send_btn = ctk.CTkButton(popup, text="Send Task", command=submit_task_info)
     send_btn.pack(pady=20)
 
+def place_task(file_path, task_id, task_type, priority, framed, compress):
+    """ Upload a .c task linked for a free flash region: the board's <LIST> and the upload go through
+    the worker, the link runs on the build thread so queued commands aren't held up by avr-gcc
+    """
+    def build(listing):
+        try:
+            lines = listing.result()
+        except Exception as e:
+            log_terminal(f"Upload failed: {str(e)}")
+            return
+        when_done(build_pool.submit(rtos_client.build_placed_task, lines, file_path, task_id, None, priority), upload)
+
+    def upload(built):
+        try:
+            image, address = built.result()
+        except Exception as e:
+            log_terminal(f"Upload failed: {str(e)}")
+            return
+        if not worker:
+            log_terminal("Upload failed: not connected")
+            return
+        worker.submit(rtos_client.upload_placed_image, task_id, task_type, priority, image, address, framed,
+                      compress=compress, callback=show_placed_response)
+
+    worker.request(rtos_client.list_request(), callback=build)
+
+def show_upload_result(future):
+    """ Log the outcome of a chunked upload (runs on the Tk thread) """
+    task_table.apply_upload()
+    try:
+        log_terminal(format_upload_stats(future.result()))
+    except Exception as e:
+        log_terminal(f"Upload failed: {str(e)}")
+
+def show_upload_response(future):
+    task_table.apply_upload()
+    show_response(future)
+
+def show_placed_response(future):
+    """ Log where a placed task went and the board's reply """
+    task_table.apply_upload()
+    try:
+        result = future.result()
+    except Exception as e:
+        log_terminal(f"Upload failed: {str(e)}")
+        return
+    log_terminal(f"Placed {result['size']} bytes at 0x{result['flash_address']:04X}")
+    reply = result["reply"]
+    if isinstance(reply, dict):
+        log_terminal(format_upload_stats(reply))  # Chunked upload statistics
+    else:
+        for line in reply:
+            log_message(line)
+
 def clear_monitor():
     """Clear both the main monitor and the terminal monitor."""
-    monitor.configure(state="normal")  # Enable editing
-    monitor.delete("1.0", ctk.END)  # Clear content
-    monitor.configure(state="disabled")  # Disable editing again
-
-    terminal_monitor.configure(state="normal")  # Enable editing
-    terminal_monitor.delete("1.0", ctk.END)  # Clear content
-    terminal_monitor.configure(state="disabled")  # Disable editing again
+    monitor_sink.clear()
+    terminal_sink.clear()
 
 
 def log_message(msg):
-        monitor.configure(state="normal") 
-        monitor.insert(ctk.END, msg + "\n")
-        monitor.yview(ctk.END)
-        monitor.configure(state="disabled")  # Re-enable read-only
+    """ Queue a line for the monitor; it is rendered with the next batched flush """
+    monitor_sink.write(msg)
 
 def log_terminal(msg):
-        terminal_monitor.configure(state="normal")
-        terminal_monitor.insert(ctk.END, msg + "\n")
-        terminal_monitor.yview(ctk.END)
-        terminal_monitor.configure(state="disabled")  # Re-enable read-only
+    """ Queue a line for the terminal; it is rendered with the next batched flush """
+    terminal_sink.write(msg)
 
 def delete_task():
     """Popup to delete a task by ID and send a <DELETE:id> command to RTOS."""
@@ -291,31 +501,14 @@ def delete_task():
     def send_delete_command():
         try:
             task_id = int(id_entry.get())
-            if not (0 <= task_id <= 9):
-                raise ValueError("Task ID must be between 0–9.")
+            rtos_client.check_task_id(task_id)
 
             # Send the delete command
-            delete_cmd = f"<DELETE:{task_id}>".encode("utf-8")
-            ser.reset_input_buffer()
-            ser.write(delete_cmd)
+            worker.request(rtos_client.delete_request(task_id),
+                           callback=lambda future: show_delete_response(task_id, future))
 
             log_terminal(f"Sent delete request for Task ID={task_id}")
 
-            # Wait for response
-            response = []
-            start_time = time.time()
-            while time.time() - start_time < 2:
-                if ser.in_waiting:
-                    line = ser.readline().decode("utf-8", errors="ignore").strip()
-                    if line:
-                        response.append(line)
-                else:
-                    time.sleep(0.05)
-
-            if response:
-                for line in response:
-                    log_message(line)
-
             popup.destroy()
 
         except Exception as e:
@@ -325,6 +518,79 @@ def delete_task():
     delete_btn = ctk.CTkButton(popup, text="Delete Task", command=send_delete_command)
     delete_btn.pack(pady=20)
 
+def show_delete_response(task_id, future):
+    if not future.exception():
+        task_table.apply_delete(task_id, future.result())
+    show_response(future)
+
+def batch_edit_tasks():
+    """ Multi-select popup: delete / pause / run / re-prioritize the chosen tasks in one <BATCH> """
+    if not ser or not ser.is_open:
+        messagebox.showwarning("Error", "Not connected to serial port!")
+        return
+    tasks = task_table.tasks()
+    if not tasks:
+        refresh_task_table()
+        messagebox.showinfo("Batch Edit", "No tasks loaded yet, try again once the task list has been read.")
+        return
+
+    popup = ctk.CTkToplevel(root)
+    popup.title("Batch Edit")
+    popup.geometry(f"320x{200 + 30 * len(tasks)}")
+
+    popup.lift()
+    popup.focus_force()
+    popup.attributes('-topmost', True)
+    popup.after(100, lambda: popup.attributes('-topmost', False))
+
+    ctk.CTkLabel(popup, text="Select tasks:").pack(pady=(10, 5))
+    selected = {}
+    for task in tasks:
+        selected[task.id] = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(popup, text=format_task(task)[:40], variable=selected[task.id]).pack(anchor="w", padx=15)
+
+    priority_var = ctk.StringVar(value="1")
+
+    def send_batch(make_item):
+        chosen = [task for task in tasks if selected[task.id].get()]
+        if not chosen:
+            messagebox.showwarning("Batch Edit", "No task selected.")
+            return
+        items = [make_item(task) for task in chosen]
+        try:
+            rtos_client.batch_request(items)  # Validate before queueing
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        worker.submit(rtos_client.batch_tasks, items, callback=lambda future: show_batch_response(items, future))
+        log_terminal(f"Sent batch of {len(items)} items: {', '.join(f'{item[0]} {item[1]}' for item in items)}")
+        popup.destroy()
+
+    actions = ctk.CTkFrame(popup)
+    actions.pack(pady=10)
+    ctk.CTkButton(actions, text="Delete", width=90,
+                  command=lambda: send_batch(lambda task: ("delete", task.id))).grid(row=0, column=0, padx=5, pady=5)
+    ctk.CTkButton(actions, text="Pause", width=90,
+                  command=lambda: send_batch(lambda task: ("status", task.id, 0))).grid(row=0, column=1, padx=5, pady=5)
+    ctk.CTkButton(actions, text="Run", width=90,
+                  command=lambda: send_batch(lambda task: ("status", task.id, 1))).grid(row=0, column=2, padx=5, pady=5)
+    ctk.CTkOptionMenu(actions, variable=priority_var, values=["1", "2", "3"], width=90).grid(row=1, column=0, padx=5)
+    ctk.CTkButton(actions, text="Set Priority", width=190,
+                  command=lambda: send_batch(lambda task: ("edit", task.id, task.type, int(priority_var.get()),
+                                                           task.status))).grid(row=1, column=1, columnspan=2, padx=5)
+
+def show_batch_response(items, future):
+    """ Log the per-item results of a batch and apply them to the task table """
+    try:
+        result = future.result()
+    except Exception as e:
+        task_table.invalidate()
+        log_message(f"Error: {str(e)}")
+        return
+    task_table.apply_batch(items, result)
+    for line in rtos_client.format_batch_result(result):
+        log_message(line)
+
 def handle_terminal_input(event=None):
     command = terminal_entry.get().strip()
     terminal_entry.delete(0, "end")  # Clear entry after input
@@ -332,8 +598,7 @@ def handle_terminal_input(event=None):
     if not command:
         return
 
-    terminal_monitor.insert("end", f"> {command}\n")
-    terminal_monitor.see("end")
+    log_terminal(f"> {command}")
 
     cmd_upper = command.upper()
 
@@ -369,39 +634,19 @@ def edit_task():
     def fetch_task_info():
         try:
             task_id = int(id_entry.get())
-            if not (0 <= task_id <= 9):
-                raise ValueError("Task ID must be between 0–9")
-
-            # Send <INFO:task_id> to RTOS
-            ser.reset_input_buffer()
-            ser.write(f"<INFO:{task_id}>".encode("utf-8"))
-            time.sleep(0.5)
-
-            # Read response
-            response = []
-            start_time = time.time()
-            while time.time() - start_time < 2:
-                if ser.in_waiting:
-                    line = ser.readline().decode("utf-8", errors="ignore").strip()
-                    if line:
-                        response.append(line)
-                else:
-                    time.sleep(0.05)
-
-            if not response:
-                messagebox.showwarning("No Response", "No info received from RTOS.")
-                popup.destroy()
-                return
-
-            # Parse format like: ID=2 TYPE=1 PRIORITY=3 STATUS=1 SIZE=64
-            task_info = {}
-            for part in response[0].split():
-                 if "=" in part:
-                    key, value = part.split("=")
-                    task_info[key.lower()] = int(value)
+            rtos_client.check_task_id(task_id)
 
             popup.destroy()
-            open_edit_form(task_id, task_info)
+
+            # Open straight from the cached table; only ask the board when it is stale
+            task_info = task_table.get(task_id)
+            if task_info and not task_table.stale:
+                open_edit_form(task_id, task_info.copy())
+                return
+
+            # Send <INFO:task_id> to RTOS, the edit form opens once the reply arrives
+            worker.request(rtos_client.info_request(task_id),
+                           callback=lambda future: show_task_info(task_id, future))
 
         except Exception as e:
             messagebox.showerror("Error", f"Could not fetch task info\n{str(e)}")
@@ -410,11 +655,25 @@ def edit_task():
     confirm_btn = ctk.CTkButton(popup, text="Fetch Task", command=fetch_task_info)
     confirm_btn.pack(pady=20)
 
+def show_task_info(task_id, future):
+    """ Parse the reply to <INFO:x> and open the edit form (runs on the Tk thread) """
+    try:
+        task_info = future.result()
+        task_table.apply_info(task_id, task_info)
+        if not task_info:
+            messagebox.showwarning("No Response", "No info received from RTOS.")
+            return
+
+        open_edit_form(task_id, task_info)
+
+    except Exception as e:
+        messagebox.showerror("Error", f"Could not fetch task info\n{str(e)}")
+
 
 def open_edit_form(task_id, task_info):
     popup = ctk.CTkToplevel(root)
     popup.title("Edit Task Metadata")
-    popup.geometry("300x300")
+    popup.geometry("300x330")
 
     popup.lift()
     popup.focus_force()
@@ -447,37 +706,15 @@ def open_edit_form(task_id, task_info):
             task_priority = int(priority_entry.get())
             task_status = int(status_entry.get())
 
-            if not (0 <= task_type <= 5):  # adjust range if needed
-                raise ValueError("Invalid Task Type")
-            if not (1 <= task_priority <= 3):
-                raise ValueError("Priority must be 1–3")
-            if task_status not in [0, 1]:
-                raise ValueError("Status must be 0 or 1")
+            rtos_client.check_task_fields(task_type, task_priority, task_status)
 
             # Send command to update metadata: <EDIT:id,type,priority,status>
-            cmd = f"<EDIT:{task_id},{task_type},{task_priority},{task_status}>"
-            ser.reset_input_buffer()
-            ser.write(cmd.encode("utf-8"))
+            worker.request(rtos_client.edit_request(task_id, task_type, task_priority, task_status),
+                           callback=lambda future: show_edit_response(task_id, task_type, task_priority,
+                                                                      task_status, future))
 
             log_terminal(f"Sent Edit Command for Task ID={task_id}")
 
-            # Wait for RTOS response
-            response = []
-            start_time = time.time()
-            while time.time() - start_time < 2:
-                if ser.in_waiting:
-                    line = ser.readline().decode("utf-8", errors="ignore").strip()
-                    if line:
-                        response.append(line)
-                else:
-                    time.sleep(0.05)
-
-            if response:
-                for line in response:
-                    log_message(line)
-            else:
-                log_message("No response after edit.")
-
             popup.destroy()
 
         except Exception as e:
@@ -487,179 +724,287 @@ def open_edit_form(task_id, task_info):
     send_btn = ctk.CTkButton(popup, text="Submit Edit", command=submit_edit)
     send_btn.pack(pady=20)
 
+def show_edit_response(task_id, task_type, priority, status, future):
+    if not future.exception():
+        task_table.apply_edit(task_id, task_type, priority, status, future.result())
+    show_response(future, "No response after edit.")
 
-   
-    def submit_edit():
-        try:
-            task_type = int(type_entry.get())
-            task_priority = int(priority_entry.get())
-            task_status = int(status_entry.get())
+def show_response(future, empty_message=None):
+    """ Log the reply lines of a finished command to the monitor (runs on the Tk thread) """
+    try:
+        response = future.result()
+    except Exception as e:
+        log_message(f"Error: {str(e)}")
+        return
 
-            if not (0 <= task_type <= 5):
-                raise ValueError("Invalid Task Type")
-            if not (1 <= task_priority <= 3):
-                raise ValueError("Priority must be 1–3")
-            if task_status not in [0, 1]:
-                raise ValueError("Status must be 0 or 1")
-
-            # Build and send metadata update command
-            cmd = f"<EDIT:{task_id},{task_type},{task_priority},{task_status}>"
-            ser.reset_input_buffer()
-            ser.write(cmd.encode("utf-8"))
-
-            log_terminal(f"Sent metadata edit for Task ID={task_id}")
-
-            # Wait for RTOS response
-            response = []
-            start_time = time.time()
-            while time.time() - start_time < 2:
-                if ser.in_waiting:
-                    line = ser.readline().decode("utf-8", errors="ignore").strip()
-                    if line:
-                        response.append(line)
-                else:
-                    time.sleep(0.05)
-
-            if response:
-                for line in response:
-                    log_message(line)
-            else:
-                log_message("No response after edit.")
+    if response:
+        for line in response:
+            log_message(line)
+    elif empty_message:
+        log_message(empty_message)
 
-            popup.destroy()
+def open_stats_panel():
+    """ Per-command latency / traffic statistics, refreshed every second """
+    if not command_stats.STATS.enabled:
+        command_stats.STATS.enabled = True  # Recording is off until someone looks
+        log_terminal("Recording command statistics")
+
+    popup = ctk.CTkToplevel(root)
+    popup.title("Command Statistics")
+    popup.geometry("860x320")
+
+    text = ctk.CTkTextbox(popup, wrap="none", font=("Courier", 12))
+    text.pack(fill="both", expand=True, padx=5, pady=5)
 
+    def refresh():
+        if not popup.winfo_exists():
+            return
+        text.configure(state="normal")
+        text.delete("1.0", ctk.END)
+        text.insert(ctk.END, command_stats.format_stats(command_stats.STATS.snapshot()))
+        text.configure(state="disabled")
+        popup.after(1000, refresh)
+
+    def export(extension):
+        path = filedialog.asksaveasfilename(parent=popup, defaultextension=extension,
+                                            filetypes=[("Statistics", f"*{extension}")])
+        if path:
+            command_stats.STATS.export(path)
+            log_terminal(f"Statistics written to {path}")
+
+    buttons = ctk.CTkFrame(popup)
+    buttons.pack(pady=(0, 5))
+    ctk.CTkButton(buttons, text="Reset", command=command_stats.STATS.reset).grid(row=0, column=0, padx=5)
+    ctk.CTkButton(buttons, text="Export JSON", command=lambda: export(".json")).grid(row=0, column=1, padx=5)
+    ctk.CTkButton(buttons, text="Export Prometheus", command=lambda: export(".prom")).grid(row=0, column=2, padx=5)
+    refresh()
+
+def toggle_watch():
+    """ Start / stop redeploying the remembered task sources when they are saved """
+    if watch_var.get():
+        for path in task_watch.load_targets():
+            source_watcher.add(path)
+        log_terminal(f"Watching {len(source_watcher.sources)} task sources")
+    else:
+        for path in source_watcher.sources:
+            source_watcher.remove(path)
+        log_terminal("Stopped watching task sources")
+
+def poll_watched_sources():
+    """ Queue a rebuild + upload for each source whose change has settled """
+    if watch_var.get() and worker:
+        targets = task_watch.load_targets()
+        for path in source_watcher.poll():
+            target = targets.get(path)
+            if target:
+                redeploy_source(target)
+    root.after(int(task_watch.POLL_SECONDS * 1000), poll_watched_sources)
+
+def redeploy_source(target):
+    """ Rebuild a watched source on the build thread and upload it through the worker
+    (placed targets first read the board's regions with <LIST>)
+    """
+    started = time.perf_counter()
+
+    def build(listing=None):
+        try:
+            lines = listing.result() if listing else None
         except Exception as e:
-            messagebox.showerror("Error", f"Edit failed\n{str(e)}")
-            popup.destroy()
+            log_terminal(f"Watch: {str(e)}")
+            return
+        when_done(build_pool.submit(task_watch.build_image, target, lines), upload)
+
+    def upload(built):
+        try:
+            image, address = built.result()
+        except Exception as e:
+            log_terminal(f"Watch: {os.path.basename(target['path'])}: {str(e)}")
+            return
+        if worker:
+            worker.submit(task_watch.deploy, target, image, address, deployed_images, started,
+                          callback=show_redeploy_result)
+
+    if target.get("place"):
+        worker.request(rtos_client.list_request(), callback=build)
+    else:
+        build()
+
+def show_redeploy_result(future):
+    try:
+        result = future.result()
+    except Exception as e:
+        log_terminal(f"Watch: {str(e)}")
+        return
+    if not result["skipped"]:
+        task_table.apply_upload()
+    log_terminal(f"Watch: {task_watch.format_redeploy(result)}")  # Failed uploads are retried on the next save
 
 def update_running_task_status():
-    global ser
+    """ Periodic check: refresh the table if something invalidated it, then redraw """
+    refresh_task_table()
+    show_running_task_status(task_table)
+
+    # Schedule the next refresh
+    root.after(15000, update_running_task_status)
 
+def show_running_task_status(table):
+    """ Fill the status panel from the cached task table (no serial traffic) """
     status_terminal.configure(state="normal")
     status_terminal.delete("1.0", ctk.END)  # Clear previous status
 
     now = datetime.datetime.now().strftime("[%H:%M:%S]")
 
-    if not ser or not ser.is_open:
+    if worker and not worker.connected:
+        status_terminal.insert(ctk.END, f"{now} Connection lost, reconnecting...\n", "blue")
+    elif not ser or not ser.is_open or not worker:
         status_terminal.insert(ctk.END, f"{now} Not connected to serial port.\n", "blue")
+    elif table.loaded_at is None:
+        status_terminal.insert(ctk.END, f"{now} Reading task table...\n", "blue")
     else:
-        try:
-            ser.reset_input_buffer()
-            ser.write(b"<LIST>\n")
-
-            start_time = time.time()
-            timeout = 2
-            running_tasks = []
-
-            while time.time() - start_time < timeout:
-                if ser.in_waiting:
-                    line = ser.readline().decode("utf-8", errors="ignore").strip()
-                    if line and ("STATUS=1" in line or "Status: 01" in line):
-                        running_tasks.append(line)
-                else:
-                    time.sleep(0.05)
-
-            if running_tasks:
-                status_terminal.insert(ctk.END, f"{now} Running Tasks:\n", "blue")
-                for task in running_tasks:
-                    status_terminal.insert(ctk.END, f"{task}\n", "blue")
-            else:
-                status_terminal.insert(ctk.END, f"{now} No task running\n", "blue")
-
-        except Exception as e:
-            status_terminal.insert(ctk.END, f"{now} Status update error: {str(e)}\n", "blue")
+        running_tasks = table.running()
+        if running_tasks:
+            status_terminal.insert(ctk.END, f"{now} Running Tasks:\n", "blue")
+            for task in running_tasks:
+                status_terminal.insert(ctk.END, f"{format_task(task)}\n", "blue")
+        else:
+            status_terminal.insert(ctk.END, f"{now} No task running\n", "blue")
 
     status_terminal.configure(state="disabled")
 
-    # Schedule the next refresh
-    root.after(15000, update_running_task_status)
+def on_task_table_changed(table):
+    """ Redraw the status panel and re-read the table in the background once invalidated """
+    if table.stale:
+        refresh_task_table()
+    show_running_task_status(table)
 
 
 # ---------------- GUI Setup ---------------- #
-ctk.set_appearance_mode("system")
-ctk.set_default_color_theme("dark-blue")
+def main():
+    global root, port_var, port_menu, baud_var, fast_var, capture_var, status_terminal, monitor, terminal_monitor, terminal_entry
+    global monitor_sink, terminal_sink, watch_var
+
+    ctk.set_appearance_mode("system")
+    ctk.set_default_color_theme("dark-blue")
+
+    root = ctk.CTk()
+    root.title("ATMega328P Serial Monitor & Task Sender")
+
+    # Port Selection Frame (row 0 only)
+    port_frame = ctk.CTkFrame(root)
+    port_frame.grid(row=0, column=0, columnspan=7, padx=5, pady=5, sticky="ew")
+
+    ports = sorted(port_scanner.scan())  # Enumerate once at startup
+    port_var = ctk.StringVar(value=ports[0] if ports else AUTO_PORT)
+    port_label = ctk.CTkLabel(port_frame, text="Port:")
+    port_label.grid(row=0, column=0, padx=5, pady=5)
+
+    port_menu = ctk.CTkOptionMenu(port_frame, variable=port_var, values=ports + [AUTO_PORT])
+    port_menu.grid(row=0, column=1, padx=5, pady=5)
+
+    refresh_btn = ctk.CTkButton(port_frame, text="⟳", width=40, command=refresh_ports)
+    refresh_btn.grid(row=0, column=2, padx=5, pady=5)
+
+    baud_var = ctk.StringVar(value="Auto")  # Probe the board's rate on connect
+    baud_label = ctk.CTkLabel(port_frame, text="Baud:")
+    baud_label.grid(row=0, column=3, padx=5, pady=5)
+
+    baud_menu = ctk.CTkOptionMenu(port_frame, variable=baud_var, values=["Auto", "9600", "115200", "57600", "4800", "1200"])
+    baud_menu.grid(row=0, column=4, padx=5, pady=5)
+
+    connect_btn = ctk.CTkButton(port_frame, text="Connect", command=connect_serial)
+    connect_btn.grid(row=0, column=5, padx=5, pady=5)
+
+    disconnect_btn = ctk.CTkButton(port_frame, text="Disconnect", command=disconnect_serial)
+    disconnect_btn.grid(row=0, column=6, padx=5, pady=5)
 
-root = ctk.CTk()
-root.title("ATMega328P Serial Monitor & Task Sender")
+    # Status Terminal (row 1)
+    status_terminal = ctk.CTkTextbox(port_frame, height=100, wrap="word", state="disabled")
+    status_terminal.grid(row=1, column=0, columnspan=7, padx=5, pady=(0, 5), sticky="ew")
+    status_terminal.tag_config("blue", foreground="skyblue")
 
-# Port Selection Frame (row 0 only)
-port_frame = ctk.CTkFrame(root)
-port_frame.grid(row=0, column=0, columnspan=7, padx=5, pady=5, sticky="ew")
+    # Serial Monitor (Auto Resize)
+    monitor = ctk.CTkTextbox(root, height=250, wrap="word", state="disabled")
+    monitor.grid(row=1, column=0, columnspan=7, padx=5, pady=5, sticky="nsew")
 
-port_var = ctk.StringVar(value=list_ports()[0] if list_ports() else "No Ports Found")
-port_label = ctk.CTkLabel(port_frame, text="Port:")
-port_label.grid(row=0, column=0, padx=5, pady=5)
+    # Row 2 Frames: Terminal and Button Section (Equal Size)
+    row2_frame = ctk.CTkFrame(root)
+    row2_frame.grid(row=2, column=0, columnspan=7, padx=5, pady=5, sticky="nsew")
+    row2_frame.grid_columnconfigure(0, weight=1)  
 
-port_menu = ctk.CTkOptionMenu(port_frame, variable=port_var, values=list_ports())
-port_menu.grid(row=0, column=1, padx=5, pady=5)
+    # Terminal Frame
+    terminal_frame = ctk.CTkFrame(row2_frame,)
+    terminal_frame.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
+    terminal_frame.grid_rowconfigure(0, weight=1)  # Make terminal expand fully
+    terminal_frame.grid_columnconfigure(0, weight=1)
 
-refresh_btn = ctk.CTkButton(port_frame, text="⟳", width=40, command=refresh_ports)
-refresh_btn.grid(row=0, column=2, padx=5, pady=5)
+    # Terminal Monitor
+    terminal_monitor = ctk.CTkTextbox(terminal_frame, wrap="word", height=150, state="disabled")
+    terminal_monitor.grid(row=0, column=0, padx=5, pady=(5, 0), sticky="nsew")
 
-baud_var = ctk.StringVar(value="9600")
-baud_label = ctk.CTkLabel(port_frame, text="Baud:")
-baud_label.grid(row=0, column=3, padx=5, pady=5)
+    # Both logs keep only the newest lines on screen, the full session goes to a file
+    monitor_sink = LogSink(monitor, max_lines=2000, history_path=history_path("monitor"))
+    terminal_sink = LogSink(terminal_monitor, max_lines=500, history_path=history_path("terminal"))
 
-baud_menu = ctk.CTkOptionMenu(port_frame, variable=baud_var, values=["9600", "115200", "57600", "4800", "1200"])
-baud_menu.grid(row=0, column=4, padx=5, pady=5)
 
-connect_btn = ctk.CTkButton(port_frame, text="Connect", command=connect_serial)
-connect_btn.grid(row=0, column=5, padx=5, pady=5)
+    # Terminal Input Entry
+    terminal_entry = ctk.CTkEntry(terminal_frame)
+    terminal_entry.grid(row=1, column=0, padx=5, pady=(2, 5), sticky="ew")
+    terminal_entry.bind("<Return>", handle_terminal_input)
 
-disconnect_btn = ctk.CTkButton(port_frame, text="Disconnect", command=disconnect_serial)
-disconnect_btn.grid(row=0, column=6, padx=5, pady=5)
 
-# Status Terminal (row 1)
-status_terminal = ctk.CTkTextbox(port_frame, height=100, wrap="word", state="disabled")
-status_terminal.grid(row=1, column=0, columnspan=7, padx=5, pady=(0, 5), sticky="ew")
-status_terminal.tag_config("blue", foreground="skyblue")
 
-# Serial Monitor (Auto Resize)
-monitor = ctk.CTkTextbox(root, height=250, wrap="word", state="disabled")
-monitor.grid(row=1, column=0, columnspan=7, padx=5, pady=5, sticky="nsew")
+    # Button Frame
+    button_frame = ctk.CTkFrame(row2_frame)
+    button_frame.grid(row=0, column=1, padx=5, pady=5, sticky="n")
 
-# Row 2 Frames: Terminal and Button Section (Equal Size)
-row2_frame = ctk.CTkFrame(root)
-row2_frame.grid(row=2, column=0, columnspan=7, padx=5, pady=5, sticky="nsew")
-row2_frame.grid_columnconfigure(0, weight=1)  
+    list_btn = ctk.CTkButton(button_frame, text="List Task", command=list_task)
+    list_btn.grid(row=0, column=0, padx=5, pady=5)
 
-# Terminal Frame
-terminal_frame = ctk.CTkFrame(row2_frame,)
-terminal_frame.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
-terminal_frame.grid_rowconfigure(0, weight=1)  # Make terminal expand fully
-terminal_frame.grid_columnconfigure(0, weight=1)
+    task_btn = ctk.CTkButton(button_frame, text="Sent Task", command=send_task_file)
+    task_btn.grid(row=2, column=0, padx=5, pady=5)
 
-# Terminal Monitor
-terminal_monitor = ctk.CTkTextbox(terminal_frame, wrap="word", height=150)
-terminal_monitor.grid(row=0, column=0, padx=5, pady=(5, 0), sticky="nsew")
+    delete_btn = ctk.CTkButton(button_frame, text="Delete Task", command=delete_task)
+    delete_btn.grid(row=3, column=0, padx=5, pady=5)
 
+    clear_btn = ctk.CTkButton(button_frame, text="Clear Monitor", command=clear_monitor)
+    clear_btn.grid(row=4, column=0, padx=5, pady=5)
 
-# Terminal Input Entry
-terminal_entry = ctk.CTkEntry(terminal_frame)
-terminal_entry.grid(row=1, column=0, padx=5, pady=(2, 5), sticky="ew")
-terminal_entry.bind("<Return>", handle_terminal_input)
+    edit_btn = ctk.CTkButton(button_frame, text="Edit Task",command=edit_task )
+    edit_btn.grid(row=1, column=0, padx=5, pady=5)
 
+    # Uploads and DEBUG dumps negotiate the fastest rate the board supports, then drop back
+    fast_var = ctk.BooleanVar(value=False)
+    fast_check = ctk.CTkCheckBox(button_frame, text="Fast bulk transfers", variable=fast_var)
+    fast_check.grid(row=5, column=0, padx=5, pady=5)
 
+    # Records every byte of the next connection (timestamped) for offline replay
+    capture_var = ctk.BooleanVar(value=False)
+    capture_check = ctk.CTkCheckBox(button_frame, text="Capture wire traffic", variable=capture_var)
+    capture_check.grid(row=6, column=0, padx=5, pady=5)
 
-# Button Frame
-button_frame = ctk.CTkFrame(row2_frame)
-button_frame.grid(row=0, column=1, padx=5, pady=5, sticky="n")
+    batch_btn = ctk.CTkButton(button_frame, text="Batch Edit", command=batch_edit_tasks)
+    batch_btn.grid(row=9, column=0, padx=5, pady=5)
 
-list_btn = ctk.CTkButton(button_frame, text="List Task", command=list_task)
-list_btn.grid(row=0, column=0, padx=5, pady=5)
+    stats_btn = ctk.CTkButton(button_frame, text="Statistics", command=open_stats_panel)
+    stats_btn.grid(row=7, column=0, padx=5, pady=5)
 
-task_btn = ctk.CTkButton(button_frame, text="Sent Task", command=send_task_file)
-task_btn.grid(row=2, column=0, padx=5, pady=5)
+    # Recompiles uploaded .c tasks on save and pushes them to the same slot
+    watch_var = ctk.BooleanVar(value=False)
+    watch_check = ctk.CTkCheckBox(button_frame, text="Watch task sources", variable=watch_var, command=toggle_watch)
+    watch_check.grid(row=8, column=0, padx=5, pady=5)
 
-delete_btn = ctk.CTkButton(button_frame, text="Delete Task", command=delete_task)
-delete_btn.grid(row=3, column=0, padx=5, pady=5)
+    monitor_sink.start(root)
+    terminal_sink.start(root)
+    task_table.subscribe(on_task_table_changed)
+    process_worker_results()
+    update_running_task_status()
+    poll_watched_sources()
+    watch_ports()
+    root.mainloop()
 
-clear_btn = ctk.CTkButton(button_frame, text="Clear Monitor", command=clear_monitor)
-clear_btn.grid(row=4, column=0, padx=5, pady=5)
+    monitor_sink.close()
+    terminal_sink.close()
 
-edit_btn = ctk.CTkButton(button_frame, text="Edit Task",command=edit_task )
-edit_btn.grid(row=1, column=0, padx=5, pady=5)
 
-read_serial()
-update_running_task_status()
-root.mainloop()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import sys
+
+from rtos_parser import parse_line, DumpRow, Malformed, TaskRecord
+from task_upload import TASK_HEADER_SIZE
+
+# ---------------- EEPROM Image & Memory Map ---------------- #
+#
+# Decodes <DEBUG> dumps ("0040: FF FF 00 ...") into an EEPROM image with the
+# TaskHeader table overlaid, diffs successive dumps down to the changed byte
+# ranges, and draws a compact memory map (slot occupancy, free space,
+# fragmentation). Dumps saved from the monitor can be compared offline:
+#   python eeprom_map.py before.txt after.txt ...
+
+EEPROM_SIZE = 1024         # ATMega328P
+TASK_SLOTS = 10
+HEADER_TABLE = TASK_SLOTS * TASK_HEADER_SIZE  # TaskHeader table at address 0
+ERASED = 0xFF              # Value of an erased / never written EEPROM byte
+ROW_SIZE = 16              # Bytes per <DEBUG> row
+
+
+def decode_header(raw, slot=None):
+    """ TaskRecord from a 10-byte TaskHeader, or None for an empty slot """
+    if raw[0] == ERASED:
+        return None
+    return TaskRecord(raw[0], raw[1], raw[2], raw[3] | (raw[4] << 8), raw[5],
+                      int.from_bytes(raw[6:10], "little"), slot)
+
+
+class EepromImage:
+    """ EEPROM contents rebuilt from a dump.
+
+    data is the image (unknown bytes read as ERASED); known marks which
+    addresses the dump actually covered, so a truncated dump isn't mistaken
+    for erased memory. malformed holds the dump lines that didn't parse.
+    """
+
+    def __init__(self, size=EEPROM_SIZE):
+        self.data = bytearray([ERASED]) * size
+        self.known = bytearray(size)
+        self.malformed = []
+
+    @property
+    def view(self):
+        return memoryview(self.data)
+
+    @property
+    def complete(self):
+        return self.known.count(0) == 0
+
+    def headers(self):
+        """ Decoded TaskHeader table: one TaskRecord or None per slot """
+        return [decode_header(self.data[slot * TASK_HEADER_SIZE:(slot + 1) * TASK_HEADER_SIZE], slot)
+                for slot in range(TASK_SLOTS)]
+
+    def region(self, address):
+        """ Human name of an address: slot header field or data area """
+        if address < HEADER_TABLE:
+            return f"slot {address // TASK_HEADER_SIZE} header"
+        return "data"
+
+    def diff(self, other):
+        """ (start, end) byte ranges that differ from an older image, end exclusive.
+
+        Addresses missing from either dump are not compared.
+        """
+        old, new = memoryview(other.data), memoryview(self.data)
+        if old == new:
+            return []
+
+        ranges = []
+        start = None
+        size = min(len(old), len(new))
+        for row in range(0, size, ROW_SIZE):
+            end = min(row + ROW_SIZE, size)
+            if old[row:end] == new[row:end]:
+                if start is not None:
+                    ranges.append((start, row))
+                    start = None
+                continue
+            for address in range(row, end):  # Refine the changed row byte by byte
+                if old[address] != new[address] and self.known[address] and other.known[address]:
+                    if start is None:
+                        start = address
+                elif start is not None:
+                    ranges.append((start, address))
+                    start = None
+        if start is not None:
+            ranges.append((start, size))
+        return ranges
+
+    def changed_slots(self, other):
+        """ Slots whose TaskHeader differs from an older image """
+        return [slot for slot, (new, old) in enumerate(zip(self.headers(), other.headers())) if new != old]
+
+    def free_runs(self):
+        """ (start, length) runs of erased bytes in the data area """
+        runs = []
+        start = None
+        for address in range(HEADER_TABLE, len(self.data)):
+            if self.data[address] == ERASED and self.known[address]:
+                if start is None:
+                    start = address
+            elif start is not None:
+                runs.append((start, address - start))
+                start = None
+        if start is not None:
+            runs.append((start, len(self.data) - start))
+        return runs
+
+    def usage(self):
+        """ Slot occupancy and data-area fragmentation figures """
+        runs = self.free_runs()
+        free = sum(length for _, length in runs)
+        largest = max((length for _, length in runs), default=0)
+        return {
+            "slots_used": sum(1 for header in self.headers() if header),
+            "slots": TASK_SLOTS,
+            "data_free": free,
+            "data_size": len(self.data) - HEADER_TABLE,
+            "free_runs": len(runs),
+            "largest_free_run": largest,
+            "fragmentation": 1 - largest / free if free else 0.0,
+            "unknown": self.known.count(0),
+        }
+
+    def memory_map(self, row_size=ROW_SIZE, width=32):
+        """ One character per row_size bytes: H used header, h empty header,
+        '.' erased, '#' written, '+' partly written, '?' not in the dump
+        """
+        chars = []
+        for address in range(0, len(self.data), row_size):
+            end = min(address + row_size, len(self.data))
+            if self.known[address:end].count(0):
+                chars.append("?")
+            elif end <= HEADER_TABLE or address < HEADER_TABLE:
+                chars.append(self._header_char(address, end))
+            else:
+                erased = self.data[address:end].count(ERASED)
+                chars.append("." if erased == end - address else "#" if erased == 0 else "+")
+
+        lines = []
+        for index in range(0, len(chars), width):
+            lines.append(f"{index * row_size:04X}: " + "".join(chars[index:index + width]))
+
+        slots = " ".join(f"{header.slot}:ID{header.id}" if header else f"{slot}:--"
+                         for slot, header in enumerate(self.headers()))
+        usage = self.usage()
+        lines.append(f"Slots {usage['slots_used']}/{usage['slots']}  {slots}")
+        lines.append(f"Data free {usage['data_free']}/{usage['data_size']} B in {usage['free_runs']} runs, "
+                     f"largest {usage['largest_free_run']} B, fragmentation {usage['fragmentation']:.0%}")
+        if usage["unknown"]:
+            lines.append(f"{usage['unknown']} bytes missing from the dump")
+        return "\n".join(lines)
+
+    def _header_char(self, start, end):
+        for slot in range(start // TASK_HEADER_SIZE, min(TASK_SLOTS, (end - 1) // TASK_HEADER_SIZE + 1)):
+            if self.data[slot * TASK_HEADER_SIZE] != ERASED:
+                return "H"
+        return "h"
+
+
+def decode_dump(lines, size=EEPROM_SIZE):
+    """ EepromImage from <DEBUG> reply lines (strings or already parsed records) """
+    image = EepromImage(size)
+    for line in lines:
+        record = parse_line(line) if isinstance(line, str) else line
+        if isinstance(record, DumpRow):
+            end = min(record.address + len(record.data), size)
+            if record.address < end:
+                image.data[record.address:end] = record.data[:end - record.address]
+                image.known[record.address:end] = b"\x01" * (end - record.address)
+        elif isinstance(record, Malformed):
+            image.malformed.append(record)
+    return image
+
+
+def load_dump(path):
+    """ EepromImage from a saved dump / monitor log file """
+    with open(path, encoding="utf-8", errors="ignore") as file:
+        return decode_dump(line.strip() for line in file)
+
+
+def format_diff(new, old):
+    """ Changed ranges and slots between two images, one line each """
+    lines = []
+    for start, end in new.diff(old):
+        lines.append(f"0x{start:04X}-0x{end - 1:04X} ({end - start} B, {new.region(start)}): "
+                     f"{bytes(old.data[start:end]).hex(' ').upper()} -> {bytes(new.data[start:end]).hex(' ').upper()}")
+    for slot in new.changed_slots(old):
+        header = new.headers()[slot]
+        lines.append(f"Slot {slot}: " + (f"ID={header.id} TYPE={header.type} PRIORITY={header.priority} "
+                                         f"STATUS={header.status} SIZE={header.size}" if header else "empty"))
+    return lines
+
+
+def change_counts(images):
+    """ How often each address changed across a series of images (wear / corruption hot spots) """
+    counts = [0] * (len(images[0].data) if images else 0)
+    for old, new in zip(images, images[1:]):
+        for start, end in new.diff(old):
+            for address in range(start, end):
+                counts[address] += 1
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode, map and diff saved <DEBUG> EEPROM dumps")
+    parser.add_argument("dumps", nargs="+", help="dump files (monitor logs with a <DEBUG> reply)")
+    parser.add_argument("--hot", type=int, default=10, help="show the N most frequently changed addresses")
+    args = parser.parse_args(argv)
+
+    images = [load_dump(path) for path in args.dumps]
+    print(images[-1].memory_map())
+    for path, old, new in zip(args.dumps[1:], images, images[1:]):
+        changes = format_diff(new, old)
+        print(f"\n{path}: " + ("no changes" if not changes else f"{len(changes)} changes"))
+        for line in changes:
+            print(f"  {line}")
+
+    if len(images) > 2:
+        counts = change_counts(images)
+        hot = sorted((count, address) for address, count in enumerate(counts) if count)[::-1][:args.hot]
+        print("\nMost changed addresses:")
+        for count, address in hot:
+            print(f"  0x{address:04X} ({images[-1].region(address)}): {count} of {len(images) - 1} dumps")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import os
+import threading
+
+# ---------------- Flash Slot Allocator ---------------- #
+#
+# Chooses where a task image lives in the board's flash so it can be linked
+# for that address and run in place (the address goes in the TaskHeader's
+# FlashAddress). The TaskHeaders themselves sit in fixed EEPROM slots; only the
+# images need placing.
+#
+# Images start on a flash page boundary and never share a page, so writing one
+# task erases only its own pages. A re-uploaded task keeps its region while
+# the new image fits (same pages, nothing moves); otherwise the smallest free
+# run that fits is used (best fit), which keeps large runs free for large tasks.
+
+FLASH_PAGE_SIZE = 128  # ATMega328P SPM page
+# Flash the RTOS sets aside for task images (above the kernel, below the bootloader)
+TASK_FLASH_START = int(os.environ.get("RTOS_TASK_FLASH_START", "0x5000"), 0)
+TASK_FLASH_END = int(os.environ.get("RTOS_TASK_FLASH_END", "0x7000"), 0)
+
+_build_lock = threading.Lock()  # Fleet threads may place the same source at the same address
+
+
+def pages(size, page_size=FLASH_PAGE_SIZE):
+    """ Whole flash pages needed for size bytes """
+    return max(1, -(-size // page_size))
+
+
+class FlashAllocator:
+    """ Free/used map of the task flash region of one board """
+
+    def __init__(self, start=TASK_FLASH_START, end=TASK_FLASH_END, page_size=FLASH_PAGE_SIZE):
+        if start % page_size or end % page_size or end <= start:
+            raise ValueError("Task flash region must be page aligned and non-empty")
+        self.start = start
+        self.end = end
+        self.page_size = page_size
+        self.regions = {}  # task_id -> (address, length in bytes, page aligned)
+
+    @classmethod
+    def from_tasks(cls, tasks, **region):
+        """ Allocator for a board from its task table (TaskRecords or task_info dicts).
+
+        Tasks stored without a FlashAddress in the region (e.g. uploaded before
+        placement existed) don't occupy it.
+        """
+        allocator = cls(**region)
+        for task in tasks:
+            task_id, addr, size = task.get("id"), task.get("addr") or 0, task.get("size") or 0
+            if allocator.start <= addr < allocator.end:
+                allocator.reserve(task_id, addr, size)
+        return allocator
+
+    def reserve(self, task_id, address, size):
+        """ Record an existing placement """
+        if address % self.page_size:
+            raise ValueError(f"Task {task_id} at 0x{address:04X} is not page aligned")
+        length = pages(size, self.page_size) * self.page_size
+        if address < self.start or address + length > self.end:
+            raise ValueError(f"Task {task_id} at 0x{address:04X} ({size} B) is outside the task region")
+        for other_id, (other_address, other_length) in self.regions.items():
+            if other_id != task_id and address < other_address + other_length and other_address < address + length:
+                raise ValueError(f"Task {task_id} at 0x{address:04X} overlaps task {other_id}")
+        self.regions[task_id] = (address, length)
+
+    def release(self, task_id):
+        self.regions.pop(task_id, None)
+
+    def free_regions(self, ignore=None):
+        """ (address, length) of the free runs, optionally treating task `ignore` as free """
+        used = sorted(region for task_id, region in self.regions.items() if task_id != ignore)
+        runs = []
+        cursor = self.start
+        for address, length in used:
+            if address > cursor:
+                runs.append((cursor, address - cursor))
+            cursor = max(cursor, address + length)
+        if cursor < self.end:
+            runs.append((cursor, self.end - cursor))
+        return runs
+
+    def allocate(self, task_id, size):
+        """ Choose (and record) the address for task_id's new image of size bytes """
+        length = pages(size, self.page_size) * self.page_size
+        current = self.regions.get(task_id)
+        if current and length <= current[1]:
+            address = current[0]  # Rewrite the same pages in place
+        else:
+            fits = [run for run in self.free_regions(ignore=task_id) if run[1] >= length]
+            if not fits:
+                raise ValueError(f"No free flash run of {length} bytes for task {task_id} "
+                                 f"(largest free: {self.largest_free(ignore=task_id)} bytes)")
+            address = min(fits, key=lambda run: (run[1], run[0]))[0]  # Best fit, then lowest address
+        self.regions[task_id] = (address, length)
+        return address
+
+    def largest_free(self, ignore=None):
+        return max((length for _, length in self.free_regions(ignore)), default=0)
+
+    def usage(self):
+        """ Used/free bytes and fragmentation of the task region """
+        free = sum(length for _, length in self.free_regions())
+        largest = self.largest_free()
+        return {
+            "region": (self.start, self.end),
+            "used": (self.end - self.start) - free,
+            "free": free,
+            "free_runs": len(self.free_regions()),
+            "largest_free": largest,
+            "fragmentation": 1 - largest / free if free else 0.0,
+        }
+
+
+def build_placed_image(c_path, task_id, allocator, profile=None, priority=None):
+    """ Compile c_path linked at the address the allocator picks for it.
+
+    The image size is only known after a build, so the first build is linked at
+    the start of the region; the task is then placed and rebuilt at its address
+    (linked builds are cached per address). A priority checks the task's budget
+    (see task_budget). Returns (image bytes, address).
+    """
+    from task_compiler import build_task
+
+    with _build_lock:
+        report = build_task(c_path, profile=profile, flash_address=allocator.start, priority=priority)
+        for _ in range(3):
+            address = allocator.allocate(task_id, report["size"])
+            if address != report["flash_address"]:
+                report = build_task(c_path, profile=profile, flash_address=address, priority=priority)
+            if pages(report["size"], allocator.page_size) * allocator.page_size <= allocator.regions[task_id][1]:
+                break  # Relinking at the new address didn't outgrow the region
+        else:
+            raise RuntimeError(f"Could not place {os.path.basename(c_path)}: image size keeps changing")
+
+        with open(report["bin"], "rb") as file:
+            return file.read(), address
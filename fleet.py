@@ -0,0 +1,127 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rtos_client
+
+# ---------------- Multi-board Fleet ---------------- #
+#
+# Runs the same rtos_client operations on many boards at once, one thread per
+# port, so the wall time is that of the slowest board rather than the sum.
+# A device only counts as OK if every operation's result says so: a reply with
+# an error line, no reply at all or a batch / sync that wasn't applied fails it.
+
+_FAILED_REPLY = re.compile(r"Unknown command|Invalid|Error|ERR\b|rejected|not found|not applied|fail", re.IGNORECASE)
+
+
+def result_error(result):
+    """ Why an operation's result is a failure, or None if it isn't one """
+    if isinstance(result, dict):
+        if result.get("applied") is False:
+            return result.get("error") or "Not applied"
+        return result_error(result["reply"]) if "reply" in result else None
+    if isinstance(result, list):
+        if not result:
+            return "No reply"
+        failed = [line for line in result if isinstance(line, str) and _FAILED_REPLY.search(line)]
+        return "; ".join(failed) or None
+    return None
+
+
+def _run_device(port, operations, baud_rate, capture=None):
+    """ Open one port (auto-detecting the rate if baud_rate is None), run every operation in order
+    and describe the outcome
+    """
+    entry = {"port": port, "ok": False, "baud_rate": baud_rate, "results": [], "error": None, "seconds": 0.0}
+    start_time = time.perf_counter()
+    ser = None
+    try:
+        ser = rtos_client.connect(port, baud_rate, capture=capture)
+        entry["baud_rate"] = ser.baudrate
+        for func, args in operations:
+            result = func(ser, *args)
+            entry["results"].append(result)
+            error = result_error(result)
+            if error:
+                raise RuntimeError(error)
+        entry["ok"] = True
+    except Exception as e:
+        entry["error"] = str(e)
+    finally:
+        if ser:
+            ser.close()
+    entry["seconds"] = time.perf_counter() - start_time
+    return entry
+
+
+def port_capture_paths(capture, ports):
+    """ One capture file per port: caps/run.cap + COM3 -> caps/run-COM3.cap """
+    root, ext = os.path.splitext(capture)
+    paths = []
+    for index, port in enumerate(ports):
+        path = f"{root}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', port).strip('_')}{ext or '.cap'}"
+        paths.append(path if path not in paths else f"{root}-{index}{ext or '.cap'}")
+    return paths
+
+
+def run_fleet(ports, operations, baud_rate=rtos_client.DEFAULT_BAUD, capture=None):
+    """ Run [(func, args), ...] on every port in parallel.
+
+    Each func is called as func(ser, *args), like rtos_client commands. A device
+    stops at its first failing operation (an exception or a result_error());
+    other devices carry on. Returns a
+    report with one entry per port plus totals. With baud_rate None every board's
+    rate is probed, all ports in parallel. capture records each port's wire
+    traffic to its own file (see port_capture_paths).
+    """
+    start_time = time.perf_counter()
+    captures = port_capture_paths(capture, ports) if capture else [None] * len(ports)
+    with ThreadPoolExecutor(max_workers=max(1, len(ports))) as pool:
+        devices = list(pool.map(lambda port, path: _run_device(port, operations, baud_rate, path), ports, captures))
+
+    return {
+        "devices": devices,
+        "ok": sum(1 for entry in devices if entry["ok"]),
+        "failed": sum(1 for entry in devices if not entry["ok"]),
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def deploy_tasks(ports, tasks, baud_rate=rtos_client.DEFAULT_BAUD, framed=False, place=False, check_budget=True,
+                 compress=False):
+    """ Upload a task set to every board: each image is compiled once, then pushed to all ports.
+
+    tasks is a list of dicts with "file", "id" and optional "type"/"priority".
+    With place=True .c tasks are linked per board, for a free region of its flash.
+    .c tasks over the stack / CPU budget of their priority are rejected before
+    anything is sent, unless check_budget is False. compress sends images LZ-packed
+    where that is smaller (see task_compress).
+    """
+    operations = []
+    for task in tasks:
+        if place and task["file"].endswith(".c"):
+            operations.append((rtos_client.upload_placed_task,
+                               (task["file"], task["id"], task.get("type", 0), task.get("priority", 1),
+                                None, framed, 1, check_budget, compress)))
+            continue
+        image = rtos_client.load_task_image(task["file"], priority=task.get("priority", 1) if check_budget else None)
+        operations.append((rtos_client.upload_task_image,
+                           (task["id"], task.get("type", 0), task.get("priority", 1), image, framed, 1, 0,
+                            compress)))
+    return run_fleet(ports, operations, baud_rate)
+
+
+def format_fleet_report(report):
+    """ Human-readable per-device summary """
+    lines = []
+    for entry in report["devices"]:
+        if entry["ok"]:
+            lines.append(f"OK    {entry['port']} @ {entry['baud_rate']} ({entry['seconds']:.2f}s)")
+            for result in entry["results"]:
+                for line in (result if isinstance(result, list) else [result]):
+                    lines.append(f"      {line}")
+        else:
+            lines.append(f"FAIL  {entry['port']} ({entry['seconds']:.2f}s): {entry['error']}")
+    lines.append(f"{report['ok']} ok, {report['failed']} failed in {report['seconds']:.2f}s")
+    return "\n".join(lines)
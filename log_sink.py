@@ -0,0 +1,78 @@
+import datetime
+import os
+import threading
+
+# Full monitor history goes to files here; the widgets only keep the newest lines
+LOG_DIR = os.environ.get("RTOS_LOG_DIR", os.path.join(os.path.expanduser("~"), ".cache", "rtos-logs"))
+
+
+class LogSink:
+    """ Buffered writer for a read-only CTkTextbox.
+
+    write() only appends to a buffer (from any thread). flush() runs on the Tk
+    thread every flush_interval ms and renders everything buffered with a single
+    insert, then trims the widget to the newest max_lines lines. When a
+    history_path is given, every line is also appended to that file.
+    """
+
+    def __init__(self, widget, max_lines=2000, history_path=None, flush_interval=50):
+        self.widget = widget
+        self.max_lines = max_lines
+        self.flush_interval = flush_interval
+        self.line_count = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._history = None
+        if history_path:
+            os.makedirs(os.path.dirname(history_path) or ".", exist_ok=True)
+            self._history = open(history_path, "a", encoding="utf-8")
+
+    def write(self, msg):
+        with self._lock:
+            self._pending.append(msg)
+
+    def start(self, root):
+        """ Flush every flush_interval ms on root's event loop """
+        self.flush()
+        root.after(self.flush_interval, self.start, root)
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+
+        text = "\n".join(pending) + "\n"
+        if self._history:
+            self._history.write(text)
+            self._history.flush()
+
+        self.widget.configure(state="normal")
+        self.widget.insert("end", text)
+        self.line_count += text.count("\n")
+        excess = self.line_count - self.max_lines
+        if excess > 0:
+            self.widget.delete("1.0", f"{excess + 1}.0")  # Drop the oldest lines
+            self.line_count -= excess
+        self.widget.yview("end")
+        self.widget.configure(state="disabled")  # Re-enable read-only
+
+    def clear(self):
+        """ Empty the widget and drop anything not rendered yet (history file is kept) """
+        with self._lock:
+            self._pending = []
+        self.widget.configure(state="normal")
+        self.widget.delete("1.0", "end")
+        self.widget.configure(state="disabled")
+        self.line_count = 0
+
+    def close(self):
+        if self._history:
+            self._history.close()
+            self._history = None
+
+
+def history_path(name):
+    """ Timestamped history file for one session, e.g. ~/.cache/rtos-logs/monitor-20250605-141500.log """
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(LOG_DIR, f"{name}-{stamp}.log")
@@ -0,0 +1,232 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rtos_client
+
+# ---------------- Connection Supervisor ---------------- #
+#
+# Keeps a session alive across cable glitches: a USB-UART that resets or
+# re-enumerates (often under a new device name) is found again and reopened
+# with exponential backoff, and the SerialWorker carries on with its queue
+# (see SerialWorker's reconnect hook). Used by the GUI and by long unattended
+# runs; nothing here needs a human to click Connect.
+#
+# Port enumeration is cached for ENUM_CACHE_SECONDS because comports() is slow on
+# some hosts. Board discovery only probes USB-UART bridges (USB_UART_IDS, or
+# RTOS_USB_IDS="0403:6001,1a86:7523"), all candidates in parallel, with the
+# <LIST> handshake of the baud rate detection; the winning port stays open.
+
+# VID:PID of the USB-UART bridges RTOS boards are wired through
+USB_UART_IDS = {
+    (0x0403, 0x6001): "FTDI FT232R",
+    (0x0403, 0x6015): "FTDI FT231X",
+    (0x1A86, 0x7523): "CH340",
+    (0x10C4, 0xEA60): "CP210x",
+    (0x067B, 0x2303): "PL2303",
+    (0x2341, 0x0043): "Arduino Uno (16U2)",
+    (0x2341, 0x0001): "Arduino Uno (16U2)",
+}
+ENUM_CACHE_SECONDS = 1.0
+BACKOFF_START = 0.25  # Seconds before the first reconnect attempt, doubled per failure
+BACKOFF_MAX = 8.0
+
+
+def parse_usb_ids(text):
+    """ "0403:6001,1a86:7523" -> {(0x0403, 0x6001), (0x1A86, 0x7523)} """
+    ids = set()
+    for item in text.split(","):
+        vid, _, pid = item.strip().partition(":")
+        if not (vid and pid):
+            raise ValueError(f"Invalid VID:PID: {item}")
+        ids.add((int(vid, 16), int(pid, 16)))
+    return ids
+
+
+def usb_ids():
+    text = os.environ.get("RTOS_USB_IDS")
+    return parse_usb_ids(text) if text else set(USB_UART_IDS)
+
+
+class PortScanner:
+    """ Cached serial port enumeration that tells which ports appeared and disappeared """
+
+    def __init__(self, max_age=ENUM_CACHE_SECONDS, ids=None):
+        self.max_age = max_age
+        self.ids = usb_ids() if ids is None else ids
+        self._ports = {}
+        self._scanned = None
+        self._seen = None  # Ports reported by the last changes()
+        self._lock = threading.Lock()
+
+    def scan(self, force=False):
+        """ {device: {"device", "vid", "pid", "serial_number", "description"}}, at most max_age old """
+        with self._lock:
+            now = time.monotonic()
+            if force or self._scanned is None or now - self._scanned >= self.max_age:
+                import serial.tools.list_ports
+                self._ports = {port.device: {"device": port.device, "vid": port.vid, "pid": port.pid,
+                                             "serial_number": port.serial_number, "description": port.description}
+                               for port in serial.tools.list_ports.comports()}
+                self._scanned = now
+            return dict(self._ports)
+
+    def changes(self, force=False):
+        """ (added, removed) device names since the previous call """
+        ports = set(self.scan(force))
+        previous, self._seen = self._seen, ports
+        if previous is None:
+            return sorted(ports), []
+        return sorted(ports - previous), sorted(previous - ports)
+
+    def candidates(self, force=False):
+        """ Ports behind a known USB-UART bridge """
+        return sorted(device for device, info in self.scan(force).items() if (info["vid"], info["pid"]) in self.ids)
+
+
+def open_board(port, rates=rtos_client.BAUD_RATES, handshake=True):
+    """ Open port and find the rate an RTOS answers at; the open port, or None.
+
+    Without handshake the port is just opened at rates[0].
+    """
+    try:
+        ser = rtos_client.open_port(port, rates[0])
+    except Exception:
+        return None
+    if not handshake:
+        return ser
+    try:
+        if rtos_client.probe_baud(ser, rates) is not None:
+            return ser
+    except Exception:
+        pass
+    ser.close()
+    return None
+
+
+def find_board(ports, rates=rtos_client.BAUD_RATES, handshake=True):
+    """ Probe ports in parallel; (port, open serial) of the first in order an RTOS answered on, or None """
+    ports = list(ports)
+    if not ports:
+        return None
+    with ThreadPoolExecutor(max_workers=len(ports)) as pool:
+        opened = list(pool.map(lambda port: open_board(port, rates, handshake), ports))
+    found = None
+    for port, ser in zip(ports, opened):
+        if ser is None:
+            continue
+        if found is None:
+            found = port, ser
+        else:
+            ser.close()
+    return found
+
+
+class ConnectionSupervisor:
+    """ Opens a board and reopens it when it is lost.
+
+    port None finds a board among the USB-UART ports; a given port is reopened
+    by name, or under a new name if the same USB serial number re-enumerates
+    elsewhere. baud_rate None probes the rate (the last working rate first); a
+    given port at a given rate is opened without the <LIST> handshake.
+    reconnect() is the SerialWorker hook; on_event(message) reports progress
+    (called on the worker thread).
+    """
+
+    def __init__(self, port=None, baud_rate=None, capture=None, scanner=None, rates=rtos_client.BAUD_RATES,
+                 on_event=None, backoff_start=BACKOFF_START, backoff_max=BACKOFF_MAX, max_attempts=None):
+        self.port = port
+        self.auto = port is None
+        self.baud_rate = baud_rate
+        self.capture = capture
+        self.scanner = scanner or PortScanner()
+        self.rates = rates
+        self.on_event = on_event
+        self.backoff_start = backoff_start
+        self.backoff_max = backoff_max
+        self.max_attempts = max_attempts  # None: keep trying until stopped
+        self.serial_number = None  # USB serial number of the board we are talking to
+        self.reconnects = 0
+        self._stop = threading.Event()
+
+    def connect(self):
+        """ Open the board; raises RuntimeError if none answers """
+        ser = self._attempt()
+        if ser is None:
+            where = self.port or "any USB-UART port"
+            raise RuntimeError(f"No RTOS answered on {where}")
+        return ser
+
+    def reconnect(self, dead, stopped=lambda: False):
+        """ Close a lost port and reopen the board with backoff; None once stopped or out of attempts """
+        try:
+            dead.close()
+        except Exception:
+            pass
+        attempt = 0
+        while not (stopped() or self._stop.is_set()):
+            delay = min(self.backoff_max, self.backoff_start * 2 ** attempt) * random.uniform(0.8, 1.2)
+            if self._wait(delay, stopped):
+                break
+            attempt += 1
+            try:
+                ser = self._attempt()
+            except Exception as e:
+                self._event(f"Reconnect attempt {attempt} failed: {e}")
+                ser = None
+            if ser is not None:
+                self.reconnects += 1
+                self._event(f"Reconnected to {self.port} at {ser.baudrate} baud after {attempt} attempts")
+                return ser
+            if self.max_attempts and attempt >= self.max_attempts:
+                self._event(f"Giving up after {attempt} reconnect attempts")
+                break
+        return None
+
+    def stop(self):
+        """ End a reconnect in progress (and any later one) """
+        self._stop.set()
+
+    def _attempt(self):
+        """ One try: the known port (or its USB serial number under a new name) first, then, when
+        no port was given, every USB-UART candidate; all probed in parallel
+        """
+        ports = self.scanner.scan(force=True)
+        candidates = []
+        if self.port and (self.port in ports or "://" in self.port):
+            candidates.append(self.port)  # Present, or a URL that is never enumerated
+        if self.serial_number:
+            candidates += [device for device, info in sorted(ports.items())
+                           if info["serial_number"] == self.serial_number and device not in candidates]
+        if self.auto:
+            candidates += [device for device in self.scanner.candidates() if device not in candidates]
+
+        rates = self.rates if self.baud_rate is None else (self.baud_rate,)
+        found = find_board(candidates, rates, handshake=self.auto or self.baud_rate is None)
+        if found is None:
+            return None
+        port, ser = found
+        if self.port and port != self.port:
+            self._event(f"Board moved from {self.port} to {port}")
+        self.port = port
+        self.rates = (ser.baudrate,) + tuple(rate for rate in self.rates if rate != ser.baudrate)
+        self.serial_number = ports.get(port, {}).get("serial_number") or self.serial_number
+        if self.capture:
+            from wire_capture import CaptureSerial
+            ser = CaptureSerial(ser, self.capture)  # Appends, so one capture spans the reconnects
+        return ser
+
+    def _wait(self, delay, stopped):
+        """ Sleep in short steps; True if stopped meanwhile """
+        deadline = time.monotonic() + delay
+        while time.monotonic() < deadline:
+            if stopped() or self._stop.is_set():
+                return True
+            time.sleep(min(0.05, max(0.0, deadline - time.monotonic())))
+        return False
+
+    def _event(self, message):
+        if self.on_event:
+            self.on_event(message)
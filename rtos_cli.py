@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import sys
+
+import command_stats
+import fleet
+import rtos_client
+
+# Command-line client for the RTOS. Keep imports light here: no Tk, and pyserial
+# is only loaded by rtos_client when a port is opened.
+
+
+def parse_baud(value):
+    return None if value.lower() == "auto" else int(value)
+
+
+def parse_batch_item(value):
+    """ "edit:2,0,1,1" -> ("edit", 2, 0, 1, 1) """
+    op, _, fields = value.partition(":")
+    if op not in ("delete", "edit", "status") or not fields:
+        raise argparse.ArgumentTypeError(f"invalid batch item: {value}")
+    try:
+        return (op,) + tuple(int(field) for field in fields.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid batch item: {value}")
+
+
+def with_fast_link(func):
+    """ Wrap func(ser, ...) to run on a negotiated high-speed link, reporting throughput on stderr """
+    def run(ser, *args):
+        result, link = rtos_client.run_fast(ser, func, *args)
+        print(rtos_client.format_link_stats(link), file=sys.stderr)
+        return result
+    return run
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ATMega328P RTOS task manager (command line)")
+    parser.add_argument("-p", "--port", default=os.environ.get("RTOS_PORT"),
+                        help="serial port or pyserial URL, comma-separated to run on several boards "
+                             "in parallel (default: $RTOS_PORT)")
+    parser.add_argument("-b", "--baud", type=parse_baud, default=rtos_client.DEFAULT_BAUD,
+                        help="baud rate, or 'auto' to probe each board's rate")
+    parser.add_argument("--fast", action="store_true",
+                        help="negotiate the fastest rate the board supports for the command, then drop back")
+    parser.add_argument("--capture", metavar="FILE",
+                        help="record every byte on the wire to FILE (one file per port with several ports)")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="record per-command latency / traffic and write it to FILE (.prom: Prometheus text, "
+                             "otherwise JSON; '-' prints a table to stderr)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ports = commands.add_parser("ports", help="list available serial ports")
+    ports.add_argument("--detect", action="store_true", help="probe every port's baud rate (in parallel)")
+    commands.add_parser("list", help="list stored tasks (<LIST>)")
+    commands.add_parser("dump", help="dump raw EEPROM task content (<DEBUG>)")
+
+    info = commands.add_parser("info", help="show one task's header (<INFO:x>)")
+    info.add_argument("id", type=int)
+
+    delete = commands.add_parser("delete", help="delete a task, or all tasks with --all")
+    delete.add_argument("id", type=int, nargs="?")
+    delete.add_argument("--all", action="store_true")
+
+    edit = commands.add_parser("edit", help="change a task's type, priority and status (<EDIT:...>)")
+    edit.add_argument("id", type=int)
+    edit.add_argument("--type", type=int, required=True)
+    edit.add_argument("--priority", type=int, required=True)
+    edit.add_argument("--status", type=int, default=1)
+
+    batch = commands.add_parser("batch", help="several deletes / edits / status changes in one round trip (<BATCH>)")
+    batch.add_argument("items", nargs="+", type=parse_batch_item, metavar="ITEM",
+                       help="delete:ID, edit:ID,TYPE,PRIORITY,STATUS or status:ID,STATUS")
+
+    upload = commands.add_parser("upload", help="upload a .c or .bin task (<TASK:...>)")
+    upload.add_argument("file")
+    upload.add_argument("--id", type=int, required=True)
+    upload.add_argument("--type", type=int, default=0)
+    upload.add_argument("--priority", type=int, default=1)
+    upload.add_argument("--framed", action="store_true", help="use the chunked CRC upload")
+    upload.add_argument("--compress", action="store_true",
+                        help="send the image LZ-compressed when that is smaller (firmware needs the decoder)")
+    upload.add_argument("--profile", choices=["compat", "size", "speed"],
+                        help="build profile for .c sources (default: compat, or $RTOS_BUILD_PROFILE; "
+                             "size when placed)")
+    upload.add_argument("--place", action="store_true",
+                        help="link a .c task for a free flash region of the board (firmware must honour FlashAddress)")
+    upload.add_argument("--no-budget", action="store_true",
+                        help="skip the stack / CPU budget check of .c tasks for their priority")
+
+    sync = commands.add_parser("sync", help="make the board match a task manifest with the fewest commands")
+    sync.add_argument("manifest", help="JSON manifest (see task_manifest.py)")
+    sync.add_argument("--dry-run", action="store_true", help="only print the plan")
+    sync.add_argument("--framed", action="store_true", help="use the chunked CRC upload")
+    sync.add_argument("--compress", action="store_true", help="send images LZ-compressed when that is smaller")
+    sync.add_argument("--no-budget", action="store_true", help="skip the stack / CPU budget check")
+
+    watch = commands.add_parser("watch", help="recompile and re-upload tasks whenever their sources change")
+    watch.add_argument("files", nargs="+", help=".c (or .bin) tasks; without --id their remembered parameters")
+    watch.add_argument("--id", type=int, help="slot to upload a single file to (remembered for next time)")
+    watch.add_argument("--type", type=int, default=0)
+    watch.add_argument("--priority", type=int, default=1)
+    watch.add_argument("--framed", action="store_true", help="use the chunked CRC upload")
+    watch.add_argument("--compress", action="store_true", help="send images LZ-compressed when that is smaller")
+    watch.add_argument("--profile", choices=["compat", "size", "speed"])
+    watch.add_argument("--place", action="store_true", help="link for a free flash region of the board")
+    watch.add_argument("--no-budget", action="store_true", help="skip the stack / CPU budget check")
+    watch.add_argument("--debounce", type=float, default=0.3, help="seconds a change must settle (default 0.3)")
+    return parser
+
+
+def build_operation(args):
+    """ Turn a parsed command into (func, args) for func(ser, *args).
+
+    Task files are compiled/read here, once, even when the command then runs on many boards.
+    """
+    if args.command == "list":
+        return rtos_client.list_tasks, ()
+    if args.command == "dump":
+        return rtos_client.debug_dump, ()
+    if args.command == "info":
+        return rtos_client.task_info, (args.id,)
+    if args.command == "delete":
+        if args.id is None and not args.all:
+            raise ValueError("Give a task ID or --all")
+        return rtos_client.delete_task, (None if args.all else args.id,)
+    if args.command == "edit":
+        return rtos_client.edit_task, (args.id, args.type, args.priority, args.status)
+    if args.command == "batch":
+        rtos_client.batch_request(args.items)  # Validate before connecting
+        return batch_lines, (args.items,)
+    if args.command == "upload" and args.place:
+        if not args.file.endswith(".c"):
+            raise ValueError("--place needs a .c source: the image is linked per board")
+        return rtos_client.upload_placed_task, (args.file, args.id, args.type, args.priority,
+                                                args.profile, args.framed, 1, not args.no_budget, args.compress)
+    if args.command == "upload":
+        image = rtos_client.load_task_image(args.file, args.profile, None if args.no_budget else args.priority)
+        return rtos_client.upload_task_image, (args.id, args.type, args.priority, image, args.framed, 1, 0,
+                                               args.compress)
+    if args.command == "sync":
+        import task_manifest
+        manifest = task_manifest.load_manifest(args.manifest, not args.no_budget)
+        return sync_lines, (manifest, args.dry_run, args.framed, args.compress)
+    if args.command == "watch":
+        import task_watch
+        targets = task_watch.watch_targets(args.files, args.id, args.type, args.priority, args.framed, args.place,
+                                           args.profile, not args.no_budget, args.compress)
+        for target in targets:
+            print(f"Watching {target['path']} -> ID={target['id']} TYPE={target['type']} "
+                  f"PRIORITY={target['priority']}", file=sys.stderr)
+        return task_watch.watch, (targets, args.debounce, task_watch.POLL_SECONDS, task_watch.print_redeploy)
+    raise ValueError(f"Unknown command: {args.command}")
+
+
+def batch_lines(ser, items):
+    return rtos_client.format_batch_result(rtos_client.batch_tasks(ser, items))
+
+
+def sync_lines(ser, manifest, dry_run, framed, compress):
+    import task_manifest
+    report = task_manifest.sync(ser, manifest, dry_run, framed, compress)
+    lines = task_manifest.format_sync(report)
+    if report["failed"]:
+        raise RuntimeError("\n".join(lines))  # Exit status 1, with the per-slot report
+    return lines
+
+
+def print_result(result, as_json):
+    if as_json:
+        print(json.dumps(result, indent=2))
+    elif isinstance(result, dict):
+        print(" ".join(f"{key.upper()}={value}" for key, value in result.items()))
+    else:
+        for line in result:
+            print(line)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == "ports":
+        ports = rtos_client.list_ports()
+        if args.detect:
+            rates = rtos_client.detect_baud_rates(ports)
+            if args.json:
+                print_result(rates, True)
+            else:
+                for port, rate in rates.items():
+                    print(f"{port}: {rate or 'no answer'}")
+        else:
+            print_result(ports, args.json)
+        return 0
+    if not args.port:
+        print("error: no serial port given (use --port or set RTOS_PORT)", file=sys.stderr)
+        return 2
+
+    if args.stats:
+        command_stats.STATS.enabled = True
+    try:
+        return run_command(args)
+    finally:
+        if args.stats == "-":
+            print(command_stats.format_stats(command_stats.STATS.snapshot()), file=sys.stderr)
+        elif args.stats:
+            command_stats.STATS.export(args.stats)
+
+
+def run_command(args):
+    """ Run the parsed command on one port or, comma-separated, on several in parallel """
+    try:
+        func, func_args = build_operation(args)
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    if args.fast:
+        func = with_fast_link(func)
+
+    ports = [port for port in args.port.split(",") if port]
+    if len(ports) > 1:
+        report = fleet.run_fleet(ports, [(func, func_args)], args.baud, args.capture)
+        print(json.dumps(report, indent=2) if args.json else fleet.format_fleet_report(report))
+        return 1 if report["failed"] else 0
+
+    try:
+        ser = rtos_client.connect(ports[0], args.baud, capture=args.capture)
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    try:
+        result = func(ser, *func_args)
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        ser.close()
+    print_result(result, args.json)
+    error = fleet.result_error(result)  # The same check a multi-port run applies per board
+    if error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
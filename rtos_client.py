@@ -0,0 +1,502 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from command_stats import STATS
+from serial_worker import Request, run_request, exchange, END_MARKER, LIST_END_MARKERS
+from rtos_parser import parse_task, parse_task_list, TaskRecord
+from task_compress import pack, COMPRESSED_FLAG
+from task_upload import build_task_header, crc16, upload_task, MAX_TASK_SIZE
+
+# ---------------- RTOS Serial Protocol ---------------- #
+#
+# GUI-free commands for the ATMega328P RTOS. Every command takes an open serial
+# port as its first argument, so it can be called directly from scripts.
+# The *_request() builders describe the same commands as Requests for a
+# SerialWorker, which can pipeline them. pyserial is only imported when a port
+# is opened.
+
+DEFAULT_BAUD = 9600
+TASK_SLOTS = 10
+
+BAUD_RATES = (9600, 115200, 57600, 38400, 19200, 4800, 1200)  # Auto-detect order, most common first
+FAST_BAUD_RATES = (1000000, 500000, 250000, 115200)  # Exact (or 2% off) on a 16 MHz ATMega328P
+BAUD_CONFIRM_TIME = 1.0  # Board falls back unless a command arrives at the new rate this soon
+
+
+def list_ports():
+    """ List available serial ports """
+    import serial.tools.list_ports
+    return [port.device for port in serial.tools.list_ports.comports()]
+
+
+def open_port(port, baud_rate=DEFAULT_BAUD, timeout=1, capture=None):
+    """ Open a serial port by device name or pyserial URL (loop://, socket://...).
+
+    "emu://" opens an in-process emulated board (see rtos_emulator); "emu://57600"
+    one whose UART runs at 57600 baud whatever rate the port is opened with.
+    "replay://file.cap" plays back a wire capture, "replay://file.cap?speed=10"
+    ten times faster (speed=0: all at once). capture records every byte of the
+    session to that file (see wire_capture).
+    """
+    if port.startswith("emu://"):
+        from rtos_emulator import EmulatedSerial, RTOSEmulator
+        device_baud = port[len("emu://"):].strip("/")
+        emulator = RTOSEmulator(baud_rate=int(device_baud)) if device_baud else None
+        ser = EmulatedSerial(emulator, baud_rate=baud_rate, timeout=timeout)
+    elif port.startswith("replay://"):
+        from wire_capture import ReplaySerial
+        path, _, query = port[len("replay://"):].partition("?")
+        options = dict(item.partition("=")[::2] for item in query.split("&") if item)
+        ser = ReplaySerial(path, speed=float(options.get("speed", 1.0)), timeout=timeout)
+    else:
+        import serial
+        ser = serial.serial_for_url(port, baud_rate, timeout=timeout)
+    if capture:
+        from wire_capture import CaptureSerial
+        ser = CaptureSerial(ser, capture)
+    return ser
+
+
+# ---------------- Baud Rate Detection & Negotiation ---------------- #
+#
+# Detection tries each candidate rate with <LIST> and keeps the first one that
+# gets a readable task list back. Negotiation uses <BAUD:rate>: the board
+# answers "BAUD rate OK" at the current rate, then switches, and falls back by
+# itself unless a command arrives at the new rate within BAUD_CONFIRM_TIME.
+
+_LIST_OK = re.compile(r"^(List of Tasks:|No stored tasks found|Slot\s*\d+:)")
+
+
+def _answers_list(ser, timeout):
+    lines = exchange(ser, b"<LIST>\n", end_markers=LIST_END_MARKERS, timeout=timeout, idle_timeout=0.1)
+    return any(_LIST_OK.match(line) for line in lines)
+
+
+def probe_baud(ser, rates=BAUD_RATES, timeout=0.3):
+    """ Find the rate the board answers at and leave the port on it (None, port unchanged, if no rate works) """
+    original = ser.baudrate
+    for rate in rates:
+        ser.baudrate = rate
+        if _answers_list(ser, timeout):
+            return rate
+    ser.baudrate = original
+    return None
+
+
+def connect(port, baud_rate=None, rates=BAUD_RATES, capture=None):
+    """ Open a port at baud_rate, or auto-detect the board's rate when it is None """
+    ser = open_port(port, baud_rate or rates[0], capture=capture)
+    if baud_rate is None and probe_baud(ser, rates) is None:
+        ser.close()
+        raise RuntimeError(f"No RTOS answered on {port} at {', '.join(str(rate) for rate in rates)} baud")
+    return ser
+
+
+def detect_baud_rates(ports, rates=BAUD_RATES):
+    """ Probe several ports in parallel: {port: baud rate, or None if nothing answered} """
+    def detect(port):
+        try:
+            ser = open_port(port, rates[0])
+        except Exception:
+            return None
+        try:
+            return probe_baud(ser, rates)
+        except Exception:
+            return None
+        finally:
+            ser.close()
+
+    ports = list(ports)
+    with ThreadPoolExecutor(max_workers=max(1, len(ports))) as pool:
+        return dict(zip(ports, pool.map(detect, ports)))
+
+
+def _switch_baud(ser, rate, timeout):
+    """ Send <BAUD:rate>; on OK switch the port and confirm with a command at the new rate """
+    # Read up to <END> (or an idle gap) so nothing sent at the old rate is left in flight
+    reply = exchange(ser, f"<BAUD:{rate}>".encode("utf-8"), timeout=timeout, idle_timeout=0.05)
+    if not any(line.startswith(f"BAUD {rate} OK") for line in reply):
+        return reply
+    previous = ser.baudrate
+    ser.baudrate = rate
+    if _answers_list(ser, timeout):
+        return True
+    ser.baudrate = previous
+    time.sleep(BAUD_CONFIRM_TIME)  # Let the board fall back before anything else is sent
+    return False
+
+
+def negotiate_baud(ser, rates=FAST_BAUD_RATES, timeout=0.5):
+    """ Switch board and port to the fastest rate above the current one that both sustain.
+
+    Returns the new rate, or None when the link stays as it is (no faster rate
+    worked, or the firmware has no <BAUD> command).
+    """
+    for rate in sorted(rates, reverse=True):
+        if rate <= ser.baudrate:
+            break
+        result = _switch_baud(ser, rate, timeout)
+        if result is True:
+            return rate
+        if result is not False and not any(line.startswith("Unsupported") for line in result):
+            return None  # Silent or unknown command: this firmware can't switch rates
+    return None
+
+
+def restore_baud(ser, baud_rate, timeout=0.5):
+    """ Drop back to baud_rate after negotiate_baud(); returns False if the board didn't confirm """
+    if ser.baudrate == baud_rate:
+        return True
+    if _switch_baud(ser, baud_rate, timeout) is True:
+        return True
+    ser.baudrate = baud_rate  # The board falls back to this on its own if it never switched
+    return False
+
+
+class LinkMeter:
+    """ Port wrapper that counts the bytes read and written through it """
+
+    def __init__(self, ser):
+        self.__dict__.update(ser=ser, bytes_read=0, bytes_written=0)
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.ser, name, value)  # timeout, baudrate, ... belong to the real port
+
+    def read(self, size=1):
+        data = self.ser.read(size)
+        self.__dict__["bytes_read"] += len(data)
+        return data
+
+    def write(self, data):
+        self.__dict__["bytes_written"] += len(data)
+        return self.ser.write(data)
+
+
+def run_fast(ser, func, *args, rates=FAST_BAUD_RATES, **kwargs):
+    """ Run func(ser, *args, **kwargs) on a negotiated high-speed link, then drop back.
+
+    Meant for bulk transfers (uploads, EEPROM dumps). Returns (result, link),
+    link being the rate used and the measured throughput of func itself.
+    """
+    base = ser.baudrate
+    negotiate_start = time.perf_counter()
+    rate = negotiate_baud(ser, rates)
+    negotiate_seconds = time.perf_counter() - negotiate_start
+
+    meter = LinkMeter(ser)
+    start_time = time.perf_counter()
+    try:
+        result = func(meter, *args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start_time
+        if rate:
+            restore_baud(ser, base)
+
+    total = meter.bytes_read + meter.bytes_written
+    return result, {
+        "baud_rate": rate or base,
+        "negotiated": rate is not None,
+        "negotiate_seconds": negotiate_seconds,
+        "bytes_written": meter.bytes_written,
+        "bytes_read": meter.bytes_read,
+        "seconds": seconds,
+        "bytes_per_second": total / seconds if seconds > 0 else 0.0,
+    }
+
+
+def format_link_stats(link):
+    mode = "negotiated" if link["negotiated"] else "not negotiated"
+    return (f"Link {link['baud_rate']} baud ({mode}): {link['bytes_written']} B out, {link['bytes_read']} B in "
+            f"in {link['seconds']:.3f}s = {link['bytes_per_second'] / 1000:.1f} kB/s")
+
+
+def check_task_id(task_id):
+    if not (0 <= task_id < TASK_SLOTS):
+        raise ValueError(f"Task ID must be between 0–{TASK_SLOTS - 1}")
+
+
+def check_task_fields(task_type, priority, status):
+    if not (0 <= task_type <= 5):  # adjust range if needed
+        raise ValueError("Invalid Task Type")
+    if not (1 <= priority <= 3):
+        raise ValueError("Priority must be 1–3")
+    if status not in [0, 1]:
+        raise ValueError("Status must be 0 or 1")
+
+
+def parse_task_info(line):
+    """ Parse an <INFO:x> reply like: ID=2 TYPE=1 PRIORITY=3 STATUS=1 SIZE=64 ADDR=0x0000 """
+    record = parse_task(line)
+    return record.as_dict() if isinstance(record, TaskRecord) else {}
+
+
+# Reply patterns: lines matching a command's pattern are its reply, anything
+# else that arrives meanwhile is task output. Error replies match every command.
+_ERROR_REPLY = r"|Unknown command|Invalid|Error|ERR"
+LIST_REPLY = re.compile(r"List of Tasks:|No stored tasks found|Slot\b|T ID" + _ERROR_REPLY)
+INFO_REPLY = re.compile(r"\bID=|Task \d+ not found" + _ERROR_REPLY)
+STATUS_REPLY = re.compile(r"Task \d+ |All tasks|Delete|Edit|Stored|OK\b" + _ERROR_REPLY, re.IGNORECASE)
+DEBUG_REPLY = re.compile(r"EEPROM|^[0-9A-Fa-f]{2,4}:" + _ERROR_REPLY)
+BATCH_REPLY = re.compile(r"^Batch\b|^#\d+ " + _ERROR_REPLY)
+BATCH_END_MARKERS = (END_MARKER, "Batch done.", "Batch rejected.")
+_UPLOAD_ERROR = re.compile(r"Unknown command|Invalid|Error|ERR|rejected|fail", re.IGNORECASE)
+
+# <BATCH:items*CRC> runs several slot edits in one round trip, as a transaction:
+# items are ';'-separated "D<id>" (delete), "E<id>,<type>,<priority>,<status>"
+# (edit) or "S<id>,<status>" (status only), CRC is the CRC-16 of the items text
+# in 4 hex digits. The board answers "#<n> <reply>" per item, then "Batch done."
+# or, if any item failed (nothing is applied then) or the CRC is wrong,
+# "Batch rejected.".
+MAX_BATCH_ITEMS = 16
+_ITEM_OK = re.compile(r"Task \d+ (deleted|updated)|All tasks deleted")
+
+
+def _parse_info_reply(lines):
+    record = parse_task(lines[0]) if lines else None
+    return record if isinstance(record, TaskRecord) else None
+
+
+def list_request():
+    return Request(b"<LIST>\n", LIST_REPLY, LIST_END_MARKERS)
+
+
+def debug_request(timeout=10):
+    # A full 1 KB dump takes several seconds at 9600 baud; it still ends on <END> or an idle gap
+    return Request(b"<DEBUG>\n", DEBUG_REPLY, timeout=timeout, idle_timeout=0.5)
+
+
+def delete_request(task_id=None):
+    if task_id is None:
+        return Request(b"<DELETE>", STATUS_REPLY)
+    check_task_id(task_id)
+    return Request(f"<DELETE:{task_id}>".encode("utf-8"), STATUS_REPLY)
+
+
+def info_request(task_id):
+    """ <INFO:x> Request; resolves to a TaskRecord, or None if the task doesn't exist """
+    check_task_id(task_id)
+    return Request(f"<INFO:{task_id}>".encode("utf-8"), INFO_REPLY, max_lines=1, parse=_parse_info_reply)
+
+
+def edit_request(task_id, task_type, priority, status):
+    check_task_id(task_id)
+    check_task_fields(task_type, priority, status)
+    cmd = f"<EDIT:{task_id},{task_type},{priority},{status}>"
+    return Request(cmd.encode("utf-8"), STATUS_REPLY)
+
+
+def batch_item(item):
+    """ Wire form of one batch item: ("delete", id), ("edit", id, type, priority, status) or ("status", id, status) """
+    op, task_id, *fields = item
+    check_task_id(task_id)
+    if op == "delete" and not fields:
+        return f"D{task_id}"
+    if op == "edit" and len(fields) == 3:
+        check_task_fields(*fields)
+        return f"E{task_id}," + ",".join(str(field) for field in fields)
+    if op == "status" and len(fields) == 1:
+        if fields[0] not in (0, 1):
+            raise ValueError("Status must be 0 or 1")
+        return f"S{task_id},{fields[0]}"
+    raise ValueError(f"Invalid batch item: {item}")
+
+
+def batch_request(items):
+    """ <BATCH:...> Request for several edits / deletes / status changes; resolves to parse_batch_reply() """
+    if not 0 < len(items) <= MAX_BATCH_ITEMS:
+        raise ValueError(f"A batch holds 1–{MAX_BATCH_ITEMS} items")
+    text = ";".join(batch_item(item) for item in items)
+    payload = f"<BATCH:{text}*{crc16(text.encode('ascii')):04X}>".encode("ascii")
+    # The board writes EEPROM between items, so allow longer gaps
+    return Request(payload, BATCH_REPLY, BATCH_END_MARKERS, timeout=5, idle_timeout=0.5,
+                   parse=lambda lines: parse_batch_reply(items, lines))
+
+
+def parse_batch_reply(items, lines):
+    """ {"applied", "error", "items": [{"op", "id", "ok", "reply"}]} from a <BATCH> reply.
+
+    Nothing is applied unless the board ends with "Batch done.". error holds the
+    board's reason for a rejection, or the whole reply when it doesn't know <BATCH>.
+    """
+    replies = {}
+    error = None
+    for line in lines:
+        match = re.match(r"#(\d+) (.*)", line)
+        if match:
+            replies[int(match.group(1))] = match.group(2)
+        elif line.startswith("Batch error:"):
+            error = line.partition(":")[2].strip()
+    applied = "Batch done." in lines
+    failed = [f"#{index} {reply}" for index, reply in sorted(replies.items()) if not _ITEM_OK.search(reply)]
+    if not applied and error is None:
+        error = "; ".join(failed or lines) or "No reply"
+    results = []
+    for index, item in enumerate(items):
+        reply = replies.get(index)
+        results.append({"op": item[0], "id": item[1], "reply": reply,
+                        "ok": applied and reply is not None and bool(_ITEM_OK.search(reply))})
+    return {"applied": applied, "error": error, "items": results}
+
+
+def task_payload(task_id, task_type, priority, image, status=1, flash_address=0, compress=False):
+    """ (TaskHeader, payload) of an upload. With compress the image goes LZ-packed (see task_compress)
+    when that is smaller, flagged in the Status byte; the board stores it decoded either way.
+    """
+    check_task_id(task_id)
+    if len(image) > MAX_TASK_SIZE:
+        raise ValueError(f"Binary exceeds {MAX_TASK_SIZE}-byte task limit.")
+    payload, packed = pack(image) if compress else (image, False)
+    if packed:
+        status |= COMPRESSED_FLAG
+    return build_task_header(task_id, task_type, priority, len(payload), status, flash_address), payload
+
+
+def check_upload_reply(task_id, lines):
+    """ The reply lines if they confirm task_id was stored; RuntimeError for an error, an echo or no reply """
+    if not lines:
+        raise RuntimeError(f"No reply to the upload of task {task_id}")
+    stored = re.compile(rf"Task {task_id} stored", re.IGNORECASE)
+    if any(_UPLOAD_ERROR.search(line) for line in lines) or not any(stored.search(line) for line in lines):
+        raise RuntimeError(f"Upload of task {task_id} not confirmed: {'; '.join(lines)}")
+    return lines
+
+
+def upload_request(task_id, task_type, priority, image, status=1, flash_address=0, compress=False):
+    """ <TASK:...> Request; resolves to the reply lines, or raises RuntimeError unless the board confirms """
+    header, payload = task_payload(task_id, task_type, priority, image, status, flash_address, compress)
+    # Allow longer gaps while the MCU writes (and decodes) the task
+    return Request(b"<TASK:" + header + payload + b">", STATUS_REPLY, idle_timeout=0.5,
+                   parse=lambda lines: check_upload_reply(task_id, lines))
+
+
+def list_tasks(ser):
+    """ Send <LIST> and return the reply lines """
+    return run_request(ser, list_request())
+
+
+def debug_dump(ser, timeout=10):
+    """ Send <DEBUG> and return the raw EEPROM dump lines """
+    return run_request(ser, debug_request(timeout))
+
+
+def delete_task(ser, task_id=None):
+    """ Send <DELETE:x>, or <DELETE> to remove every stored task """
+    return run_request(ser, delete_request(task_id))
+
+
+def task_info(ser, task_id):
+    """ Send <INFO:x> and return the parsed fields (empty dict when the board is silent) """
+    record = run_request(ser, info_request(task_id))
+    return record.as_dict() if record else {}
+
+
+def edit_task(ser, task_id, task_type, priority, status):
+    """ Send <EDIT:id,type,priority,status> and return the reply lines """
+    return run_request(ser, edit_request(task_id, task_type, priority, status))
+
+
+def batch_tasks(ser, items, fallback=True):
+    """ Apply several edits / deletes / status changes in one <BATCH> exchange.
+
+    With fallback, a board that doesn't know <BATCH> gets the items as single
+    commands instead (not a transaction then). Returns parse_batch_reply()'s dict.
+    """
+    result = run_request(ser, batch_request(items))
+    if result["applied"] or not fallback or not (result["error"] or "").startswith("Unknown command"):
+        return result
+
+    results = []
+    for item in items:
+        op, task_id, *fields = item
+        if op == "delete":
+            lines = delete_task(ser, task_id)
+        elif op == "edit":
+            lines = edit_task(ser, task_id, *fields)
+        else:
+            record = task_info(ser, task_id)
+            if not record:
+                lines = [f"Task {task_id} not found."]
+            else:
+                lines = edit_task(ser, task_id, record["type"], record["priority"], fields[0])
+        reply = "; ".join(lines)
+        results.append({"op": op, "id": task_id, "reply": reply, "ok": bool(_ITEM_OK.search(reply))})
+    applied = all(item["ok"] for item in results)
+    error = None if applied else "Some items failed (sent one by one, not as a transaction)"
+    return {"applied": applied, "error": error, "items": results}
+
+
+def format_batch_result(result):
+    lines = [f"{item['op']} {item['id']}: {item['reply'] or 'no reply'}" for item in result["items"]]
+    lines.append("Batch applied" if result["applied"] else f"Batch not applied: {result['error']}")
+    return lines
+
+
+def upload_task_image(ser, task_id, task_type, priority, image, framed=False, status=1, flash_address=0,
+                      compress=False):
+    """ Upload a task binary with its TaskHeader.
+
+    The default sends a single <TASK:header+payload> packet and returns the reply
+    lines, raising RuntimeError unless the board confirms the task was stored;
+    framed=True uses the chunked CRC protocol and returns its statistics.
+    flash_address is the address a placed image was linked for (0: the board chooses).
+    compress sends the image LZ-packed when that is smaller (firmware needs the decoder).
+    """
+    if not framed:
+        return run_request(ser, upload_request(task_id, task_type, priority, image, status, flash_address,
+                                               compress))
+
+    header, payload = task_payload(task_id, task_type, priority, image, status, flash_address, compress)
+    sent = time.perf_counter()
+    try:
+        stats = upload_task(ser, header, payload)
+    except Exception:
+        STATS.record("TASK_FRAMED", sent, time.perf_counter(), error=True)
+        raise
+    STATS.record("TASK_FRAMED", sent, time.perf_counter(), bytes_out=len(header) + len(payload),
+                 retries=stats["retransmits"], timeouts=stats["timeouts"])
+    stats["image_bytes"] = len(image)
+    return stats
+
+
+def upload_placed_task(ser, c_path, task_id, task_type, priority, profile=None, framed=False, status=1,
+                       check_budget=True, compress=False):
+    """ Compile a .c task linked for a free flash region of this board and upload it there.
+
+    The board's <LIST> gives the regions in use (see flash_alloc). Returns the
+    upload reply (or statistics) with the address the image was placed at.
+    """
+    image, address = build_placed_task(list_tasks(ser), c_path, task_id, profile, priority if check_budget else None)
+    return upload_placed_image(ser, task_id, task_type, priority, image, address, framed, status, compress)
+
+
+def build_placed_task(list_lines, c_path, task_id, profile=None, priority=None):
+    """ (image, flash address) of a .c task linked for a free region given the board's <LIST> reply """
+    from flash_alloc import FlashAllocator, build_placed_image
+
+    allocator = FlashAllocator.from_tasks(parse_task_list(list_lines))
+    return build_placed_image(c_path, task_id, allocator, profile, priority)
+
+
+def upload_placed_image(ser, task_id, task_type, priority, image, address, framed=False, status=1, compress=False):
+    """ Upload an image built by build_placed_task; returns the reply with the address it was placed at """
+    reply = upload_task_image(ser, task_id, task_type, priority, image, framed, status, address, compress)
+    return {"flash_address": address, "size": len(image), "reply": reply}
+
+
+def load_task_image(path, profile=None, priority=None):
+    """ Read a .bin task image, compiling a .c source first (with a task_compiler build profile).
+
+    With a priority a .c task is also checked against the stack / CPU budget of
+    that priority (see task_budget) and rejected with ValueError if it is over.
+    """
+    if path.endswith(".c"):
+        from task_compiler import compile_task_file
+        path = compile_task_file(path, profile=profile, priority=priority)
+    elif not path.endswith(".bin"):
+        raise ValueError("Please select a .c or .bin file.")
+    with open(path, "rb") as file:
+        return file.read()
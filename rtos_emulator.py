@@ -0,0 +1,481 @@
+import errno
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from eeprom_map import EEPROM_SIZE, ERASED as EMPTY_SLOT, TASK_SLOTS
+from rtos_client import BAUD_CONFIRM_TIME
+from serial_worker import END_MARKER
+from task_compress import unpack_task
+from task_upload import (TaskUploadReceiver, KIND_DATA, KIND_END, KIND_START, MAX_CHUNK, SYNC, TASK_HEADER_SIZE,
+                         crc16)
+
+# ---------------- Emulated RTOS Device ---------------- #
+#
+# Host-side stand-in for the ATMega328P RTOS so the tools can be exercised
+# without hardware. RTOSEmulator implements the command set on 10 task slots;
+# EmulatedSerial wraps it in a pyserial-like port with baud-rate timing and
+# fault injection (open it as "emu://" through rtos_client.open_port), and
+# serve_pty() exposes it on a pseudo-terminal for tools that need a real device.
+#
+# EEPROM layout used by the emulator: the TaskHeader table (10 slots x 10 bytes)
+# starts at address 0, unused bytes are 0xFF. Images live in (emulated) flash;
+# <LIST> / <INFO:x> report each image's CRC-16 (CRC=0x....) for task_manifest.
+#
+# <BAUD:rate> switches the UART to rate (up to max_baud) right after the
+# "BAUD rate OK" reply; unless a valid command arrives at the new rate within
+# BAUD_CONFIRM_TIME seconds, the board falls back to the previous rate.
+#
+# <BATCH:items*CRC> (see rtos_client.batch_request) applies its items as one
+# transaction: if any item fails the slot table is restored.
+#
+# Uploads flagged as compressed (task_compress.COMPRESSED_FLAG) are decoded
+# before they are stored, like the firmware's LZ decoder does.
+
+
+class RTOSEmulator:
+    """ Command interpreter for <LIST>, <DEBUG>, <INFO:x>, <EDIT:...>, <DELETE[:x]>, <BATCH:...>, <BAUD:x>
+    and <TASK:...>
+    """
+
+    def __init__(self, end_marker=True, error_rate=0.0, seed=None, baud_rate=None, max_baud=500000):
+        self.end_marker = end_marker
+        self.baud_rate = baud_rate  # UART rate of the board (None: whatever the host uses)
+        self.max_baud = max_baud
+        self.pending_baud = None    # Rate to switch to once the current reply is sent
+        self.eeprom = bytearray([EMPTY_SLOT]) * EEPROM_SIZE
+        self.flash = {}  # slot -> image bytes
+        self.buffer = bytearray()
+        self.receiver = TaskUploadReceiver(error_rate=error_rate, seed=seed)
+        self.commands = 0
+
+    # ---- slot table ---- #
+
+    def slot(self, task_id):
+        """ Decoded header of a slot, or None when empty """
+        raw = self.eeprom[task_id * TASK_HEADER_SIZE:(task_id + 1) * TASK_HEADER_SIZE]
+        if raw[0] == EMPTY_SLOT:
+            return None
+        return {
+            "id": raw[0],
+            "type": raw[1],
+            "priority": raw[2],
+            "size": raw[3] | (raw[4] << 8),
+            "status": raw[5],
+            "addr": int.from_bytes(raw[6:10], "little"),
+        }
+
+    def store(self, header, image):
+        task_id = header[0]
+        self.eeprom[task_id * TASK_HEADER_SIZE:(task_id + 1) * TASK_HEADER_SIZE] = header
+        self.flash[task_id] = bytes(image)
+
+    def erase(self, task_id):
+        self.eeprom[task_id * TASK_HEADER_SIZE:(task_id + 1) * TASK_HEADER_SIZE] = bytes([EMPTY_SLOT]) * TASK_HEADER_SIZE
+        self.flash.pop(task_id, None)
+
+    # ---- wire input ---- #
+
+    def feed(self, data):
+        """ Consume bytes written by the host and return the reply bytes """
+        self.buffer += data
+        out = []
+        while self.buffer:
+            if self.buffer[0] == SYNC:
+                size = self._frame_size()
+                if size is None:
+                    break  # Rest of the frame still on the wire
+                if not size:
+                    del self.buffer[:1]  # A stray SYNC byte, not a frame
+                    continue
+                out.append(self._feed_frame(size))
+                continue  # Text commands may follow in the same write
+            start = self.buffer.find(b"<")
+            if start < 0:
+                self.buffer.clear()
+                break
+            del self.buffer[:start]
+
+            if self.buffer.startswith(b"<TASK:"):
+                needed = 6 + TASK_HEADER_SIZE
+                if len(self.buffer) < needed:
+                    break
+                size = self.buffer[9] | (self.buffer[10] << 8)
+                if len(self.buffer) < needed + size + 1:
+                    break
+                header = bytes(self.buffer[6:needed])
+                image = bytes(self.buffer[needed:needed + size])
+                del self.buffer[:needed + size + 1]  # Payload is taken by length, then the '>'
+                out.append(self._reply(self._task(header, image)))
+                continue
+
+            end = self.buffer.find(b">")
+            if end < 0:
+                break
+            command = self.buffer[1:end].decode("utf-8", errors="ignore")
+            del self.buffer[:end + 1]
+            out.append(self._reply(self.execute(command)))
+        return b"".join(out)
+
+    def _frame_size(self):
+        """ Length of the chunked upload frame at the start of the buffer, 0 if it isn't one, None if cut short """
+        if len(self.buffer) < 4:
+            return None
+        kind, length = self.buffer[1], self.buffer[3]
+        if length > MAX_CHUNK or kind not in (KIND_START, KIND_DATA, KIND_END):
+            return 0
+        size = 4 + length + 2
+        return size if len(self.buffer) >= size else None
+
+    def _feed_frame(self, size):
+        """ One chunked CRC upload frame goes to the reference receiver """
+        frame = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        replies = self.receiver.feed(frame)
+        self.receiver.buffer.clear()  # The frame's length is known: a NAKed frame isn't rescanned for SYNC
+        for task_id, (header, image) in self.receiver.tasks.items():
+            if task_id < TASK_SLOTS:
+                self.store(header, image)
+        self.receiver.tasks.clear()
+        return b"".join(replies)
+
+    def _reply(self, lines):
+        self.commands += 1
+        if self.end_marker:
+            lines = lines + [END_MARKER]
+        return "".join(line + "\n" for line in lines).encode("utf-8")
+
+    # ---- commands ---- #
+
+    def execute(self, command):
+        """ Run one text command (without the <>) and return its reply lines """
+        name, _, arg = command.partition(":")
+        name = name.strip().upper()
+        try:
+            if name == "LIST":
+                return self._list()
+            if name == "DEBUG":
+                return self._debug()
+            if name == "INFO":
+                return self._info(int(arg))
+            if name == "EDIT":
+                return self._edit(*[int(part) for part in arg.split(",")])
+            if name == "DELETE":
+                return self._delete(int(arg) if arg else None)
+            if name == "BAUD":
+                return self._baud(int(arg))
+            if name == "BATCH":
+                return self._batch(arg)
+        except (ValueError, TypeError, IndexError):
+            return [f"Invalid arguments: {command}"]
+        return [f"Unknown command: {command}"]
+
+    def _format_slot(self, task):
+        return (f"ID={task['id']} TYPE={task['type']} PRIORITY={task['priority']} "
+                f"STATUS={task['status']} SIZE={task['size']} ADDR=0x{task['addr']:04X} "
+                f"CRC=0x{crc16(self.flash.get(task['id'], b'')):04X}")
+
+    def _list(self):
+        tasks = [self.slot(i) for i in range(TASK_SLOTS)]
+        if not any(tasks):
+            return ["No stored tasks found."]
+        return ["List of Tasks:"] + [f"Slot {i}: {self._format_slot(task)}"
+                                     for i, task in enumerate(tasks) if task]
+
+    def _debug(self):
+        lines = ["EEPROM Dump:"]
+        for address in range(0, EEPROM_SIZE, 16):
+            row = self.eeprom[address:address + 16]
+            lines.append(f"{address:04X}: " + " ".join(f"{byte:02X}" for byte in row))
+        return lines
+
+    def _info(self, task_id):
+        task = self.slot(task_id) if 0 <= task_id < TASK_SLOTS else None
+        if not task:
+            return [f"Task {task_id} not found."]
+        return [self._format_slot(task)]
+
+    def _edit(self, task_id, task_type, priority, status):
+        if not (0 <= task_id < TASK_SLOTS) or not self.slot(task_id):
+            return [f"Task {task_id} not found."]
+        base = task_id * TASK_HEADER_SIZE
+        self.eeprom[base + 1] = task_type
+        self.eeprom[base + 2] = priority
+        self.eeprom[base + 5] = status
+        return [f"Task {task_id} updated."]
+
+    def _delete(self, task_id):
+        if task_id is None:
+            for i in range(TASK_SLOTS):
+                self.erase(i)
+            return ["All tasks deleted."]
+        if not (0 <= task_id < TASK_SLOTS) or not self.slot(task_id):
+            return [f"Task {task_id} not found."]
+        self.erase(task_id)
+        return [f"Task {task_id} deleted."]
+
+    def _batch(self, arg):
+        text, _, crc = arg.rpartition("*")
+        if not text or int(crc, 16) != crc16(text.encode("ascii")):
+            return ["Batch error: CRC mismatch", "Batch rejected."]
+        items = [(item[:1].upper(), [int(field) for field in item[1:].split(",")]) for item in text.split(";")]
+
+        saved = bytes(self.eeprom), dict(self.flash)
+        lines = []
+        for index, (op, fields) in enumerate(items):
+            if op == "D" and len(fields) == 1:
+                reply = self._delete(fields[0])[0]
+            elif op == "E" and len(fields) == 4:
+                reply = self._edit(*fields)[0]
+            elif op == "S" and len(fields) == 2:
+                task = self.slot(fields[0]) if 0 <= fields[0] < TASK_SLOTS else None
+                reply = self._edit(fields[0], task["type"], task["priority"], fields[1])[0] if task \
+                    else f"Task {fields[0]} not found."
+            else:
+                reply = f"Invalid item {index}"
+            lines.append(f"#{index} {reply}")
+
+        if not all(line.endswith(("deleted.", "updated.")) for line in lines):
+            self.eeprom[:] = saved[0]  # All or nothing
+            self.flash = saved[1]
+            return lines + ["Batch rejected."]
+        return lines + ["Batch done."]
+
+    def _baud(self, rate):
+        if not (1200 <= rate <= self.max_baud):
+            return [f"Unsupported baud rate {rate}."]
+        self.pending_baud = rate
+        return [f"BAUD {rate} OK"]
+
+    def _task(self, header, image):
+        task_id = header[0]
+        if task_id >= TASK_SLOTS:
+            return [f"Invalid task ID {task_id}."]
+        try:
+            header, image = unpack_task(header, image)
+        except ValueError as e:
+            return [f"Task {task_id} rejected: {e}."]
+        self.store(header, image)
+        return [f"Task {task_id} stored ({len(image)} bytes)."]
+
+
+class EmulatedSerial:
+    """ pyserial-like port backed by an RTOSEmulator.
+
+    Bytes take 10/baud_rate seconds each on the wire in both directions and the
+    device answers response_delay seconds after a command arrives.
+    drop_rate drops reply bytes, silence_rate makes the device ignore a write,
+    error_rate corrupts chunked-upload frames.
+    """
+
+    def __init__(self, emulator=None, baud_rate=9600, timeout=1, response_delay=0.002,
+                 drop_rate=0.0, silence_rate=0.0, error_rate=0.0, seed=None):
+        self.emulator = emulator or RTOSEmulator(error_rate=error_rate, seed=seed)
+        self.baudrate = baud_rate
+        self.timeout = timeout
+        self.response_delay = response_delay
+        self.drop_rate = drop_rate
+        self.silence_rate = silence_rate
+        self.random = random.Random(seed)
+        self.port = "emu://"
+        self.is_open = True
+        self.bytes_in = 0   # host -> device
+        self.bytes_out = 0  # device -> host
+        self._pending = deque()  # [ready time of first byte, data]
+        self._wire_free = 0.0    # when the device->host line is idle again
+        self._tx_free = 0.0      # when the host->device line is idle again
+        self._condition = threading.Condition()
+        self._fallback = None    # (previous rate, deadline) until a new rate is confirmed
+        if self.emulator.baud_rate is None:
+            self.emulator.baud_rate = baud_rate
+
+    @property
+    def byte_time(self):
+        return 10.0 / self.baudrate if self.baudrate else 0.0
+
+    def write(self, data):
+        data = bytes(data)
+        with self._condition:
+            # Writes queue behind each other on the host -> device line
+            arrived = max(time.monotonic(), self._tx_free) + len(data) * self.byte_time
+            self._tx_free = arrived
+            self.bytes_in += len(data)
+            if self.silence_rate and self.random.random() < self.silence_rate:
+                return len(data)
+            if self._fallback and arrived > self._fallback[1]:
+                self.emulator.baud_rate, self._fallback = self._fallback[0], None  # Never confirmed
+            if self.baudrate != self.emulator.baud_rate:
+                # Rate mismatch: the board sees framing errors and the host gets line noise back
+                self._queue_reply(arrived, bytes(self.random.randrange(0x80, 0x100) for _ in range(len(data) // 2)))
+                return len(data)
+            commands = self.emulator.commands
+            reply = self.emulator.feed(data)
+            if self._fallback and self.emulator.commands > commands:
+                self._fallback = None  # A command got through at the new rate
+            if self.drop_rate and reply:
+                reply = bytes(byte for byte in reply if self.random.random() >= self.drop_rate)
+            self._queue_reply(arrived, reply)
+            if self.emulator.pending_baud:
+                # Switch after the OK has left at the old rate
+                self._fallback = (self.emulator.baud_rate, self._wire_free + BAUD_CONFIRM_TIME)
+                self.emulator.baud_rate, self.emulator.pending_baud = self.emulator.pending_baud, None
+        return len(data)
+
+    def _queue_reply(self, arrived, reply):
+        if reply:
+            start = max(arrived + self.response_delay, self._wire_free)
+            self._pending.append([start, reply])
+            self._wire_free = start + len(reply) * self.byte_time
+            self._condition.notify_all()
+
+    def inject(self, data):
+        """ Make the device print unsolicited output (task prints) """
+        with self._condition:
+            start = max(time.monotonic(), self._wire_free)
+            self._pending.append([start, bytes(data)])
+            self._wire_free = start + len(data) * self.byte_time
+            self._condition.notify_all()
+
+    def _available(self, now):
+        count = 0
+        for start, data in self._pending:
+            if now < start:
+                break
+            ready = len(data) if not self.byte_time else min(len(data), int((now - start) / self.byte_time))
+            count += ready
+            if ready < len(data):
+                break
+        return count
+
+    def _next_ready(self):
+        if not self._pending:
+            return None
+        start, data = self._pending[0]
+        return start + self.byte_time
+
+    @property
+    def in_waiting(self):
+        with self._condition:
+            return self._available(time.monotonic())
+
+    def _take(self, size):
+        out = bytearray()
+        now = time.monotonic()
+        while self._pending and len(out) < size:
+            start, data = self._pending[0]
+            if now < start:
+                break
+            ready = len(data) if not self.byte_time else min(len(data), int((now - start) / self.byte_time))
+            count = min(ready, size - len(out))
+            if count <= 0:
+                break
+            out += data[:count]
+            if count == len(data):
+                self._pending.popleft()
+            else:
+                self._pending[0] = [start + count * self.byte_time, data[count:]]
+        self.bytes_out += len(out)
+        return bytes(out)
+
+    def read(self, size=1):
+        if size <= 0:
+            return b""
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                data = self._take(size)
+                if data:
+                    return data
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    return b""
+                ready = self._next_ready()
+                wait = None if deadline is None else deadline - now
+                if ready is not None:
+                    wait = max(0.0, ready - now) if wait is None else min(wait, max(0.0, ready - now))
+                self._condition.wait(wait)
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            byte = self.read(1)
+            if not byte:
+                break
+            line += byte
+        return bytes(line)
+
+    def reset_input_buffer(self):
+        with self._condition:
+            now = time.monotonic()
+            self._take(self._available(now))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def serve_pty(emulator=None, baud_rate=None):
+    """ Serve an emulator on a new pseudo-terminal (POSIX only).
+
+    Returns (device_path, stop_event); open device_path with any serial tool.
+    baud_rate adds the wire delay of that rate to replies.
+    """
+    import tty
+    import select
+
+    emulator = emulator or RTOSEmulator()
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    os.close(slave)  # Clients open the device by path; the master end stays usable on Linux and macOS
+    stop_event = threading.Event()
+    byte_time = 10.0 / baud_rate if baud_rate else 0.0
+
+    def run():
+        while not stop_event.is_set():
+            ready, _, _ = select.select([master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(master, 4096)
+            except OSError as e:
+                if e.errno != errno.EIO:
+                    break
+                time.sleep(0.05)  # No client has the device open (yet, or any more)
+                continue
+            reply = emulator.feed(data)
+            emulator.pending_baud = None  # A pty has no line rate to switch
+            if reply:
+                if byte_time:
+                    time.sleep((len(data) + len(reply)) * byte_time)
+                os.write(master, reply)
+        os.close(master)
+
+    threading.Thread(target=run, name="rtos-emulator", daemon=True).start()
+    return path, stop_event
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve an emulated RTOS board on a pseudo-terminal")
+    parser.add_argument("-b", "--baud", type=int, help="emulate the wire delay of this baud rate")
+    parser.add_argument("--no-end-marker", action="store_true", help="do not terminate replies with <END>")
+    args = parser.parse_args(argv)
+
+    path, stop_event = serve_pty(RTOSEmulator(end_marker=not args.no_end_marker), args.baud)
+    print(f"Emulated RTOS on {path} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import re
+
+from serial_worker import END_MARKER
+
+# ---------------- RTOS Output Parser ---------------- #
+#
+# Turns the board's text output into small records:
+#   "Slot 2: ID=2 TYPE=1 PRIORITY=3 STATUS=1 SIZE=64 ADDR=0x0000"  -> TaskRecord
+#     (firmware that knows it appends CRC=0x1A2B, the CRC-16 of the image)
+#   "ID=2 TYPE=1 ..." (<INFO:x> reply)                            -> TaskRecord
+#   "0040: FF FF 00 ..." (<DEBUG> EEPROM dump row)                -> DumpRow
+#   a line that looks like one of those but doesn't parse         -> Malformed
+#   anything else (headers, status messages, task output)         -> the line itself (str)
+# LineParser does the same for raw bytes fed in arbitrary pieces, down to one
+# byte at a time, keeping partial lines until their newline arrives.
+
+# Fast path for the board's own field order; other orders use the key=value scan
+_TASK_LINE = re.compile(
+    r"(?:Slot\s*(\d+)\s*:\s*)?ID=(\d+)\s+TYPE=(\d+)\s+PRIORITY=(\d+)\s+STATUS=(\d+)\s+SIZE=(\d+)"
+    r"(?:\s+ADDR=(0[xX][0-9A-Fa-f]+|\d+))?(?:\s+CRC=(0[xX][0-9A-Fa-f]+|\d+))?\s*$")
+_SLOT_PREFIX = re.compile(r"Slot\s*(\d+)\s*:")
+_FIELD = re.compile(r"([A-Za-z_]+)=(0[xX][0-9A-Fa-f]+|-?\d+)")
+_DUMP_ROW = re.compile(r"([0-9A-Fa-f]{2,4}):((?:\s+[0-9A-Fa-f]{2})+)\s*$")
+_LOOKS_LIKE_DUMP = re.compile(r"[0-9A-Fa-f]{2,4}:")
+
+MAX_LINE = 512  # Longer lines are reported as malformed instead of growing the buffer
+
+
+class TaskRecord:
+    """ One TaskHeader as reported by <LIST> / <INFO:x> (slot is None for <INFO:x>, crc when not reported) """
+    __slots__ = ("slot", "id", "type", "priority", "size", "status", "addr", "crc")
+
+    FIELDS = ("id", "type", "priority", "status", "size", "addr", "crc")
+
+    def __init__(self, id, type=0, priority=1, size=0, status=0, addr=0, slot=None, crc=None):
+        self.slot = slot
+        self.id = id
+        self.type = type
+        self.priority = priority
+        self.size = size
+        self.status = status
+        self.addr = addr
+        self.crc = crc
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def get(self, key, default=None):
+        """ dict-style access, so records can stand in for the old task_info dicts """
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def copy(self):
+        return TaskRecord(self.id, self.type, self.priority, self.size, self.status, self.addr, self.slot, self.crc)
+
+    def __eq__(self, other):
+        return isinstance(other, TaskRecord) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return (f"TaskRecord(slot={self.slot}, id={self.id}, type={self.type}, priority={self.priority}, "
+                f"size={self.size}, status={self.status}, addr=0x{self.addr:04X})")
+
+
+class DumpRow:
+    """ One row of the <DEBUG> EEPROM dump: start address and the bytes shown """
+    __slots__ = ("address", "data")
+
+    def __init__(self, address, data):
+        self.address = address
+        self.data = data
+
+    def __repr__(self):
+        return f"DumpRow(0x{self.address:04X}, {self.data.hex(' ')})"
+
+
+class Malformed:
+    """ A line that should have been a task or dump row but didn't parse """
+    __slots__ = ("line", "reason")
+
+    def __init__(self, line, reason):
+        self.line = line
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Malformed({self.line!r}, {self.reason!r})"
+
+
+def _int(value):
+    return int(value, 16) if value[:2] in ("0x", "0X") else int(value)
+
+
+def parse_task(line):
+    """ TaskRecord from a LIST/INFO line, or a Malformed when the fields are missing """
+    match = _TASK_LINE.match(line)
+    if match:
+        slot, task_id, task_type, priority, status, size, addr, crc = match.groups()
+        return TaskRecord(int(task_id), int(task_type), int(priority), int(size), int(status),
+                          _int(addr) if addr else 0, int(slot) if slot is not None else None,
+                          _int(crc) if crc else None)
+
+    # Fields in another order, or extra / missing ones
+    slot = _SLOT_PREFIX.match(line)
+    fields = {key.lower(): _int(value) for key, value in _FIELD.findall(line)}
+    if "id" not in fields:
+        return Malformed(line, "no task ID")
+    try:
+        return TaskRecord(slot=int(slot.group(1)) if slot else None,
+                          **{key: value for key, value in fields.items() if key in TaskRecord.FIELDS})
+    except TypeError as e:
+        return Malformed(line, str(e))
+
+
+def parse_dump_row(line):
+    """ DumpRow from an EEPROM dump line, or a Malformed """
+    match = _DUMP_ROW.match(line)
+    if not match:
+        return Malformed(line, "bad dump row")
+    return DumpRow(int(match.group(1), 16), bytes.fromhex(match.group(2)))
+
+
+def parse_line(line):
+    """ Classify one decoded line (see the module comment for the record types) """
+    if "ID=" in line:
+        return parse_task(line)
+    if line.startswith("Slot"):
+        return parse_task(line)
+    if _LOOKS_LIKE_DUMP.match(line):
+        return parse_dump_row(line)
+    return line
+
+
+def parse_lines(lines):
+    return [parse_line(line) for line in lines]
+
+
+def parse_task_list(lines):
+    """ TaskRecords of a <LIST> reply (malformed lines are skipped) """
+    return [record for record in map(parse_line, lines) if isinstance(record, TaskRecord)]
+
+
+class LineParser:
+    """ Incremental parser for raw serial bytes.
+
+    feed() accepts any number of bytes and returns the records of the lines it
+    completed; a partial line waits in the buffer for the rest. Malformed lines
+    come back as Malformed records and are counted, never raised.
+    """
+
+    def __init__(self, skip_end_marker=True):
+        self.skip_end_marker = skip_end_marker
+        self.lines = 0
+        self.malformed = 0
+        self._buffer = bytearray()
+        self._discarding = False  # Dropping the rest of an overlong line
+
+    def feed(self, data):
+        if b"\n" not in data:
+            if not self._discarding:
+                self._buffer += data
+                if len(self._buffer) > MAX_LINE:
+                    return [self._overflow()]
+            return []
+
+        self._buffer += data
+        *lines, rest = self._buffer.split(b"\n")
+        self._buffer = bytearray(rest)
+        if self._discarding:
+            self._discarding = False
+            del lines[0]  # Tail of the overlong line
+        records = []
+        for raw in lines:
+            record = self._parse(raw)
+            if record is not None:
+                records.append(record)
+        return records
+
+    def flush(self):
+        """ Parse whatever is left without a trailing newline """
+        raw, self._buffer = self._buffer, bytearray()
+        if self._discarding:
+            self._discarding = False
+            return []
+        record = self._parse(raw)
+        return [record] if record is not None else []
+
+    def _overflow(self):
+        line = self._buffer[:64].decode("utf-8", errors="replace")
+        self._buffer = bytearray()
+        self._discarding = True
+        self.malformed += 1
+        return Malformed(line, f"line longer than {MAX_LINE} bytes")
+
+    def _parse(self, raw):
+        line = raw.decode("utf-8", errors="ignore").strip()
+        if not line or (self.skip_end_marker and line == END_MARKER):
+            return None
+        self.lines += 1
+        record = parse_line(line)
+        if isinstance(record, Malformed):
+            self.malformed += 1
+        return record
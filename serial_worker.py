@@ -0,0 +1,496 @@
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from command_stats import STATS, command_name
+
+END_MARKER = "<END>"  # Explicit end-of-response line
+LIST_END_MARKERS = (END_MARKER, "No stored tasks found.")
+
+
+def read_response(ser, end_markers=(END_MARKER,), timeout=2, idle_timeout=0.2, max_lines=None,
+                  accept=None, on_unsolicited=None, timing=None):
+    """ Read reply lines until an end marker, an idle gap or the hard deadline.
+
+    Returns as soon as a line in end_markers (or the max_lines-th line) arrives.
+    Once the reply has started, a gap of idle_timeout seconds without bytes also
+    ends it; timeout is only the last resort for a board that never answers.
+    The <END> line itself is not included in the result, and an <END> before any
+    reply line is skipped as the tail of a previous reply.
+    With an accept pattern, lines that don't match it are task output: they are
+    passed to on_unsolicited (if given) instead of being part of the reply.
+    A timing dict receives "first_byte" (perf_counter), "bytes" read and
+    "timed_out" when the hard deadline ended the read.
+    """
+    response = []
+    buffer = b""
+    deadline = time.monotonic() + timeout
+    saved_timeout = ser.timeout
+
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if timing is not None:
+                    timing["timed_out"] = True
+                break
+
+            started = bool(response or (buffer and accept is None))
+            ser.timeout = min(remaining, idle_timeout) if started else remaining
+            chunk = ser.read(1)  # Blocks until a byte arrives instead of sleep-polling
+            if not chunk:
+                if started:
+                    break  # Idle gap after the reply started
+                continue
+
+            chunk += ser.read(ser.in_waiting)
+            if timing is not None:
+                timing.setdefault("first_byte", time.perf_counter())
+                timing["bytes"] = timing.get("bytes", 0) + len(chunk)
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for raw in lines:
+                line = raw.decode("utf-8", errors="ignore").strip()
+                if not line:
+                    continue
+                if line == END_MARKER:
+                    if not response:
+                        continue  # Late terminator of the previous reply
+                    return response
+                if accept is not None and not accept.search(line):
+                    if on_unsolicited:
+                        on_unsolicited(line)
+                    continue
+                response.append(line)
+                if line in end_markers or (max_lines and len(response) >= max_lines):
+                    return response
+    finally:
+        ser.timeout = saved_timeout
+
+    line = buffer.decode("utf-8", errors="ignore").strip()
+    if line:
+        response.append(line)  # Keep a trailing line the board never terminated
+    return response
+
+
+def exchange(ser, payload, reset=True, **read_options):
+    """ Write a command and read its reply (see read_response for the options) """
+    if reset:
+        ser.reset_input_buffer()  # Clear old data
+    if not STATS.enabled:
+        ser.write(payload)
+        return read_response(ser, **read_options)
+
+    timing = {}
+    sent = time.perf_counter()
+    try:
+        ser.write(payload)
+        lines = read_response(ser, timing=timing, **read_options)
+    except Exception:
+        STATS.record(command_name(payload), sent, time.perf_counter(), bytes_out=len(payload), error=True)
+        raise
+    STATS.record(command_name(payload), sent, time.perf_counter(), timing.get("first_byte"), len(payload),
+                 timing.get("bytes", 0), timeouts=int(timing.get("timed_out", False)))
+    return lines
+
+
+class Request:
+    """ A command plus the rules for recognising its reply.
+
+    accept is a compiled pattern for the reply lines (None accepts every line);
+    parse turns the reply lines into the request's result. name labels its
+    statistics (default: the command, e.g. "LIST").
+    """
+
+    def __init__(self, payload, accept=None, end_markers=(END_MARKER,), max_lines=None,
+                 timeout=2, idle_timeout=0.2, parse=None, name=None):
+        self.payload = payload
+        self.name = name or command_name(payload)
+        self.accept = accept
+        self.end_markers = end_markers
+        self.max_lines = max_lines
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.parse = parse
+
+    def accepts(self, line):
+        return self.accept is None or bool(self.accept.search(line))
+
+    def result(self, lines):
+        return self.parse(lines) if self.parse else lines
+
+
+def run_request(ser, request, on_unsolicited=None):
+    """ Send one Request on a port the caller owns and return its parsed reply """
+    lines = exchange(ser, request.payload, end_markers=request.end_markers, timeout=request.timeout,
+                     idle_timeout=request.idle_timeout, max_lines=request.max_lines,
+                     accept=request.accept, on_unsolicited=on_unsolicited)
+    return request.result(lines)
+
+
+class _InFlight:
+    """ A sent Request waiting for (the rest of) its reply """
+
+    def __init__(self, request, future):
+        self.request = request
+        self.future = future
+        self.lines = []
+        self.deadline = None       # Set when it becomes the oldest request
+        self.last_activity = None
+        self.sent = None           # perf_counter() after the write, for STATS
+        self.first_byte = None
+        self.bytes_in = 0
+
+
+class SerialWorker:
+    """ Background thread that owns the serial port and is its only reader.
+
+    Two kinds of work can be queued:
+    - request(Request): the command is written at once and up to max_in_flight
+      requests are pipelined. Every incoming line is classified: a line the oldest
+      request accepts is part of its reply, a line only the next request accepts
+      ends the oldest reply early, anything else is unsolicited task output and
+      goes to on_line. The board answers commands in order, so replies are matched
+      first in, first out.
+    - submit(func): func(ser, *args, **kwargs) runs with exclusive use of the port
+      once nothing is in flight (e.g. the chunked upload, which reads its own ACKs).
+    Both return Futures. Callbacks are queued and only run when process_callbacks()
+    is called, so the GUI can run them on the Tk thread.
+
+    With reconnect(dead_port, stopped) (see port_supervisor) a port that fails
+    (cable glitch, USB re-enumeration) is replaced instead of failing every
+    command: queued commands wait, requests still waiting for a reply and an
+    interrupted exclusive command are sent again on the new port. on_state(event,
+    detail) reports "lost", "reconnected" (detail: the new port) and "gave up".
+    """
+
+    def __init__(self, ser, on_line=None, poll_interval=0.1, max_in_flight=4, reconnect=None, on_state=None):
+        self.ser = ser
+        self.on_line = on_line
+        self.poll_interval = poll_interval
+        self.max_in_flight = max_in_flight
+        self._commands = queue.Queue()
+        self._results = queue.Queue()
+        self._in_flight = collections.deque()
+        self._held = None  # Exclusive command waiting for the in-flight replies
+        self._resend = collections.deque()  # Work interrupted by a lost port, started before the queue
+        self.reconnect = reconnect
+        self.on_state = on_state
+        self.connected = True
+        self._stopped = False  # stop() was called
+        self._buffer = b""
+        self._chunk_time = None  # perf_counter() of the chunk being routed
+        self._port_timeout = ser.timeout
+        self._running = False
+        self._thread = threading.Thread(target=self._run, name="serial-worker", daemon=True)
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=3):
+        """ Stop after the current command finishes and cancel anything still queued """
+        self._running = False
+        self._stopped = True
+        self._commands.put(None)
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+        while True:
+            try:
+                item = self._commands.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].cancel()
+        if self._held:
+            self._held[1].cancel()
+            self._held = None
+        self._fail_resend(RuntimeError("Serial worker stopped"))
+        self._finish_all(RuntimeError("Serial worker stopped"))
+
+    def submit(self, func, *args, callback=None, **kwargs):
+        """ Queue func(ser, *args, **kwargs) for exclusive use of the port and return its Future """
+        return self._queue(("func", func, args, kwargs), callback)
+
+    def request(self, request, callback=None):
+        """ Queue a Request; its Future resolves to the parsed reply """
+        return self._queue(("request", request), callback)
+
+    def _queue(self, work, callback):
+        future = Future()
+        if callback:
+            future.add_done_callback(lambda done: self._results.put((callback, done)))
+        if not self._running:
+            future.set_exception(RuntimeError("Serial worker is not running"))
+            return future
+        self._commands.put((work[0], future) + work[1:])
+        return future
+
+    def pending(self):
+        """ Number of commands queued or waiting for a reply """
+        return self._commands.qsize() + len(self._in_flight) + (1 if self._held else 0)
+
+    def process_callbacks(self):
+        """ Run finished callbacks on the calling thread (use root.after to call this from Tk) """
+        while True:
+            try:
+                callback, arg = self._results.get_nowait()
+            except queue.Empty:
+                return
+            callback(arg)
+
+    # ---- worker thread ---- #
+
+    def _run(self):
+        while self._running:
+            if self._held and not self._in_flight:
+                item, self._held = self._held, None
+                self._run_exclusive(item)
+                continue
+
+            if not self._in_flight:
+                # Idle: wait for work, pick up task output between commands
+                try:
+                    item = self._next(self.poll_interval)
+                except queue.Empty:
+                    self._pump(0)
+                    continue
+                if item is None:
+                    break
+                self._start(item)
+
+            # Pipeline whatever else is queued
+            while not self._held and len(self._in_flight) < self.max_in_flight:
+                try:
+                    item = self._next()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._running = False
+                    break
+                self._start(item)
+
+            if self._in_flight:
+                self._pump(self._wait_time())
+                self._expire()
+
+    def _next(self, timeout=None):
+        """ Next work item, interrupted work first (raises queue.Empty) """
+        if self._resend:
+            return self._resend.popleft()
+        if timeout is None:
+            return self._commands.get_nowait()
+        return self._commands.get(timeout=timeout)
+
+    def _start(self, item):
+        if item[0] in ("func", "retry"):
+            if self._in_flight:
+                self._held = item  # Runs once the pipelined replies are in
+            else:
+                self._run_exclusive(item)
+            return
+
+        if item[0] == "resend":
+            entry = item[1]
+            entry.lines, entry.first_byte, entry.bytes_in = [], None, 0
+        else:
+            _, future, request = item
+            if not future.set_running_or_notify_cancel():
+                return
+            entry = _InFlight(request, future)
+        try:
+            self.ser.write(entry.request.payload)
+        except Exception as e:
+            if not self._recover(e, [("resend", entry)]):
+                entry.future.set_exception(e)
+            return
+        entry.sent = time.perf_counter()
+        if not self._in_flight:
+            self._make_oldest(entry)
+        self._in_flight.append(entry)
+
+    def _run_exclusive(self, item):
+        kind, future, func, args, kwargs = item
+        if kind == "func" and not future.set_running_or_notify_cancel():
+            return
+        self.ser.timeout = self._port_timeout
+        sent = time.perf_counter()
+        try:
+            future.set_result(func(self.ser, *args, **kwargs))
+        except Exception as e:
+            # Run it once more on a replacement port (not again if the retry also loses the port)
+            retry = [("retry",) + item[1:]] if kind == "func" else []
+            if self._recover(e, retry) and retry:
+                return
+            STATS.record(f"{getattr(func, '__name__', 'func')}()", sent, time.perf_counter(), error=True)
+            future.set_exception(e)
+            return
+        STATS.record(f"{getattr(func, '__name__', 'func')}()", sent, time.perf_counter())
+
+    def _make_oldest(self, entry):
+        now = time.monotonic()
+        entry.deadline = now + entry.request.timeout
+        entry.last_activity = now
+
+    def _wait_time(self):
+        """ How long to block on the port before checking deadlines and the queue again """
+        head = self._in_flight[0]
+        now = time.monotonic()
+        until = head.deadline - now
+        if head.lines:
+            until = min(until, head.last_activity + head.request.idle_timeout - now)
+        return max(0.0, min(until, 0.01))
+
+    def _pump(self, timeout):
+        """ Read what the port has (waiting up to timeout for the first byte) and route the lines """
+        try:
+            self.ser.timeout = timeout
+            chunk = self.ser.read(1)
+            if chunk:
+                chunk += self.ser.read(self.ser.in_waiting)
+        except Exception as e:
+            if not self._recover(e):
+                self._unsolicited(f"Error: {str(e)}")
+                self._finish_all(e)
+            return
+
+        if not chunk:
+            return
+        self._chunk_time = time.perf_counter()
+        if self._in_flight:
+            self._in_flight[0].last_activity = time.monotonic()
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for raw in lines:
+            line = raw.decode("utf-8", errors="ignore").strip()
+            if line:
+                self._route(line)
+
+    def _route(self, line):
+        if line == END_MARKER:
+            if self._in_flight and self._in_flight[0].lines:
+                self._finish_head()
+            return  # A stray <END> is the tail of a reply we already closed
+
+        if not self._in_flight:
+            self._unsolicited(line)
+            return
+
+        head = self._in_flight[0]
+
+        if head.request.accepts(line):
+            if head.first_byte is None:
+                head.first_byte = self._chunk_time
+            head.bytes_in += len(line) + 1
+            head.lines.append(line)
+            request = head.request
+            if line in request.end_markers or (request.max_lines and len(head.lines) >= request.max_lines):
+                self._finish_head()
+            return
+
+        if len(self._in_flight) > 1 and head.lines and self._in_flight[1].request.accepts(line):
+            self._finish_head()  # The next reply has started
+            self._route(line)
+            return
+
+        self._unsolicited(line)
+
+    def _expire(self):
+        if not self._in_flight:
+            return
+        head = self._in_flight[0]
+        now = time.monotonic()
+        if now >= head.deadline:
+            self._finish_head(timed_out=True)
+        elif head.lines and now - head.last_activity >= head.request.idle_timeout:
+            self._finish_head()
+
+    def _finish_head(self, timed_out=False):
+        entry = self._in_flight.popleft()
+        error = False
+        try:
+            entry.future.set_result(entry.request.result(entry.lines))
+        except Exception as e:
+            entry.future.set_exception(e)
+            error = True
+        STATS.record(entry.request.name, entry.sent, time.perf_counter(), entry.first_byte,
+                     len(entry.request.payload), entry.bytes_in, timeouts=int(timed_out), error=error)
+        if self._in_flight:
+            self._make_oldest(self._in_flight[0])
+
+    def _finish_all(self, error):
+        while self._in_flight:
+            entry = self._in_flight.popleft()
+            STATS.record(entry.request.name, entry.sent, time.perf_counter(), entry.first_byte,
+                         len(entry.request.payload), entry.bytes_in, error=True)
+            if not entry.future.done():
+                entry.future.set_exception(error)
+
+    def _port_alive(self):
+        try:
+            self.ser.in_waiting
+            return bool(self.ser.is_open)
+        except Exception:
+            return False
+
+    def _recover(self, error, interrupted=()):
+        """ Replace a lost port through reconnect(); True when the work was handed to the new port.
+
+        The requests in flight, then the interrupted work and a held exclusive
+        command are started again ahead of the queue. If reconnect() gives up
+        the worker stops and fails everything still pending.
+        """
+        if not self.reconnect or self._port_alive():
+            return False
+        self.connected = False
+        self._notify("lost", str(error))
+        work = [("resend", entry) for entry in self._in_flight] + list(interrupted)
+        if self._held:
+            work.append(self._held)
+            self._held = None
+        self._in_flight.clear()
+        self._resend.extendleft(reversed(work))
+        self._buffer = b""
+
+        try:
+            ser = self.reconnect(self.ser, lambda: not self._running)
+        except Exception as e:
+            ser, error = None, e
+        if ser is None:
+            self._running = False
+            self._fail_resend(error)
+            while True:
+                try:
+                    item = self._commands.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None and item[1].set_running_or_notify_cancel():
+                    item[1].set_exception(error)
+            if not self._stopped:
+                self._notify("gave up", str(error))
+            return bool(interrupted)
+
+        self.ser = ser
+        self._port_timeout = ser.timeout
+        self.connected = True
+        self._notify("reconnected", ser)
+        return True
+
+    def _fail_resend(self, error):
+        while self._resend:
+            item = self._resend.popleft()
+            future = item[1].future if item[0] == "resend" else item[1]
+            if not future.done():
+                future.set_exception(error)
+
+    def _notify(self, event, detail):
+        if self.on_state:
+            self._results.put((lambda _: self.on_state(event, detail), None))
+
+    def _unsolicited(self, line):
+        if self.on_line:
+            self._results.put((self.on_line, line))
@@ -0,0 +1,333 @@
+import os
+import re
+
+# ---------------- Stack & Cycle Budget ---------------- #
+#
+# Static estimate of what a compiled task costs the RTOS before it is uploaded:
+# - worst-case stack: the -fstack-usage frame of every function plus the return
+#   addresses along the deepest call chain of the disassembly, plus the context
+#   the kernel pushes when it preempts the task
+# - cycles per iteration of the task's main loop, from the AVR instruction
+#   timings of its straight-line code. Busy-wait countdown loops (what
+#   _delay_ms/_delay_us compile to) are recognised and counted exactly as
+#   delay; other loops have unknown trip counts and are counted once.
+# The CPU share of a task is the fraction of each loop iteration spent outside
+# delays. Higher priorities preempt everything below them, so they get a
+# smaller share budget.
+
+CONTEXT_BYTES = 35  # r0-r31, SREG and the return address saved on a preemption
+CALL_BYTES = 2      # Return address pushed by call/rcall/icall (16-bit PC on the ATMega328P)
+STACK_BUDGET = int(os.environ.get("RTOS_TASK_STACK", "128"))  # Stack bytes per task
+CPU_SHARE_BUDGET = {1: 1.0, 2: 0.5, 3: 0.25}  # priority (1=Low .. 3=High) -> max share of its loop time
+
+# ATMega328P cycles; everything else takes 1. Branches and skips are counted
+# not taken, except the backward branch that closes a loop.
+_CYCLES = {
+    "call": 4, "rcall": 3, "icall": 3, "eicall": 4, "jmp": 3, "rjmp": 2, "ijmp": 2, "eijmp": 2,
+    "ret": 4, "reti": 4, "adiw": 2, "sbiw": 2, "mul": 2, "muls": 2, "mulsu": 2, "fmul": 2, "fmuls": 2,
+    "fmulsu": 2, "ld": 2, "ldd": 2, "lds": 2, "st": 2, "std": 2, "sts": 2, "push": 2, "pop": 2,
+    "sbi": 2, "cbi": 2, "lpm": 3, "elpm": 3,
+}
+_CALLS = ("call", "rcall")
+_INDIRECT = ("icall", "eicall", "ijmp", "eijmp")
+_JUMPS = ("jmp", "rjmp")
+_COUNTDOWN = ("subi", "sbci", "sbiw", "dec")  # Counter updates of a delay loop
+
+_SU_LINE = re.compile(r"^(.*):(\d+):(\d+):(\S+)\s+(\d+)\s+(\S+)\s*$")
+_FUNCTION = re.compile(r"^([0-9a-fA-F]+) <([^>]+)>:\s*$")
+_INSN = re.compile(r"^\s*([0-9a-fA-F]+):\t([0-9a-fA-F ]+)\t(\S+)\s*([^;]*?)\s*(?:;\s*(.*))?$")
+_RELOC = re.compile(r"^\s*[0-9a-fA-F]+:\s+R_AVR_\w+\s+(\S+)\s*$")
+_TARGET = re.compile(r"0x([0-9a-fA-F]+)(?:\s+<([^>+]+))?")
+_REGISTER = re.compile(r"r(\d+)")
+
+
+class Instruction:
+    """ One disassembled instruction (target: branch/call destination address or symbol, if any) """
+    __slots__ = ("address", "size", "mnemonic", "operands", "target", "symbol")
+
+    def __init__(self, address, size, mnemonic, operands, target=None, symbol=None):
+        self.address = address
+        self.size = size
+        self.mnemonic = mnemonic
+        self.operands = operands
+        self.target = target
+        self.symbol = symbol
+
+    def __repr__(self):
+        return f"Instruction(0x{self.address:04X}, {self.mnemonic} {self.operands})"
+
+
+def parse_f_cpu(value):
+    """ F_CPU as an int from a define like "8000000UL" """
+    return int(value.rstrip("UuLl"))
+
+
+def parse_stack_usage(text):
+    """ {function: (bytes, qualifier)} from a -fstack-usage .su file """
+    frames = {}
+    for line in text.splitlines():
+        match = _SU_LINE.match(line)
+        if match:
+            frames[match.group(4)] = (int(match.group(5)), match.group(6))
+    return frames
+
+
+def parse_disassembly(text):
+    """ {function: [Instruction, ...]} from `avr-objdump -d -r` output """
+    functions = {}
+    insns = None
+    for line in text.splitlines():
+        match = _FUNCTION.match(line)
+        if match:
+            insns = functions.setdefault(match.group(2), [])
+            continue
+        if insns is None:
+            continue
+        match = _RELOC.match(line)
+        if match and insns:
+            insns[-1].symbol = match.group(1)  # Unlinked object: the real call target
+            continue
+        match = _INSN.match(line)
+        if match:
+            address, raw, mnemonic, operands, comment = match.groups()
+            target, symbol = None, None
+            if comment:
+                found = _TARGET.search(comment)
+                if found:
+                    target, symbol = int(found.group(1), 16), found.group(2)
+            insns.append(Instruction(int(address, 16), len(raw.split()), mnemonic, operands, target, symbol))
+    return functions
+
+
+def _cycles(insn, taken=False):
+    if insn.mnemonic.startswith("br"):
+        return 2 if taken else 1
+    return _CYCLES.get(insn.mnemonic, 1)
+
+
+def _immediates(insns, index, limit=8):
+    """ Register values set by the ldi instructions just before insns[index] """
+    values = {}
+    for insn in reversed(insns[max(0, index - limit):index]):
+        if insn.mnemonic != "ldi":
+            break
+        register, _, value = insn.operands.partition(",")
+        values.setdefault(register.strip(), int(value.strip(), 0))
+    return values
+
+
+def _countdown(insns, head, tail):
+    """ Trip count of the loop insns[head..tail] if it is a busy-wait delay, else None """
+    body = insns[head:tail]
+    if insns[tail].mnemonic != "brne" or not body or any(insn.mnemonic not in _COUNTDOWN for insn in body):
+        return None
+    values = _immediates(insns, head)
+    registers = []
+    for insn in body:
+        register = _REGISTER.match(insn.operands).group(0)
+        registers.append(register)
+        if insn.mnemonic == "sbiw":
+            registers.append(f"r{int(register[1:]) + 1}")  # Word counter in a register pair
+    if any(register not in values for register in registers):
+        return None  # Counter not loaded with a constant (e.g. a variable delay)
+    count = sum(values[register] << (8 * index) for index, register in enumerate(registers))
+    return count or 1 << (8 * len(registers))
+
+
+class _Program:
+    """ Call graph and per-function costs of one disassembled image """
+
+    def __init__(self, functions, frames):
+        self.functions = {name: insns for name, insns in functions.items() if insns}
+        self.frames = frames
+        self.by_address = {insns[0].address: name for name, insns in self.functions.items()}
+        self.notes = []
+        self._stack = {}
+        self._cost = {}
+        self._delays = {}
+
+    def callee(self, insn, caller):
+        """ Function a call or an outgoing jump goes to, or None """
+        symbol = insn.symbol
+        if symbol and symbol.startswith(".text+"):
+            name = self.by_address.get(int(symbol[len(".text+"):], 0))
+        else:
+            name = symbol if symbol in self.functions else self.by_address.get(insn.target)
+        if name == caller and insn.mnemonic not in _CALLS:
+            return None  # A jump back to our own start is a loop, not a tail call
+        return name
+
+    def frame(self, name):
+        if name in self.frames:
+            size, qualifier = self.frames[name]
+            if "dynamic" in qualifier and "bounded" not in qualifier:
+                self.notes.append(f"{name}() has a dynamically sized frame (alloca / VLA)")
+                return None
+            return size
+        # No .su entry (library code): count its pushes
+        return sum(1 for insn in self.functions[name] if insn.mnemonic == "push")
+
+    def stack(self, name, visiting=()):
+        """ Worst-case stack bytes of name and everything it calls, None if unbounded """
+        if name in self._stack:
+            return self._stack[name]
+        if name in visiting:
+            self.notes.append(f"recursion through {name}()")
+            return None
+
+        worst = self.frame(name)
+        deepest = 0
+        for insn in self.functions[name]:
+            if insn.mnemonic in _INDIRECT:
+                self.notes.append(f"indirect call in {name}() at 0x{insn.address:04X}")
+                worst = None
+                continue
+            if insn.mnemonic not in _CALLS + _JUMPS:
+                continue
+            callee = self.callee(insn, name)
+            if callee is None:
+                continue
+            depth = self.stack(callee, visiting + (name,))
+            if depth is None:
+                worst = None
+                continue
+            deepest = max(deepest, depth + (CALL_BYTES if insn.mnemonic in _CALLS else 0))
+        self._stack[name] = None if worst is None else worst + deepest
+        return self._stack[name]
+
+    def delays(self, name):
+        """ {head index: (tail index, cycles)} of the delay loops in name """
+        if name not in self._delays:
+            insns = self.functions[name]
+            index_of = {insn.address: index for index, insn in enumerate(insns)}
+            loops = {}
+            for tail, insn in enumerate(insns):
+                head = index_of.get(insn.target)
+                if head is None or head >= tail:
+                    continue
+                count = _countdown(insns, head, tail)
+                if count is not None:
+                    per_iteration = sum(_cycles(body) for body in insns[head:tail]) + _cycles(insn, taken=True)
+                    loops[head] = (tail, count * per_iteration - 1)  # The last brne falls through
+            self._delays[name] = loops
+        return self._delays[name]
+
+    def range_cost(self, name, first, last, visiting=()):
+        """ (busy, delay) cycles of insns[first..last] of name run once, straight through """
+        insns = self.functions[name]
+        delays = self.delays(name)
+        index_of = {insn.address: index for index, insn in enumerate(insns)}
+        busy = delay = 0
+        index = first
+        while index <= last:
+            insn = insns[index]
+            if index in delays and delays[index][0] <= last:
+                index, cycles = delays[index]
+                delay += cycles
+                index += 1
+                continue
+            head = index_of.get(insn.target) if insn.mnemonic not in _CALLS else None
+            backward = head is not None and head < index
+            busy += _cycles(insn, taken=backward)
+            if backward and index != last:
+                self.notes.append(f"loop at 0x{insns[head].address:04X} in {name}() counted once")
+            if insn.mnemonic in _CALLS or (insn.mnemonic in _JUMPS and head is None):
+                callee = self.callee(insn, name)
+                if callee is not None:
+                    callee_busy, callee_delay = self.cost(callee, visiting + (name,))
+                    busy += callee_busy
+                    delay += callee_delay
+            index += 1
+        return busy, delay
+
+    def cost(self, name, visiting=()):
+        """ (busy, delay) cycles of one call of name """
+        if name in visiting:
+            return 0, 0  # Recursion: already noted by stack()
+        if name not in self._cost:
+            self._cost[name] = self.range_cost(name, 0, len(self.functions[name]) - 1, visiting)
+        return self._cost[name]
+
+    def main_loop(self, name):
+        """ (head, tail) indexes of the outermost endless loop of name, or None """
+        insns = self.functions[name]
+        index_of = {insn.address: index for index, insn in enumerate(insns)}
+        loops = [(index_of[insn.target], tail) for tail, insn in enumerate(insns)
+                 if insn.mnemonic in _JUMPS and index_of.get(insn.target, tail) < tail]
+        return min(loops) if loops else None
+
+
+def analyze(disassembly, stack_usage, entry="task", f_cpu=8000000):
+    """ Budget report of a task image from its disassembly and .su text.
+
+    stack is the worst-case bytes including the preemption context (None when
+    recursion, an indirect call or a dynamic frame makes it unbounded); cycles
+    are per iteration of the entry's endless loop (or one run of the entry if it
+    returns). notes lists everything that made the estimate inexact.
+    """
+    program = _Program(parse_disassembly(disassembly), parse_stack_usage(stack_usage))
+    if entry not in program.functions:
+        raise ValueError(f"{entry}() not found in the disassembly")
+
+    stack = program.stack(entry)
+    loop = program.main_loop(entry)
+    if loop:
+        setup = program.range_cost(entry, 0, loop[0] - 1)
+        busy, delay = program.range_cost(entry, loop[0], loop[1])
+    else:
+        setup = (0, 0)
+        busy, delay = program.cost(entry)
+
+    return {
+        "entry": entry,
+        "f_cpu": f_cpu,
+        "stack": None if stack is None else stack + CONTEXT_BYTES,
+        "frames": {name: {"frame": program.frame(name), "worst": program.stack(name)}
+                   for name in sorted(program.functions)},
+        "setup_cycles": sum(setup),
+        "loop": loop is not None,
+        "busy_cycles": busy,
+        "delay_cycles": delay,
+        "loop_ms": (busy + delay) * 1000 / f_cpu,
+        "cpu_share": busy / (busy + delay) if busy + delay else 1.0,
+        "delays": [{"function": name, "address": program.functions[name][head].address,
+                    "cycles": cycles, "ms": cycles * 1000 / f_cpu}
+                   for name in sorted(program.functions) for head, (_, cycles) in program.delays(name).items()],
+        "notes": sorted(set(program.notes)),
+    }
+
+
+def check_budget(budget, priority, stack_budget=None, share_budget=None):
+    """ Raise ValueError if the task would overrun its stack or the CPU share of its priority """
+    stack_budget = stack_budget or STACK_BUDGET
+    if share_budget is None:
+        share_budget = CPU_SHARE_BUDGET.get(priority, min(CPU_SHARE_BUDGET.values()))
+
+    problems = []
+    if budget["stack"] is None:
+        problems.append("stack depth is unbounded (" + "; ".join(budget["notes"]) + ")")
+    elif budget["stack"] > stack_budget:
+        problems.append(f"needs {budget['stack']} bytes of stack, budget is {stack_budget}")
+    if budget["cpu_share"] > share_budget:
+        problems.append(f"spends {budget['cpu_share']:.0%} of each loop outside delays, "
+                        f"priority {priority} allows {share_budget:.0%}")
+    if problems:
+        raise ValueError("Task over budget: " + "; ".join(problems))
+
+
+def format_budget(budget):
+    """ Stack and cycle summary, one item per line """
+    stack = "unbounded" if budget["stack"] is None else f"{budget['stack']} bytes (incl. {CONTEXT_BYTES} context)"
+    lines = [f"stack: {stack}",
+             f"{'loop' if budget['loop'] else 'run'}: {budget['busy_cycles']} busy + {budget['delay_cycles']} "
+             f"delay cycles = {budget['loop_ms']:.3f} ms at {budget['f_cpu'] / 1e6:g} MHz, "
+             f"CPU share {budget['cpu_share']:.1%}"]
+    for name, frame in budget["frames"].items():
+        worst = "?" if frame["worst"] is None else frame["worst"]
+        lines.append(f"  {name}: frame {frame['frame']}, worst {worst}")
+    for delay in budget["delays"]:
+        lines.append(f"  delay in {delay['function']} at 0x{delay['address']:04X}: "
+                     f"{delay['cycles']} cycles ({delay['ms']:.3f} ms)")
+    for note in budget["notes"]:
+        lines.append(f"  note: {note}")
+    return "\n".join(lines)
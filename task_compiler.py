@@ -1,34 +1,344 @@
 import subprocess
 import os
 import platform
+import hashlib
+import re
+import shutil
+import threading
+import functools
+import time
+import argparse
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from task_upload import MAX_TASK_SIZE
+import task_budget
 
-def compile_task_file(c_path, output_dir=None):
+MCU = "atmega328p"
+DEFAULT_F_CPU = "8000000UL"
+ENTRY_SYMBOL = "task"  # The RTOS jumps to the first byte of the image, which must be this function
+
+# Build profiles. "compat" is the object-only build of compile_task.bat: the image
+# is the raw .text of one .o. The linked profiles let the linker drop unused
+# functions/data (-ffunction-sections/-fdata-sections + --gc-sections), inline
+# across the file (LTO) and, for "size", shorten calls and jumps (-mrelax) and
+# share register save/restore code (-mcall-prologues).
+BUILD_PROFILES = {
+    "compat": {"cflags": ["-Os"], "link": False},
+    "size": {"cflags": ["-Os", "-ffunction-sections", "-fdata-sections", "-flto", "-mrelax", "-mcall-prologues"],
+             "link": True},
+    "speed": {"cflags": ["-O2", "-ffunction-sections", "-fdata-sections", "-flto"], "link": True},
+}
+LINK_FLAGS = ["-nostartfiles", "-Wl,--gc-sections", f"-Wl,-e,{ENTRY_SYMBOL}", f"-Wl,--undefined={ENTRY_SYMBOL}"]
+# compat stays the default: the linked profiles need task() to come first in the image (opt in with --profile)
+DEFAULT_PROFILE = os.environ.get("RTOS_BUILD_PROFILE", "compat")
+
+# Sections that are not part of the uploaded image and not worth reporting
+_NON_IMAGE_SECTIONS = (".comment", ".debug", ".note", ".stab", ".gnu", ".eeprom")
+
+# Compiled images are cached on disk by content hash, oldest entries are evicted first
+CACHE_DIR = os.environ.get("RTOS_TASK_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "rtos-task-cache"))
+CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]', re.MULTILINE)
+F_CPU_PATTERN = re.compile(r'^\s*#\s*define\s+F_CPU\s+(\S+)', re.MULTILINE)
+
+_cache_lock = threading.Lock()
+_cache_counters = {"hits": 0, "misses": 0}
+
+
+def find_toolchain():
+    """ Return the (avr-gcc, avr-objcopy) paths for this platform """
     if platform.system() == "Linux":
         avr_gcc_path = "/usr/bin/avr-gcc"
     else:
         avr_gcc_path = "C:/avr-gcc-14.1.0-x64-windows/bin/avr-gcc.exe"
+    return avr_gcc_path, toolchain_tool(avr_gcc_path, "objcopy")
+
+
+def toolchain_tool(avr_gcc_path, tool):
+    """ Path of another binutils tool (objcopy, size, nm) next to avr-gcc """
+    return os.path.join(os.path.dirname(avr_gcc_path),
+                        os.path.basename(avr_gcc_path).replace("avr-gcc", f"avr-{tool}"))
+
+
+@functools.lru_cache(maxsize=None)
+def toolchain_version(avr_gcc_path):
+    """ First line of `avr-gcc --version`, looked up once per process """
+    result = subprocess.run([avr_gcc_path, "--version"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not run {avr_gcc_path}:\n{result.stderr}")
+    return result.stdout.splitlines()[0] if result.stdout else ""
+
+
+def read_f_cpu(source):
+    """ F_CPU defined in the source text, or the default used by compile_task.bat """
+    match = F_CPU_PATTERN.search(source)
+    return match.group(1) if match else DEFAULT_F_CPU
+
+
+def include_closure(c_path, include_dirs=()):
+    """ Resolve the local #include "..." files of c_path, recursively.
+
+    Returns a sorted list of absolute paths. System headers (<...>) are left out;
+    they are covered by the toolchain version.
+    """
+    found = set()
+    pending = [os.path.abspath(c_path)]
+    while pending:
+        path = pending.pop()
+        with open(path, "r", errors="ignore") as file:
+            text = file.read()
+        for kind, name in INCLUDE_PATTERN.findall(text):
+            if kind != '"':
+                continue
+            for base in (os.path.dirname(path),) + tuple(include_dirs):
+                candidate = os.path.abspath(os.path.join(base, name))
+                if os.path.isfile(candidate):
+                    if candidate not in found:
+                        found.add(candidate)
+                        pending.append(candidate)
+                    break
+    return sorted(found)
+
+
+def cache_key(c_path, flags, mmcu, avr_gcc_path, include_dirs=()):
+    """ Hash of the source, its include closure, flags, MCU, F_CPU and toolchain version """
+    with open(c_path, "rb") as file:
+        source = file.read()
+
+    digest = hashlib.sha256()
+    digest.update(source)
+    for path in include_closure(c_path, include_dirs):
+        with open(path, "rb") as file:
+            digest.update(path.encode() + b"\0" + hashlib.sha256(file.read()).digest())
+    digest.update("\0".join(flags).encode())
+    digest.update(mmcu.encode() + b"\0")
+    digest.update(read_f_cpu(source.decode("utf-8", errors="ignore")).encode() + b"\0")
+    digest.update(toolchain_version(avr_gcc_path).encode())
+    return digest.hexdigest()
+
+
+def cache_stats(cache_dir=None):
+    """ Hit/miss counters for this process plus the size of the on-disk cache """
+    cache_dir = cache_dir or CACHE_DIR
+    entries = _cache_entries(cache_dir)
+    with _cache_lock:
+        stats = dict(_cache_counters)
+    stats["entries"] = len(entries)
+    stats["bytes"] = sum(size for _, size, _ in entries)
+    return stats
+
+
+def clear_cache(cache_dir=None):
+    """ Remove every cached image """
+    for path, _, _ in _cache_entries(cache_dir or CACHE_DIR):
+        _cache_remove(path)
+
+
+def _cache_remove(bin_path):
+    """ Remove a cached image and its size report """
+    for path in (bin_path, os.path.splitext(bin_path)[0] + ".json"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _cache_entries(cache_dir):
+    """ (.bin path, bytes, mtime) per cached key, its size report counted with the image """
+    keys = {}
+    if not os.path.isdir(cache_dir):
+        return []
+    for name in os.listdir(cache_dir):
+        key, extension = os.path.splitext(name)
+        if extension not in (".bin", ".json"):
+            continue
+        try:
+            st = os.stat(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            continue  # Evicted by another process meanwhile
+        size, mtime = keys.get(key, (0, 0.0))
+        keys[key] = (size + st.st_size, max(mtime, st.st_mtime))  # Hits refresh the .bin's mtime
+    return [(os.path.join(cache_dir, key + ".bin"), size, mtime) for key, (size, mtime) in keys.items()]
+
+
+def _cache_store(cache_dir, key, bin_file, max_bytes, report=None):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = os.path.join(cache_dir, f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+    if report is not None:
+        with open(tmp_path, "w") as file:
+            json.dump({key: report[key] for key in ("sections", "symbols", "budget") if key in report}, file)
+        os.replace(tmp_path, os.path.join(cache_dir, key + ".json"))
+    shutil.copyfile(bin_file, tmp_path)
+    os.replace(tmp_path, os.path.join(cache_dir, key + ".bin"))  # Atomic for concurrent compiles
+
+    # Evict least recently used entries (hits refresh the mtime)
+    entries = sorted(_cache_entries(cache_dir), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    for path, size, _ in entries:
+        if total <= max_bytes:
+            break
+        _cache_remove(path)
+        total -= size
+
+
+def section_sizes(size_path, target):
+    """ {section: bytes} of an object/ELF file from `avr-size -A` """
+    result = subprocess.run([size_path, "-A", target], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"avr-size error:\n{result.stderr}")
+    sections = {}
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].startswith(".") and parts[1].isdigit():
+            if not parts[0].startswith(_NON_IMAGE_SECTIONS):
+                sections[parts[0]] = int(parts[1])
+    return sections
+
+
+def symbol_sizes(nm_path, target):
+    """ Sized symbols of an object/ELF file from `avr-nm`, largest first """
+    result = subprocess.run([nm_path, "--size-sort", "--reverse-sort", "-S", "-t", "d", target],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"avr-nm error:\n{result.stderr}")
+    symbols = []
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) == 4 and parts[0].isdigit() and parts[1].isdigit():
+            symbols.append({"name": parts[3], "size": int(parts[1]), "type": parts[2], "address": int(parts[0])})
+    return symbols
+
+
+def format_size_report(report, top=10):
+    """ Image size, sections and the largest symbols, one per line """
+    lines = [f"{os.path.basename(report['source'])}: {report['size']} bytes ({report['profile']} profile, "
+             f"limit {MAX_TASK_SIZE})"]
+    if report["sections"]:
+        lines.append("  sections: " + ", ".join(f"{name} {size}" for name, size in report["sections"].items()))
+    for symbol in report["symbols"][:top]:
+        lines.append(f"  {symbol['size']:6d}  {symbol['type']}  {symbol['name']}")
+    return "\n".join(lines)
+
+
+def stack_usage(avr_gcc_path, c_path, cflags, f_cpu):
+    """ -fstack-usage (.su) text of c_path, from a separate compile of it to an object.
+
+    LTO is left out so the frames belong to the source's own functions.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cmd = [avr_gcc_path, f"-mmcu={MCU}", *[flag for flag in cflags if flag != "-flto"], "-fstack-usage",
+               f"-DF_CPU={f_cpu}", "-c", "-o", os.path.join(tmp_dir, "stack.o"), os.path.abspath(c_path)]
+        result = subprocess.run(cmd, capture_output=True, text=True, cwd=tmp_dir)
+        if result.returncode != 0:
+            raise RuntimeError(f"Stack usage build error:\n{result.stderr}")
+        text = ""
+        for name in os.listdir(tmp_dir):  # stack.su, or <source>.su from older compilers
+            if name.endswith(".su"):
+                with open(os.path.join(tmp_dir, name)) as file:
+                    text += file.read()
+        return text
+
+
+def analyze_budget(avr_gcc_path, c_path, target, cflags, f_cpu):
+    """ Stack / cycle budget of a built target (see task_budget) """
+    result = subprocess.run([toolchain_tool(avr_gcc_path, "objdump"), "-d", "-r", target],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"avr-objdump error:\n{result.stderr}")
+    return task_budget.analyze(result.stdout, stack_usage(avr_gcc_path, c_path, cflags, f_cpu),
+                               ENTRY_SYMBOL, task_budget.parse_f_cpu(f_cpu))
+
+
+def _check_size(report):
+    if report["size"] > MAX_TASK_SIZE:
+        largest = ", ".join(f"{symbol['name']} {symbol['size']} B" for symbol in report["symbols"][:3])
+        raise ValueError(f"{os.path.basename(report['source'])}: {report['size']}-byte image exceeds the "
+                         f"{MAX_TASK_SIZE}-byte task limit" + (f" (largest: {largest})" if largest else ""))
+
+
+def build_task(c_path, output_dir=None, profile=None, use_cache=True, cache_dir=None, cache_max_bytes=None,
+               check_size=True, flash_address=None, budget=False, priority=None):
+    """ Compile a task source with a build profile and report its size.
+
+    Returns {"source", "bin", "size", "profile", "flash_address", "sections",
+    "symbols"}; sections and symbols come from avr-size / avr-nm. With
+    check_size, an image over the 512-byte task limit raises ValueError here
+    instead of failing at upload. flash_address links the image to run in place
+    at that flash address (see flash_alloc); by default it is linked at 0.
+    budget adds a "budget" stack/cycle report (see task_budget); with a priority
+    it is also checked, and a task over its budget raises ValueError.
+    """
+    if profile is None:
+        profile = DEFAULT_PROFILE
+        if flash_address and not BUILD_PROFILES.get(profile, {}).get("link"):
+            profile = "size"  # Placed images have to be linked, which the compat build isn't
+    if profile not in BUILD_PROFILES:
+        raise ValueError(f"Unknown build profile '{profile}' (choose from {', '.join(BUILD_PROFILES)})")
+    settings = BUILD_PROFILES[profile]
+    if flash_address and not settings["link"]:
+        raise ValueError("The compat profile builds unlinked objects; use size or speed to link at an address")
+    avr_gcc_path, objcopy_path = find_toolchain()
 
     base_name = os.path.splitext(os.path.basename(c_path))[0]
+    if flash_address:
+        base_name += f"-{flash_address:04X}"  # Placed builds of one source can coexist
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
     output_dir = output_dir or os.path.dirname(c_path)
-    obj_file = os.path.join(output_dir, base_name + ".o")
+    target = os.path.join(output_dir, base_name + (".elf" if settings["link"] else ".o"))
     bin_file = os.path.join(output_dir, base_name + ".bin")
+    report = {"source": c_path, "bin": bin_file, "size": None, "profile": profile,
+              "flash_address": flash_address or 0, "sections": {}, "symbols": []}
+    budget = budget or priority is not None
+    flags = settings["cflags"] + (LINK_FLAGS if settings["link"] else ["-c"])
+    if flash_address:
+        flags = flags + [f"-Wl,-Ttext=0x{flash_address:X}"]
+
+    cache_dir = cache_dir or CACHE_DIR
+    key = None
+    if use_cache:
+        key = cache_key(c_path, flags, MCU, avr_gcc_path)
+        cached = os.path.join(cache_dir, key + ".bin")
+        if os.path.isfile(cached):
+            try:
+                with open(os.path.join(cache_dir, key + ".json")) as file:
+                    report.update(json.load(file))
+            except (OSError, ValueError):
+                pass  # Image cached before size reports existed
+        if os.path.isfile(cached) and (not budget or "budget" in report):
+            os.utime(cached)  # Mark as recently used
+            if os.path.abspath(cached) != os.path.abspath(bin_file):
+                shutil.copyfile(cached, bin_file)
+            with _cache_lock:
+                _cache_counters["hits"] += 1
+            report["size"] = os.path.getsize(bin_file)
+            _check_report(report, check_size, priority)
+            return report
+        with _cache_lock:
+            _cache_counters["misses"] += 1
+
+    with open(c_path, "r", errors="ignore") as file:
+        f_cpu = read_f_cpu(file.read())
 
-    # Step 1: Compile .c to .o (no linking)
+    # Step 1: Compile .c to .o (compat), or compile and link to an .elf that starts at the entry function
     compile_cmd = [
         avr_gcc_path,
-        "-mmcu=atmega328p",
-        "-Os",
-        "-c",            # Compile only, no linking
-        "-o", obj_file,
+        f"-mmcu={MCU}",
+        *flags,
+        f"-DF_CPU={f_cpu}",
+        "-o", target,
         c_path
     ]
 
-    # Step 2: Convert .o to .bin using objcopy
-    objcopy_path = avr_gcc_path.replace("avr-gcc.exe", "avr-objcopy.exe")
+    # Step 2: Convert to .bin using objcopy, without EEPROM contents (as compile_task.bat does)
     objcopy_cmd = [
         objcopy_path,
         "-O", "binary",
-        obj_file,
+        "-R", ".eeprom",
+        *(["-j", ".text", "-j", ".data"] if settings["link"] else []),
+        target,
         bin_file
     ]
 
@@ -40,4 +350,152 @@ def compile_task_file(c_path, output_dir=None):
     if result.returncode != 0:
         raise RuntimeError(f"Objcopy error:\n{result.stderr}")
 
-    return bin_file
+    report["sections"] = section_sizes(toolchain_tool(avr_gcc_path, "size"), target)
+    report["symbols"] = symbol_sizes(toolchain_tool(avr_gcc_path, "nm"), target)
+    report["size"] = os.path.getsize(bin_file)
+
+    if settings["link"]:
+        entry = next((symbol for symbol in report["symbols"] if symbol["name"] == ENTRY_SYMBOL), None)
+        if entry is None or entry["address"] != (flash_address or 0):
+            raise RuntimeError(f"{ENTRY_SYMBOL}() is not at the start of the image; "
+                               f"define it first in the file or use the compat profile")
+    if budget:
+        report["budget"] = analyze_budget(avr_gcc_path, c_path, target, settings["cflags"], f_cpu)
+
+    if key:
+        _cache_store(cache_dir, key, bin_file, cache_max_bytes or CACHE_MAX_BYTES, report)
+    _check_report(report, check_size, priority)
+    return report
+
+
+def _check_report(report, check_size, priority):
+    if check_size:
+        _check_size(report)
+    if priority is not None:
+        try:
+            task_budget.check_budget(report["budget"], priority)
+        except ValueError as e:
+            raise ValueError(f"{os.path.basename(report['source'])}: {e}")
+
+
+def compile_task_file(c_path, output_dir=None, use_cache=True, cache_dir=None, cache_max_bytes=None, profile=None,
+                      priority=None):
+    """ Compile a task source and return the .bin path (see build_task; priority checks the budget) """
+    return build_task(c_path, output_dir, profile, use_cache, cache_dir, cache_max_bytes, priority=priority)["bin"]
+
+
+def find_task_sources(directory, recursive=True):
+    """ All .c files under directory, sorted """
+    sources = []
+    for root_dir, dirs, files in os.walk(directory):
+        sources.extend(os.path.join(root_dir, name) for name in files if name.endswith(".c"))
+        if not recursive:
+            break
+    return sorted(sources)
+
+
+def _compile_one(c_path, output_dir, use_cache, profile=None, budget=False, priority=None):
+    """ Compile one file and describe the outcome instead of raising """
+    entry = {"source": c_path, "bin": None, "size": None, "seconds": 0.0, "error": None, "oversize": False,
+             "over_budget": None, "profile": profile or DEFAULT_PROFILE, "sections": {}, "symbols": []}
+    start_time = time.perf_counter()
+    try:
+        entry.update(build_task(c_path, output_dir, profile, use_cache=use_cache, check_size=False,
+                                budget=budget or priority is not None))
+        entry["oversize"] = entry["size"] > MAX_TASK_SIZE
+    except Exception as e:
+        entry["error"] = str(e)
+    if priority is not None and not entry["error"]:
+        try:
+            task_budget.check_budget(entry["budget"], priority)
+        except ValueError as e:
+            entry["over_budget"] = str(e)
+    entry["seconds"] = time.perf_counter() - start_time
+    return entry
+
+
+def compile_task_dir(directory, output_dir=None, jobs=None, recursive=True, use_cache=True, profile=None,
+                     budget=False, priority=None):
+    """ Compile every .c file under directory concurrently.
+
+    Runs on a thread pool sized to the core count (each job waits on avr-gcc
+    subprocesses). Returns a dict with one entry per source (bin path, size,
+    seconds, error, section/symbol sizes) and totals; images over the 512-byte
+    task limit are flagged as oversize, and with a priority tasks over its
+    stack/CPU budget as over_budget. With output_dir the source tree is
+    mirrored below it, so a/blink.c and b/blink.c don't overwrite each other.
+    """
+    sources = find_task_sources(directory, recursive)
+    jobs = jobs or os.cpu_count() or 1
+    start_time = time.perf_counter()
+
+    def output_for(path):
+        if not output_dir:
+            return None
+        return os.path.normpath(os.path.join(output_dir, os.path.relpath(os.path.dirname(path), directory)))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        files = list(pool.map(lambda path: _compile_one(path, output_for(path), use_cache, profile, budget, priority),
+                              sources))
+
+    return {
+        "files": files,
+        "compiled": sum(1 for entry in files if not entry["error"]),
+        "failed": sum(1 for entry in files if entry["error"]),
+        "oversize": sum(1 for entry in files if entry["oversize"]),
+        "over_budget": sum(1 for entry in files if entry["over_budget"]),
+        "jobs": jobs,
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile RTOS task sources (.c) to .bin images")
+    parser.add_argument("path", help="a .c file or a directory of task sources")
+    parser.add_argument("-o", "--output-dir", help="write .o/.bin here instead of next to each source")
+    parser.add_argument("-j", "--jobs", type=int, help="parallel compiles (default: core count)")
+    parser.add_argument("--no-recursive", action="store_true", help="only compile the top-level directory")
+    parser.add_argument("--no-cache", action="store_true", help="always run avr-gcc")
+    parser.add_argument("--profile", choices=sorted(BUILD_PROFILES), default=DEFAULT_PROFILE,
+                        help=f"build profile (default: {DEFAULT_PROFILE}, or $RTOS_BUILD_PROFILE)")
+    parser.add_argument("--size-report", action="store_true", help="print section and symbol sizes per image")
+    parser.add_argument("--budget", action="store_true", help="print worst-case stack and cycles per loop")
+    parser.add_argument("--priority", type=int, help="reject tasks over the stack/CPU budget of this priority")
+    parser.add_argument("--json", action="store_true", help="print the structured result as JSON")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.path):
+        report = compile_task_dir(args.path, args.output_dir, args.jobs, recursive=not args.no_recursive,
+                                  use_cache=not args.no_cache, profile=args.profile, budget=args.budget,
+                                  priority=args.priority)
+    else:
+        start_time = time.perf_counter()
+        entry = _compile_one(args.path, args.output_dir, not args.no_cache, args.profile, args.budget, args.priority)
+        report = {"files": [entry], "compiled": int(not entry["error"]), "failed": int(bool(entry["error"])),
+                  "oversize": int(entry["oversize"]), "over_budget": int(bool(entry["over_budget"])), "jobs": 1,
+                  "seconds": time.perf_counter() - start_time}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for entry in report["files"]:
+            if entry["error"]:
+                print(f"FAIL  {entry['source']} ({entry['seconds']:.2f}s)\n{entry['error']}")
+            else:
+                flag = f"  exceeds {MAX_TASK_SIZE}-byte limit" if entry["oversize"] else ""
+                print(f"OK    {entry['source']} -> {entry['size']} bytes ({entry['seconds']:.2f}s){flag}")
+                if args.size_report:
+                    print("\n".join("      " + line for line in format_size_report(entry).splitlines()[1:]))
+                if entry.get("budget") and (args.budget or entry["over_budget"]):
+                    budget_lines = task_budget.format_budget(entry["budget"]).splitlines()
+                    print("\n".join("      " + line for line in budget_lines))
+                if entry["over_budget"]:
+                    print(f"      {entry['over_budget']}")
+        print(f"{report['compiled']} compiled, {report['failed']} failed, {report['oversize']} oversize, "
+              f"{report['over_budget']} over budget in {report['seconds']:.2f}s with {report['jobs']} jobs")
+
+    return 1 if report["failed"] or report["oversize"] or report["over_budget"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
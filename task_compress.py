@@ -0,0 +1,235 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+from task_upload import MAX_TASK_SIZE, TASK_HEADER_SIZE
+
+# ---------------- Compressed Task Upload ---------------- #
+#
+# Optional LZSS compression of task images for slow links. The format is chosen
+# for the ATMega328P end: decoding is a byte loop with no tables, and a match
+# only reaches WINDOW_SIZE bytes back, so a board that writes flash page by page
+# needs just a 256-byte ring buffer indexed by a uint8_t.
+#
+# Stream: a flag byte announces the next 8 tokens, LSB first. Bit 1 is a literal
+# byte; bit 0 is a 2-byte match: distance - 1 (1..256 bytes back), then
+# length - MIN_MATCH (3..258 bytes). A match may overlap what it produces (runs).
+#
+# On the wire a compressed upload sets COMPRESSED_FLAG in the TaskHeader Status
+# byte and the payload starts with the original image size (LE16). Size stays
+# the length of the payload actually sent, since the <TASK:> parser and the
+# framed upload's END CRC go by it. The board decodes, then stores the header
+# with the original Size and the flag cleared, so <LIST>, CRCs and manifests
+# see the plain image. pack() only compresses when that makes the upload smaller.
+#
+#   python task_compress.py task_files/*.bin    # ratio / speed / wire time per image
+
+WINDOW_SIZE = 256
+MIN_MATCH = 3
+MAX_MATCH = MIN_MATCH + 255
+COMPRESSED_FLAG = 0x80  # TaskHeader Status bit
+SIZE_PREFIX = 2
+
+
+def compress(image):
+    """ LZSS stream of image (greedy longest match within the window) """
+    image = bytes(image)
+    out = bytearray()
+    chains = {}  # 3-byte prefix -> positions it starts at, oldest first
+    flags_at = None
+    bit = 8
+    pos = 0
+    while pos < len(image):
+        if bit == 8:
+            flags_at = len(out)
+            out.append(0)
+            bit = 0
+
+        best_length, best_distance = 0, 0
+        key = image[pos:pos + MIN_MATCH]
+        limit = min(MAX_MATCH, len(image) - pos)
+        for start in reversed(chains.get(key, ())):
+            distance = pos - start
+            if distance > WINDOW_SIZE:
+                break
+            length = MIN_MATCH
+            while length < limit and image[start + length] == image[pos + length]:
+                length += 1
+            if length > best_length:
+                best_length, best_distance = length, distance
+                if length == limit:
+                    break
+
+        if best_length >= MIN_MATCH:
+            out += bytes([best_distance - 1, best_length - MIN_MATCH])
+            step = best_length
+        else:
+            out[flags_at] |= 1 << bit
+            out.append(image[pos])
+            step = 1
+        bit += 1
+
+        for index in range(pos, pos + step):
+            if index + MIN_MATCH <= len(image):
+                chains.setdefault(image[index:index + MIN_MATCH], []).append(index)
+        pos += step
+    return bytes(out)
+
+
+def decompress(stream, size):
+    """ Reference decoder, written the way the firmware does it: one token at a time,
+    matches copied byte by byte from what is already decoded. ValueError if the
+    stream is corrupt or doesn't decode to exactly size bytes.
+    """
+    out = bytearray()
+    pos = 0
+    flags = 0
+    bits = 0
+    try:
+        while len(out) < size:
+            if bits == 0:
+                flags = stream[pos]
+                pos += 1
+                bits = 8
+            if flags & 1:
+                out.append(stream[pos])
+                pos += 1
+            else:
+                distance = stream[pos] + 1
+                length = stream[pos + 1] + MIN_MATCH
+                pos += 2
+                if distance > len(out) or len(out) + length > size:
+                    raise ValueError(f"Bad match at byte {len(out)} of the image")
+                for _ in range(length):
+                    out.append(out[-distance])
+            flags >>= 1
+            bits -= 1
+    except IndexError:
+        raise ValueError("Compressed image is truncated")
+    if pos != len(stream):
+        raise ValueError(f"{len(stream) - pos} bytes after the end of the compressed image")
+    return bytes(out)
+
+
+def pack(image):
+    """ (payload, compressed): size prefix + LZSS stream if that is shorter than image, else image as is """
+    payload = len(image).to_bytes(SIZE_PREFIX, "little") + compress(image)
+    if len(payload) < len(image):
+        return payload, True
+    return bytes(image), False
+
+
+def unpack_task(header, payload):
+    """ (header, image) as the board stores an upload: compressed payloads are decoded and the
+    header gets the original Size with COMPRESSED_FLAG cleared. ValueError if it doesn't decode.
+    """
+    if len(header) != TASK_HEADER_SIZE or not header[5] & COMPRESSED_FLAG:
+        return header, payload
+    if len(payload) < SIZE_PREFIX:
+        raise ValueError("Compressed image is truncated")
+    size = int.from_bytes(payload[:SIZE_PREFIX], "little")
+    if size > MAX_TASK_SIZE:
+        raise ValueError(f"Decompressed size {size} exceeds the {MAX_TASK_SIZE}-byte task limit")
+    image = decompress(payload[SIZE_PREFIX:], size)
+    header = bytes(header[:3]) + size.to_bytes(2, "little") + bytes([header[5] & ~COMPRESSED_FLAG]) + \
+        bytes(header[6:])
+    return header, image
+
+
+# ---------------- Corpus Benchmark ---------------- #
+
+def _rate(size, seconds, repeat):
+    return size * repeat / seconds if seconds else 0.0
+
+
+def measure(image, baud_rate=9600, repeat=20):
+    """ Ratio, encode / decode bytes per second and the <TASK:> wire time saved at baud_rate for one image """
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        stream = compress(image)
+    encode = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        if decompress(stream, len(image)) != image:
+            raise RuntimeError("Round trip mismatch")
+    decode = time.perf_counter() - start_time
+
+    payload, compressed = pack(image)
+    framing = len(b"<TASK:>") + TASK_HEADER_SIZE
+    byte_time = 10 / baud_rate
+    return {
+        "size": len(image),
+        "compressed_size": SIZE_PREFIX + len(stream),
+        "ratio": (SIZE_PREFIX + len(stream)) / len(image) if image else 1.0,
+        "sent_compressed": compressed,
+        "encode_bytes_per_second": _rate(len(image), encode, repeat),
+        "decode_bytes_per_second": _rate(len(image), decode, repeat),
+        "raw_wire_seconds": (framing + len(image)) * byte_time,
+        "wire_seconds": (framing + len(payload)) * byte_time,
+    }
+
+
+def corpus(paths=None):
+    """ {name: image} of the given .bin / .c files and directories, default task_files.
+
+    .c sources are compiled (through the build cache) when avr-gcc is installed, and skipped otherwise.
+    """
+    from task_compiler import compile_task_file, find_toolchain
+    paths = paths or [os.path.join(os.path.dirname(os.path.abspath(__file__)), "task_files")]
+    compile_sources = os.path.exists(find_toolchain()[0])
+    images = {}
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(glob.glob(os.path.join(path, "*.bin")) + glob.glob(os.path.join(path, "*.c")))
+        else:
+            files = [path]
+        for file in files:
+            if file.endswith(".c") and not compile_sources:
+                continue
+            with open(compile_task_file(file) if file.endswith(".c") else file, "rb") as handle:
+                images[os.path.basename(file)] = handle.read()
+    return images
+
+
+def bench_corpus(images, baud_rate=9600, repeat=20):
+    """ measure() per image plus totals over the corpus """
+    results = {name: measure(image, baud_rate, repeat) for name, image in images.items()}
+    raw = sum(result["raw_wire_seconds"] for result in results.values())
+    sent = sum(result["wire_seconds"] for result in results.values())
+    return {"baud_rate": baud_rate, "images": results,
+            "raw_wire_seconds": raw, "wire_seconds": sent, "speedup": raw / sent if sent else 1.0}
+
+
+def format_corpus(report):
+    lines = [f"{'image':<20}{'size':>6}{'lz':>6}{'ratio':>7}{'enc kB/s':>10}{'dec kB/s':>10}"
+             f"{'wire @ ' + str(report['baud_rate']):>16}"]
+    for name, result in report["images"].items():
+        sent = "lz" if result["sent_compressed"] else "raw"
+        encode, decode = result["encode_bytes_per_second"] / 1000, result["decode_bytes_per_second"] / 1000
+        lines.append(f"{name:<20}{result['size']:>6}{result['compressed_size']:>6}{result['ratio']:>7.2f}"
+                     f"{encode:>10.0f}{decode:>10.0f}"
+                     f"{result['raw_wire_seconds'] * 1000:>8.0f} -> {result['wire_seconds'] * 1000:.0f} ms ({sent})")
+    lines.append(f"Total wire time {report['raw_wire_seconds']:.2f}s -> {report['wire_seconds']:.2f}s "
+                 f"({report['speedup']:.2f}x)")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compression ratio and speed of task images")
+    parser.add_argument("paths", nargs="*", help=".bin images or directories (default: task_files)")
+    parser.add_argument("-b", "--baud", type=int, default=9600, help="baud rate for the wire time (default 9600)")
+    args = parser.parse_args(argv)
+
+    images = corpus(args.paths)
+    if not images:
+        print("No .bin images found", file=sys.stderr)
+        return 1
+    print(format_corpus(bench_corpus(images, args.baud)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import json
+import os
+
+import rtos_client
+from rtos_parser import parse_task_list
+from task_upload import crc16
+
+# ---------------- Task Manifest & Sync ---------------- #
+#
+# A manifest describes the slots a board should end up with:
+#   {"tasks": [{"id": 2, "file": "blink.c", "type": 0, "priority": 1, "status": 1}, ...],
+#    "prune": true}
+# ("file" is a .c or .bin path relative to the manifest; "place": true links a
+# .c task for its flash region like upload --place; with "prune": true slots the
+# manifest doesn't mention are deleted, by default they are left alone.)
+#
+# sync() reads the board with one <LIST> and changes only what differs: a slot
+# whose image CRC (reported in LIST as CRC=0x....) and header fields match is
+# left alone, one with only other header fields gets an edit, anything else is
+# uploaded. Edits and deletes go out together as one <BATCH>. On firmware that
+# doesn't report a CRC the image can't be compared, so those slots are uploaded.
+# A failed upload doesn't stop the others; the sync is then reported as not
+# applied, with the error per slot.
+
+ACTIONS = ("keep", "upload", "edit", "delete")
+
+
+def load_manifest(path, check_budget=True):
+    """ Manifest entries with their images built (.c compiled through the cache); placed ones per board later """
+    with open(path) as file:
+        manifest = json.load(file)
+    base = os.path.dirname(os.path.abspath(path))
+
+    entries = []
+    seen = set()
+    for task in manifest.get("tasks", []):
+        entry = {"id": task["id"], "file": os.path.join(base, task["file"]), "type": task.get("type", 0),
+                 "priority": task.get("priority", 1), "status": task.get("status", 1),
+                 "place": bool(task.get("place")), "profile": task.get("profile"), "image": None}
+        rtos_client.check_task_id(entry["id"])
+        rtos_client.check_task_fields(entry["type"], entry["priority"], entry["status"])
+        if entry["id"] in seen:
+            raise ValueError(f"Task {entry['id']} appears twice in {path}")
+        seen.add(entry["id"])
+        if entry["place"] and not entry["file"].endswith(".c"):
+            raise ValueError(f"Task {entry['id']}: place needs a .c source")
+        if not entry["place"]:
+            entry["image"] = rtos_client.load_task_image(entry["file"], entry["profile"],
+                                                         entry["priority"] if check_budget else None)
+        entry["budget"] = check_budget
+        entries.append(entry)
+    return {"tasks": entries, "prune": manifest.get("prune", False)}
+
+
+def place_images(manifest, records):
+    """ Build the placed entries for the board described by records (its <LIST>) """
+    placed = [entry for entry in manifest["tasks"] if entry["place"]]
+    if not placed:
+        return manifest["tasks"]
+    from flash_alloc import FlashAllocator, build_placed_image
+
+    # Slots the sync will delete give their flash back
+    keep = {entry["id"] for entry in manifest["tasks"]} if manifest["prune"] else None
+    allocator = FlashAllocator.from_tasks(record for record in records if keep is None or record.id in keep)
+    entries = []
+    for entry in manifest["tasks"]:
+        if entry["place"]:
+            image, address = build_placed_image(entry["file"], entry["id"], allocator, entry["profile"],
+                                                entry["priority"] if entry["budget"] else None)
+            entry = dict(entry, image=image, address=address)
+        entries.append(entry)
+    return entries
+
+
+def plan_sync(entries, records, prune=False):
+    """ Minimal change list from desired entries (with images) to the board's TaskRecords.
+
+    Returns [{"action", "id", "reason", "entry"}] with one item per slot
+    involved, "keep" items included so a dry run shows the whole board.
+    """
+    current = {record.id: record for record in records}
+    plan = []
+    for entry in entries:
+        record = current.pop(entry["id"], None)
+        image = entry["image"]
+        address = entry.get("address", 0)
+        if record is None:
+            action, reason = "upload", "not on the board"
+        elif record.crc is None:
+            action, reason = "upload", "board doesn't report image CRCs"
+        elif record.crc != crc16(image) or record.size != len(image):
+            action, reason = "upload", f"image differs ({record.size} B CRC 0x{record.crc:04X} -> " \
+                                       f"{len(image)} B CRC 0x{crc16(image):04X})"
+        elif address and record.addr != address:
+            action, reason = "upload", f"placed at 0x{record.addr:04X}, wanted 0x{address:04X}"
+        else:
+            changed = [f"{field} {getattr(record, field)} -> {entry[field]}"
+                       for field in ("type", "priority", "status") if getattr(record, field) != entry[field]]
+            action, reason = ("edit", ", ".join(changed)) if changed else ("keep", "up to date")
+        plan.append({"action": action, "id": entry["id"], "reason": reason, "entry": entry})
+
+    for record in sorted(current.values(), key=lambda record: record.id):
+        if prune:
+            plan.append({"action": "delete", "id": record.id, "reason": "not in the manifest", "entry": None})
+        else:
+            plan.append({"action": "keep", "id": record.id, "reason": "not in the manifest (prune off)",
+                         "entry": None})
+    return sorted(plan, key=lambda item: item["id"])
+
+
+def sync(ser, manifest, dry_run=False, framed=False, compress=False):
+    """ Bring the board to the manifest with the fewest commands: one <LIST>, one <BATCH> for the
+    edits and deletes, one upload per changed image. Returns {"plan", "results", "applied",
+    "dry_run", "failed"}; applied is False if an upload failed (failed lists those task ids).
+    """
+    records = parse_task_list(rtos_client.list_tasks(ser))
+    plan = plan_sync(place_images(manifest, records), records, manifest["prune"])
+    results = []
+    failed = []
+    if dry_run:
+        return {"plan": plan, "results": results, "applied": False, "dry_run": True, "failed": failed}
+
+    batch = []
+    for item in plan:
+        entry = item["entry"]
+        if item["action"] == "delete":
+            batch.append(("delete", item["id"]))
+        elif item["action"] == "edit":
+            batch.append(("edit", item["id"], entry["type"], entry["priority"], entry["status"]))
+    if batch:
+        result = rtos_client.batch_tasks(ser, batch)
+        if not result["applied"]:
+            raise RuntimeError(f"Sync stopped, batch not applied: {result['error']}")
+        results += rtos_client.format_batch_result(result)
+
+    for item in plan:
+        if item["action"] != "upload":
+            continue
+        entry = item["entry"]
+        try:
+            reply = rtos_client.upload_task_image(ser, entry["id"], entry["type"], entry["priority"], entry["image"],
+                                                  framed, entry["status"], entry.get("address", 0), compress)
+        except (RuntimeError, ValueError) as e:
+            failed.append(entry["id"])
+            results.append(f"upload {entry['id']} failed: {e}")
+            continue
+        results.append(f"upload {entry['id']}: {len(entry['image'])} bytes" +
+                       ("" if isinstance(reply, dict) else f", {'; '.join(reply)}"))
+    return {"plan": plan, "results": results, "applied": not failed, "dry_run": False, "failed": failed}
+
+
+def format_plan(plan):
+    """ One line per slot plus a summary, e.g. for a dry run """
+    lines = []
+    for item in plan:
+        name = os.path.basename(item["entry"]["file"]) if item["entry"] else ""
+        lines.append(f"{item['action']:<7} {item['id']}  {name:<16} {item['reason']}")
+    counts = {action: sum(1 for item in plan if item["action"] == action) for action in ACTIONS}
+    lines.append(", ".join(f"{count} {action}" for action, count in counts.items()))
+    return lines
+
+
+def format_sync(report):
+    lines = format_plan(report["plan"])
+    if report["dry_run"]:
+        lines.append("Dry run, nothing sent")
+    lines += report["results"]
+    if report["failed"]:
+        lines.append(f"Sync incomplete: {len(report['failed'])} upload(s) failed")
+    return lines
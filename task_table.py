@@ -0,0 +1,171 @@
+import re
+import time
+
+from rtos_client import TASK_SLOTS
+from rtos_parser import parse_lines, TaskRecord
+
+# ---------------- Task Table ---------------- #
+#
+# In-memory copy of the board's 10 TaskHeader slots, so views (status panel,
+# edit dialog) read from memory instead of sending <LIST>/<INFO:x> each time.
+# The table is only marked stale by our own UPLOAD/EDIT/DELETE commands, by a
+# reconnect, or by a device event seen in the task output; whoever owns the
+# port then refreshes it with one <LIST> in the background.
+
+# Unsolicited lines that mean the slot table changed behind our back
+DEVICE_EVENT = re.compile(r"Task \d+ (stored|updated|deleted)|All tasks deleted"
+                          r"|RTOS (start|ready|boot)|\b(reset|reboot)\b", re.IGNORECASE)
+
+
+class TaskTable:
+    """ Cached slot table: slot index -> TaskRecord (id, type, priority, size, status, addr) or None """
+
+    def __init__(self, slots=TASK_SLOTS):
+        self.slots = [None] * slots
+        self.stale = True        # Nothing loaded yet
+        self.loaded_at = None    # time.monotonic() of the last full refresh
+        self.generation = 0      # Bumped by every invalidation
+        self._listeners = []
+
+    def subscribe(self, callback):
+        """ Call callback(table) after every change """
+        self._listeners.append(callback)
+
+    def _changed(self):
+        for callback in self._listeners:
+            callback(self)
+
+    # ---- reads ---- #
+
+    def get(self, task_id):
+        """ Cached task with this ID, or None """
+        for task in self.slots:
+            if task and task.id == task_id:
+                return task
+        return None
+
+    def tasks(self):
+        return [task for task in self.slots if task]
+
+    def running(self):
+        return [task for task in self.slots if task and task.status == 1]
+
+    # ---- updates ---- #
+
+    def invalidate(self):
+        """ Mark the table as needing a <LIST> refresh """
+        self.generation += 1
+        if not self.stale:
+            self.stale = True
+            self._changed()
+
+    def load_list(self, lines, generation=None):
+        """ Replace the table with a <LIST> reply; returns False if the reply isn't a task list.
+
+        generation is self.generation when the <LIST> was sent: if the table was
+        invalidated since, the reply may predate the change and the table stays stale.
+        """
+        if not any(line.startswith("List of Tasks") or line.startswith("No stored tasks") for line in lines):
+            return False
+
+        slots = [None] * len(self.slots)
+        for record in parse_lines(lines):
+            if isinstance(record, TaskRecord) and record.slot is not None and record.slot < len(slots):
+                slots[record.slot] = record
+        self.slots = slots
+        self.stale = generation is not None and generation != self.generation
+        self.loaded_at = time.monotonic()
+        self._changed()
+        return True
+
+    def apply_info(self, task_id, record):
+        """ Record an <INFO:x> reply (None means the task doesn't exist) """
+        index = self._index(task_id)
+        if record:
+            if index is None:
+                index = self._free_index()
+            if index is None:
+                self.invalidate()
+                return
+            record.slot = index
+            self.slots[index] = record
+        elif index is not None:
+            self.slots[index] = None
+        self._changed()
+
+    def apply_edit(self, task_id, task_type, priority, status, reply):
+        """ Apply a confirmed <EDIT:...> locally instead of re-reading the board """
+        task = self.get(task_id)
+        if task is None or not _confirmed(reply, task_id, "updated"):
+            self.invalidate()
+            return
+        task.type, task.priority, task.status = task_type, priority, status
+        self._changed()
+
+    def apply_delete(self, task_id, reply):
+        """ Apply a confirmed <DELETE:x> (task_id None: <DELETE> of every task) """
+        if task_id is None:
+            if any("All tasks deleted" in line for line in reply):
+                self.slots = [None] * len(self.slots)
+                self._changed()
+            else:
+                self.invalidate()
+            return
+
+        index = self._index(task_id)
+        if index is not None and _confirmed(reply, task_id, "deleted"):
+            self.slots[index] = None
+            self._changed()
+        else:
+            self.invalidate()
+
+    def apply_batch(self, items, result):
+        """ Apply the confirmed items of a <BATCH> (rtos_client.batch_tasks) locally """
+        for (op, task_id, *fields), outcome in zip(items, result["items"]):
+            index = self._index(task_id)
+            if outcome["reply"] is None or (outcome["ok"] and index is None):
+                self.invalidate()  # Outcome unknown
+                return
+            if not outcome["ok"]:
+                continue
+            if op == "delete":
+                self.slots[index] = None
+            elif op == "edit":
+                task = self.slots[index]
+                task.type, task.priority, task.status = fields
+            else:
+                self.slots[index].status = fields[0]
+        self._changed()
+
+    def apply_upload(self):
+        """ An upload changes a slot the board assigns (and its flash address), so re-read it """
+        self.invalidate()
+
+    def on_device_line(self, line):
+        """ Feed unsolicited task output; returns True if it invalidated the table """
+        if DEVICE_EVENT.search(line):
+            self.invalidate()
+            return True
+        return False
+
+    def _index(self, task_id):
+        for index, task in enumerate(self.slots):
+            if task and task.id == task_id:
+                return index
+        return None
+
+    def _free_index(self):
+        for index, task in enumerate(self.slots):
+            if task is None:
+                return index
+        return None
+
+
+def format_task(task):
+    """ One-line summary in the board's own LIST format """
+    return (f"ID={task.id} TYPE={task.type} PRIORITY={task.priority} "
+            f"STATUS={task.status} SIZE={task.size} ADDR=0x{task.addr:04X}")
+
+
+def _confirmed(reply, task_id, verb):
+    return any(f"Task {task_id} {verb}" in line for line in reply)
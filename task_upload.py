@@ -0,0 +1,297 @@
+import random
+import re
+import time
+
+# ---------------- Framed Task Upload ---------------- #
+#
+# Frame layout (all multi-byte fields little-endian):
+#
+#   SYNC | KIND | SEQ | LEN | PAYLOAD (LEN bytes) | CRC16
+#
+# KIND is b"S" (start, payload = 10-byte TaskHeader), b"D" (data chunk SEQ)
+# or b"E" (end, payload = CRC16 of the whole image). CRC16 covers KIND..PAYLOAD.
+# A compressed upload (see task_compress) sends the packed payload as the image.
+# The payload is length-prefixed, so '>' or SYNC bytes inside the image are safe.
+# The receiver answers every frame with a text line: "ACK:D3", "NAK:D3", "ACK:S0" ...
+
+SYNC = 0xA5
+KIND_START = ord("S")
+KIND_DATA = ord("D")
+KIND_END = ord("E")
+MAX_CHUNK = 128
+TASK_HEADER_SIZE = 10
+MAX_TASK_SIZE = 512
+
+REPLY_PATTERN = re.compile(r"(ACK|NAK):([SDE])(\d+)")
+
+
+def _make_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+_CRC_TABLE = _make_crc_table()
+
+
+def crc16(data, crc=0):
+    """ CRC-16/XMODEM, the same as _crc_xmodem_update() in avr-libc's util/crc16.h """
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[(crc >> 8) ^ byte]
+    return crc
+
+
+def build_task_header(task_id, task_type, priority, size, status=1, flash_address=0):
+    """ Build the 10-byte TaskHeader: ID, Type, Priority, Size (LE16), Status, FlashAddress (LE32) """
+    return bytes([
+        task_id,
+        task_type,
+        priority,
+        size & 0xFF,
+        (size >> 8) & 0xFF,
+        status
+    ]) + flash_address.to_bytes(4, "little")  # 6 + 4 = 10 bytes total
+
+
+def build_frame(kind, seq, payload=b""):
+    """ Wrap a payload in a SYNC/KIND/SEQ/LEN ... CRC16 frame """
+    if len(payload) > MAX_CHUNK:
+        raise ValueError(f"Frame payload exceeds {MAX_CHUNK} bytes")
+    body = bytes([kind, seq, len(payload)]) + payload
+    return bytes([SYNC]) + body + crc16(body).to_bytes(2, "little")
+
+
+def format_upload_stats(stats):
+    """ One-line summary of the dict returned by upload_task """
+    image_bytes = stats.get("image_bytes", stats["bytes"])
+    packed = f" (LZ-packed {image_bytes}-byte image)" if image_bytes != stats["bytes"] else ""
+    return (f"Uploaded {stats['bytes']} bytes{packed} in {stats['chunks']} chunks, "
+            f"{stats['seconds']:.2f}s ({stats['bytes_per_second']:.0f} B/s), "
+            f"{stats['retransmits']} retransmits ({stats['naks']} NAK, {stats['timeouts']} timeout)")
+
+
+class _ReplyReader:
+    """ Collects ACK/NAK lines from the port without losing bytes between reads """
+
+    def __init__(self, ser):
+        self.ser = ser
+        self.buffer = b""
+
+    def read(self, timeout):
+        """ Return the next (verdict, kind, seq) reply, or None when timeout expires """
+        deadline = time.monotonic() + timeout
+        saved_timeout = self.ser.timeout
+        try:
+            while True:
+                while b"\n" in self.buffer:
+                    raw, self.buffer = self.buffer.split(b"\n", 1)
+                    match = REPLY_PATTERN.search(raw.decode("utf-8", errors="ignore"))
+                    if match:
+                        return match.group(1), ord(match.group(2)), int(match.group(3))
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.ser.timeout = remaining
+                chunk = self.ser.read(1)
+                if chunk:
+                    self.buffer += chunk + self.ser.read(self.ser.in_waiting)
+        finally:
+            self.ser.timeout = saved_timeout
+
+
+def _send_control(ser, replies, kind, payload, timeout, max_retries, stats):
+    """ Send a start/end frame and wait for its ACK, retrying on NAK or timeout """
+    frame = build_frame(kind, 0, payload)
+    for _ in range(max_retries + 1):
+        ser.write(frame)
+        deadline = time.monotonic() + timeout
+        while True:
+            reply = replies.read(max(0, deadline - time.monotonic()))
+            if reply is None:
+                stats["timeouts"] += 1
+                break
+            verdict, reply_kind, _ = reply
+            if reply_kind != kind:
+                continue  # Late reply to a data chunk
+            if verdict == "ACK":
+                return
+            stats["naks"] += 1
+            break
+        stats["retransmits"] += 1
+    raise RuntimeError(f"No ACK for {chr(kind)} frame after {max_retries} retries")
+
+
+def upload_task(ser, header, payload, chunk_size=32, window=4, timeout=0.5, max_retries=5):
+    """ Upload a task image as CRC-checked chunks with a sliding window.
+
+    Up to `window` chunks are in flight at once. A chunk that is NAKed or not
+    ACKed within `timeout` seconds is resent on its own; after `max_retries`
+    resends of one chunk the upload fails with RuntimeError.
+    Returns a dict with byte/chunk counts, timing and retry statistics.
+    """
+    if len(header) != TASK_HEADER_SIZE:
+        raise ValueError(f"TaskHeader must be {TASK_HEADER_SIZE} bytes")
+    if not 0 < chunk_size <= MAX_CHUNK:
+        raise ValueError(f"Chunk size must be 1-{MAX_CHUNK}")
+
+    chunks = [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)]
+    if len(chunks) > 256:
+        raise ValueError("Too many chunks for an 8-bit sequence number")
+
+    stats = {"bytes": len(payload), "chunks": len(chunks), "retransmits": 0, "naks": 0, "timeouts": 0}
+    replies = _ReplyReader(ser)
+    start_time = time.monotonic()
+
+    ser.reset_input_buffer()
+    _send_control(ser, replies, KIND_START, header, timeout, max_retries, stats)
+
+    frames = [build_frame(KIND_DATA, seq, chunk) for seq, chunk in enumerate(chunks)]
+    retries = [0] * len(frames)
+    in_flight = {}  # seq -> time sent
+    acked = set()
+    next_seq = 0
+
+    def resend(seq):
+        retries[seq] += 1
+        stats["retransmits"] += 1
+        if retries[seq] > max_retries:
+            raise RuntimeError(f"Chunk {seq} failed after {max_retries} retries")
+        ser.write(frames[seq])
+        in_flight[seq] = time.monotonic()
+
+    while len(acked) < len(frames):
+        while next_seq < len(frames) and len(in_flight) < window:
+            ser.write(frames[next_seq])
+            in_flight[next_seq] = time.monotonic()
+            next_seq += 1
+
+        oldest = min(in_flight.values())
+        reply = replies.read(max(0, oldest + timeout - time.monotonic()))
+        if reply is None:
+            now = time.monotonic()
+            for seq, sent in list(in_flight.items()):
+                if now - sent >= timeout:
+                    stats["timeouts"] += 1
+                    resend(seq)
+            continue
+
+        verdict, kind, seq = reply
+        if kind != KIND_DATA or seq not in in_flight:
+            continue  # Duplicate or stale reply
+        if verdict == "ACK":
+            del in_flight[seq]
+            acked.add(seq)
+        else:
+            stats["naks"] += 1
+            resend(seq)
+
+    _send_control(ser, replies, KIND_END, crc16(payload).to_bytes(2, "little"), timeout, max_retries, stats)
+
+    stats["seconds"] = time.monotonic() - start_time
+    stats["bytes_per_second"] = len(payload) / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+# ---------------- Reference Receiver ---------------- #
+
+class TaskUploadReceiver:
+    """ Host-side reference implementation of the MCU end of the framed upload.
+
+    feed() takes raw bytes from the wire and returns the reply lines to send back.
+    Completed uploads are stored in `tasks` as {task_id: (header, image)}.
+    error_rate corrupts that fraction of incoming frames to exercise retransmits.
+    """
+
+    def __init__(self, error_rate=0.0, seed=None):
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.buffer = bytearray()
+        self.tasks = {}
+        self.header = None
+        self.chunks = {}
+        self.frames_received = 0
+        self.frames_rejected = 0
+
+    def feed(self, data):
+        """ Consume wire bytes and return the list of reply lines (bytes) """
+        self.buffer += data
+        replies = []
+        while True:
+            start = self.buffer.find(SYNC)
+            if start < 0:
+                self.buffer.clear()
+                return replies
+            del self.buffer[:start]
+            if len(self.buffer) < 4:
+                return replies
+
+            kind, seq, length = self.buffer[1], self.buffer[2], self.buffer[3]
+            if length > MAX_CHUNK or kind not in (KIND_START, KIND_DATA, KIND_END):
+                del self.buffer[:1]  # Not a real frame start, resync
+                continue
+            frame_size = 4 + length + 2
+            if len(self.buffer) < frame_size:
+                return replies
+
+            frame = bytes(self.buffer[:frame_size])
+            if self.error_rate and self.random.random() < self.error_rate:
+                frame = frame[:-1] + bytes([frame[-1] ^ 0xFF])  # Simulated line error
+
+            body, crc = frame[1:-2], int.from_bytes(frame[-2:], "little")
+            if crc16(body) != crc:
+                self.frames_rejected += 1
+                del self.buffer[:1]
+                replies.append(f"NAK:{chr(kind)}{seq}\n".encode())
+                continue
+
+            del self.buffer[:frame_size]
+            self.frames_received += 1
+            replies.append(self._handle(kind, seq, body[3:]))
+
+    def _handle(self, kind, seq, payload):
+        if kind == KIND_START:
+            if len(payload) != TASK_HEADER_SIZE:
+                return b"NAK:S0\n"
+            self.header = payload
+            self.chunks = {}
+            return b"ACK:S0\n"
+
+        if kind == KIND_DATA:
+            if self.header is None:
+                return f"NAK:D{seq}\n".encode()
+            self.chunks[seq] = payload
+            return f"ACK:D{seq}\n".encode()
+
+        if self.header is None:
+            return b"NAK:E0\n"
+        image = b"".join(self.chunks[i] for i in sorted(self.chunks))
+        size = self.header[3] | (self.header[4] << 8)
+        expected_crc = int.from_bytes(payload[:2], "little")
+        if len(image) != size or crc16(image) != expected_crc:
+            return b"NAK:E0\n"
+        from task_compress import unpack_task
+        try:
+            self.tasks[self.header[0]] = unpack_task(self.header, image)
+        except ValueError:
+            return b"NAK:E0\n"  # Compressed image that doesn't decode
+        self.header = None
+        return b"ACK:E0\n"
+
+
+def serve(port, receiver=None, stop_event=None):
+    """ Run a receiver on a serial port (pty, socket://, ...) until stop_event is set """
+    receiver = receiver or TaskUploadReceiver()
+    port.timeout = 0.1
+    while not (stop_event and stop_event.is_set()):
+        data = port.read(1)
+        if not data:
+            continue
+        data += port.read(port.in_waiting)
+        for reply in receiver.feed(data):
+            port.write(reply)
+    return receiver
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+import rtos_client
+
+# ---------------- Task Watch ---------------- #
+#
+# Edit -> running without the upload dialog: watched task sources are polled
+# (stat() only, no extra dependency) and once a change has settled for the
+# debounce time they are recompiled and pushed to the slot, type and priority
+# they were last uploaded with. Those parameters are remembered per source in
+# WATCH_FILE by every upload that goes through remember().
+#
+# Builds come from the content-hash cache when nothing relevant changed, and an
+# image identical to the one last deployed to that slot is not sent again, so a
+# save without a code change (whitespace, comments) costs no flash write.
+
+DEBOUNCE_SECONDS = 0.3  # Editors save in several steps (truncate / write / rename)
+POLL_SECONDS = 0.1
+WATCH_FILE = os.environ.get("RTOS_WATCH_FILE", os.path.join(os.path.expanduser("~"), ".cache", "rtos-watch.json"))
+
+_store_lock = threading.Lock()
+
+
+def load_targets(path=None):
+    """ {absolute source path: upload parameters} remembered from earlier uploads """
+    try:
+        with open(path or WATCH_FILE) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def remember(c_path, task_id, task_type, priority, framed=False, place=False, profile=None, budget=True,
+             path=None, compress=False):
+    """ Store the parameters c_path was uploaded with; returns the target dict """
+    rtos_client.check_task_id(task_id)
+    c_path = os.path.abspath(c_path)
+    target = {"path": c_path, "id": task_id, "type": task_type, "priority": priority, "framed": framed,
+              "place": place, "profile": profile, "budget": budget, "compress": compress}
+    path = path or WATCH_FILE
+    with _store_lock:
+        targets = load_targets(path)
+        targets[c_path] = target
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(targets, file, indent=2)
+        os.replace(tmp_path, path)
+    return target
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None  # Missing, e.g. between an editor's delete and rename
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SourceWatcher:
+    """ Debounced change detection for .c sources and the local headers they include """
+
+    def __init__(self, sources=(), debounce=DEBOUNCE_SECONDS):
+        self.debounce = debounce
+        self._files = {}    # source -> files it is built from (itself and its #include "..." closure)
+        self._stamps = {}   # file -> (mtime_ns, size) or None
+        self._changed = {}  # file -> monotonic time of its latest change
+        for source in sources:
+            self.add(source)
+
+    @property
+    def sources(self):
+        return sorted(self._files)
+
+    def add(self, source):
+        self._track(os.path.abspath(source))
+
+    def remove(self, source):
+        self._files.pop(os.path.abspath(source), None)
+        self._prune()
+
+    def poll(self, now=None):
+        """ Sources with a change that has settled for the debounce time """
+        now = time.monotonic() if now is None else now
+        for file, stamp in list(self._stamps.items()):
+            current = _stamp(file)
+            if current != stamp:
+                self._stamps[file] = current
+                self._changed[file] = now
+
+        settled = [file for file, changed in self._changed.items() if now - changed >= self.debounce]
+        ready = set()
+        for file in settled:
+            del self._changed[file]
+            ready.update(source for source, files in self._files.items() if file in files)
+
+        sources = []
+        for source in sorted(ready):
+            if self._stamps.get(source) is None:
+                continue  # Deleted; coming back counts as another change
+            self._track(source)  # The includes may have changed too
+            sources.append(source)
+        return sources
+
+    def _track(self, source):
+        from task_compiler import include_closure
+        files = [source]
+        if source.endswith(".c"):
+            try:
+                files += include_closure(source)
+            except OSError:
+                pass
+        self._files[source] = set(files)
+        for file in files:
+            if file not in self._stamps:
+                self._stamps[file] = _stamp(file)
+        self._prune()
+
+    def _prune(self):
+        used = set().union(*self._files.values()) if self._files else set()
+        for file in list(self._stamps):
+            if file not in used:
+                del self._stamps[file]
+                self._changed.pop(file, None)
+
+
+def build_image(target, list_lines=None):
+    """ (image, flash address) of a target; placed targets are linked for a free region of the board's <LIST> """
+    priority = target["priority"] if target.get("budget", True) else None
+    if target.get("place"):
+        return rtos_client.build_placed_task(list_lines, target["path"], target["id"], target.get("profile"), priority)
+    return rtos_client.load_task_image(target["path"], target.get("profile"), priority), 0
+
+
+def redeploy(ser, target, deployed):
+    """ Rebuild a target and upload it unless its slot already got this exact image.
+
+    deployed maps task id -> digest of the last image (and header) the board
+    confirmed for it, and is updated. Returns {"path", "id", "size",
+    "flash_address", "skipped", "seconds", "reply", "error"}; a failed upload
+    has its error set and is retried on the next change, even an identical one.
+    """
+    started = time.perf_counter()
+    list_lines = rtos_client.list_tasks(ser) if target.get("place") else None
+    image, address = build_image(target, list_lines)
+    return deploy(ser, target, image, address, deployed, started)
+
+
+def deploy(ser, target, image, address, deployed, started=None):
+    """ The upload half of redeploy(), for callers that build on another thread than the port's """
+    started = time.perf_counter() if started is None else started
+    digest = hashlib.sha256(bytes([target["type"], target["priority"]]) + address.to_bytes(2, "little")
+                            + image).hexdigest()
+    result = {"path": target["path"], "id": target["id"], "size": len(image), "flash_address": address,
+              "skipped": deployed.get(target["id"]) == digest, "reply": None, "error": None}
+    if not result["skipped"]:
+        deployed.pop(target["id"], None)  # Unknown until the upload succeeds
+        try:
+            result["reply"] = rtos_client.upload_task_image(ser, target["id"], target["type"], target["priority"],
+                                                            image, target.get("framed", False), 1, address,
+                                                            target.get("compress", False))
+        except (RuntimeError, ValueError) as e:  # Rejected, unconfirmed or unanswered
+            result["error"] = str(e)
+        else:
+            deployed[target["id"]] = digest
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def format_redeploy(result):
+    name = os.path.basename(result["path"])
+    if result.get("error"):
+        return f"{name}: {result['error']}"
+    if result["skipped"]:
+        return f"{name}: image unchanged, ID={result['id']} not re-sent"
+    placed = f" at 0x{result['flash_address']:04X}" if result["flash_address"] else ""
+    return f"{name}: {result['size']} bytes -> ID={result['id']}{placed} in {result['seconds']:.2f}s"
+
+
+def watch(ser, targets, debounce=DEBOUNCE_SECONDS, poll_interval=POLL_SECONDS, on_result=None, stop=None):
+    """ Redeploy targets as their sources change until stop (a threading.Event) is set or Ctrl-C.
+
+    Build and upload errors are reported through on_result and watching goes
+    on. Returns counts of deployed / skipped / failed redeploys.
+    """
+    targets = {os.path.abspath(target["path"]): target for target in targets}
+    watcher = SourceWatcher(targets, debounce)
+    deployed = {}
+    counts = {"deployed": 0, "skipped": 0, "failed": 0}
+    try:
+        while not (stop and stop.is_set()):
+            for source in watcher.poll():
+                try:
+                    result = redeploy(ser, targets[source], deployed)
+                    counts["failed" if result["error"] else "skipped" if result["skipped"] else "deployed"] += 1
+                except Exception as e:
+                    result = {"path": source, "error": str(e)}
+                    counts["failed"] += 1
+                if on_result:
+                    on_result(result)
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    return counts
+
+
+def watch_targets(files, task_id=None, task_type=None, priority=None, framed=False, place=False, profile=None,
+                  budget=True, compress=False):
+    """ Targets for the watch command: given parameters are remembered, otherwise the remembered ones are used """
+    if task_id is not None:
+        if len(files) != 1:
+            raise ValueError("--id applies to a single file; watch several with their remembered parameters")
+        return [remember(files[0], task_id, task_type or 0, priority or 1, framed, place, profile, budget,
+                         compress=compress)]
+
+    remembered = load_targets()
+    targets = []
+    for file in files:
+        target = remembered.get(os.path.abspath(file))
+        if target is None:
+            raise ValueError(f"No remembered upload for {file}: give --id/--type/--priority once")
+        targets.append(target)
+    return targets
+
+
+def print_redeploy(result):
+    print(format_redeploy(result), file=sys.stderr if result.get("error") else sys.stdout, flush=True)
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from async_transport import AsyncDevice
+from rtos_emulator import EmulatedSerial
+from task_upload import build_task_header
+
+
+def _board():
+    ser = EmulatedSerial(baud_rate=9600)
+    ser.emulator.store(build_task_header(0, 0, 1, 4), bytes(4))
+    return ser
+
+
+def test_cancelled_dump_does_not_leak_into_next_reply():
+    async def run():
+        async with AsyncDevice(_board()) as dev:
+            dump = asyncio.ensure_future(dev.debug_dump())
+            await asyncio.sleep(0.5)  # Part way through the ~1 KB dump at 9600 baud
+            dump.cancel()
+            try:
+                await dump
+            except asyncio.CancelledError:
+                pass
+            return await dev.list_tasks(), await dev.info(0), await dev.list_tasks()
+
+    first, info, second = asyncio.run(run())
+    assert first[0] == "List of Tasks:" and first[1].startswith("Slot 0: ID=0")
+    assert info["id"] == 0 and info["size"] == 4
+    assert second == first
+
+
+def test_timed_out_reply_is_drained():
+    async def run():
+        async with AsyncDevice(_board()) as dev:
+            partial = await dev.request(b"<DEBUG>\n", timeout=0.3)
+            return partial, await dev.info(0, timeout=5)
+
+    partial, info = asyncio.run(run())
+    assert partial and all(":" in line for line in partial)
+    assert info["id"] == 0
+
+
+def test_task_output_is_not_part_of_the_reply():
+    async def run():
+        ser = _board()
+        async with AsyncDevice(ser) as dev:
+            ser.inject(b"LED on\n")
+            reply = await dev.list_tasks()
+            return reply, await asyncio.wait_for(dev.__anext__(), 1)
+
+    reply, output = asyncio.run(run())
+    assert "LED on" not in reply
+    assert output == "LED on"
+
+
+def test_stray_end_is_not_task_output():
+    async def run():
+        ser = EmulatedSerial(baud_rate=9600)
+        async with AsyncDevice(ser) as dev:
+            empty = await dev.list_tasks()  # Ends on its last line, before the board's <END>
+            missing = await dev.info(3)
+            await asyncio.sleep(0.1)
+            ser.inject(b"LED on\n")
+            return empty, missing, await asyncio.wait_for(dev.__anext__(), 1)
+
+    empty, missing, output = asyncio.run(run())
+    assert empty and missing == {}
+    assert output == "LED on"
+
+
+def test_rejected_upload_raises():
+    async def run():
+        ser = EmulatedSerial(baud_rate=115200)
+        ser.emulator._task = lambda header, image: ["Task 4 rejected: Invalid size."]
+        async with AsyncDevice(ser) as dev:
+            await dev.upload(bytes(4), build_task_header(4, 0, 1, 4))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+
+class _DyingSerial(EmulatedSerial):
+    def read(self, size=1):
+        if self.dead:
+            raise OSError("device disconnected")
+        return super().read(size)
+
+
+def test_lost_port_closes_the_device():
+    async def run():
+        ser = _DyingSerial(baud_rate=115200)
+        ser.dead = False
+        async with AsyncDevice(ser) as dev:
+            command = asyncio.ensure_future(dev.list_tasks(timeout=5))
+            ser.dead = True
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(command, 2)
+            assert not ser.is_open
+            assert [line async for line in dev] == []
+            with pytest.raises(RuntimeError):
+                await dev.list_tasks()
+
+    asyncio.run(run())
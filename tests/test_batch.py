@@ -0,0 +1,29 @@
+import rtos_client
+from rtos_emulator import EmulatedSerial
+from task_upload import build_task_header
+
+
+def _board(*task_ids):
+    ser = EmulatedSerial(baud_rate=115200)
+    for task_id in task_ids:
+        ser.emulator.store(build_task_header(task_id, 0, 1, 4), bytes(4))
+    return ser
+
+
+def test_batch_is_applied():
+    ser = _board(1, 2, 3)
+    result = rtos_client.batch_tasks(ser, [("delete", 1), ("edit", 2, 1, 3, 0), ("status", 3, 0)])
+    assert result["applied"] and result["error"] is None
+    assert all(item["ok"] for item in result["items"])
+    assert ser.emulator.slot(1) is None
+    assert ser.emulator.slot(2)["priority"] == 3 and ser.emulator.slot(2)["status"] == 0
+    assert ser.emulator.slot(3)["status"] == 0
+
+
+def test_rejected_batch_changes_nothing():
+    ser = _board(1, 2)
+    before = bytes(ser.emulator.eeprom)
+    result = rtos_client.batch_tasks(ser, [("delete", 1), ("edit", 7, 0, 1, 1)])
+    assert not result["applied"]
+    assert not result["items"][1]["ok"]
+    assert bytes(ser.emulator.eeprom) == before
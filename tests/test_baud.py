@@ -0,0 +1,44 @@
+import rtos_client
+from rtos_emulator import EmulatedSerial, RTOSEmulator
+
+
+def _board(board_rate=9600, host_rate=9600, max_baud=500000):
+    return EmulatedSerial(RTOSEmulator(baud_rate=board_rate, max_baud=max_baud), baud_rate=host_rate)
+
+
+def test_probe_finds_the_board_rate():
+    ser = _board(board_rate=57600)
+    assert rtos_client.probe_baud(ser) == 57600
+    assert ser.baudrate == 57600
+    assert rtos_client.list_tasks(ser) == ["No stored tasks found."]
+
+
+def test_probe_leaves_the_port_alone_when_nothing_answers():
+    ser = _board(board_rate=2400)
+    assert rtos_client.probe_baud(ser, rates=(9600, 19200)) is None
+    assert ser.baudrate == 9600
+
+
+def test_negotiate_picks_the_fastest_supported_rate():
+    ser = _board(max_baud=250000)
+    assert rtos_client.negotiate_baud(ser) == 250000  # 1000000 and 500000 are refused
+    assert ser.baudrate == ser.emulator.baud_rate == 250000
+    assert rtos_client.restore_baud(ser, 9600)
+    assert ser.baudrate == ser.emulator.baud_rate == 9600
+
+
+def test_negotiate_without_a_baud_command():
+    ser = _board()
+    ser.emulator._baud = lambda rate: ["Unknown command."]
+    assert rtos_client.negotiate_baud(ser) is None
+    assert ser.baudrate == 9600
+
+
+def test_run_fast_drops_back_after_the_transfer():
+    ser = _board()
+    lines, link = rtos_client.run_fast(ser, rtos_client.debug_dump)
+    assert lines[0] == "EEPROM Dump:" and len(lines) == 65
+    assert link["negotiated"] and link["baud_rate"] == 500000
+    assert link["bytes_read"] > 1024
+    assert ser.baudrate == ser.emulator.baud_rate == 9600
+    assert rtos_client.list_tasks(ser) == ["No stored tasks found."]
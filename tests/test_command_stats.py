@@ -0,0 +1,64 @@
+import json
+
+from command_stats import Histogram, StatsRegistry, command_name
+
+
+def test_command_name():
+    assert command_name(b"<INFO:3>\n") == "INFO"
+    assert command_name(b"\x7e\x01") == "RAW"
+
+
+def test_histogram_buckets():
+    histogram = Histogram((0.001, 0.01, 0.1))
+    for value in (0.001, 0.003, 0.003, 0.05, 2.0):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 1]  # A value on a bound is in that bucket (le)
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(1.0) == 2.0    # +Inf bucket: the max
+    summary = histogram.as_dict()
+    assert summary["buckets"] == {"0.001": 1, "0.01": 2, "0.1": 1, "+Inf": 1}
+    assert summary["count"] == 5 and summary["max"] == 2.0
+
+
+def _registry():
+    stats = StatsRegistry(enabled=True)
+    stats.record("LIST", 10.0, 10.04, first_byte=10.002, bytes_out=7, bytes_in=120)
+    stats.record("LIST", 20.0, 20.3, first_byte=20.01, bytes_out=7, bytes_in=120, timeouts=1)
+    stats.record("TASK", 30.0, 31.0, bytes_out=40, retries=2, error=True)
+    return stats
+
+
+def test_disabled_registry_records_nothing():
+    stats = StatsRegistry()
+    stats.record("LIST", 0.0, 1.0)
+    assert stats.snapshot()["commands"] == {}
+
+
+def test_snapshot_and_json_export(tmp_path):
+    stats = _registry()
+    path = tmp_path / "stats.json"
+    stats.export(str(path))
+    commands = json.loads(path.read_text())["commands"]
+    assert commands["LIST"]["count"] == 2 and commands["LIST"]["timeouts"] == 1
+    assert commands["LIST"]["bytes_in"] == 240
+    assert commands["TASK"]["errors"] == 1 and commands["TASK"]["retries"] == 2
+    assert commands["TASK"]["latency"]["count"] == 0  # Failed operations have no latency
+
+
+def test_prometheus_exposition(tmp_path):
+    path = tmp_path / "stats.prom"
+    _registry().export(str(path))
+    lines = path.read_text().splitlines()
+    assert "# TYPE rtos_command_latency_seconds histogram" in lines
+    buckets = [line for line in lines if line.startswith('rtos_command_latency_seconds_bucket{command="LIST"')]
+    counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert counts == sorted(counts) and counts[-1] == 2  # Cumulative, +Inf is the total
+    assert buckets[-1].startswith('rtos_command_latency_seconds_bucket{command="LIST",le="+Inf"}')
+    assert 'rtos_command_latency_seconds_bucket{command="LIST",le="0.025"} 0' in lines
+    assert 'rtos_command_latency_seconds_bucket{command="LIST",le="0.05"} 1' in lines
+    assert 'rtos_command_latency_seconds_bucket{command="LIST",le="0.5"} 2' in lines
+    assert 'rtos_command_latency_seconds_count{command="LIST"} 2' in lines
+    assert 'rtos_command_total{command="TASK"} 1' in lines
+    assert 'rtos_command_errors_total{command="TASK"} 1' in lines
+    assert 'rtos_command_bytes_total{command="LIST",direction="in"} 240' in lines
+    assert all(line.startswith("#") or line.startswith("rtos_command_") for line in lines)
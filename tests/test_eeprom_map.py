@@ -0,0 +1,64 @@
+from eeprom_map import EEPROM_SIZE, change_counts, decode_dump, format_diff
+from task_upload import build_task_header
+
+
+def _dump(data, rows=None):
+    """ <DEBUG> reply lines of data, optionally only the first rows """
+    lines = ["EEPROM Dump:"]
+    for address in range(0, len(data), 16)[:rows]:
+        lines.append(f"{address:04X}: " + " ".join(f"{byte:02X}" for byte in data[address:address + 16]))
+    return lines
+
+
+def _eeprom(*headers):
+    data = bytearray([0xFF]) * EEPROM_SIZE
+    for slot, header in enumerate(headers):
+        data[slot * 10:slot * 10 + 10] = header
+    return data
+
+
+def test_decode_headers():
+    image = decode_dump(_dump(_eeprom(build_task_header(4, 1, 2, 300, 1, 0x5000))))
+    assert image.complete
+    header = image.headers()[0]
+    assert (header.id, header.type, header.priority, header.size, header.status) == (4, 1, 2, 300, 1)
+    assert header.addr == 0x5000
+    assert image.headers()[1:] == [None] * 9
+
+
+def test_diff_ranges():
+    old = _eeprom(build_task_header(1, 0, 1, 4))
+    new = bytearray(old)
+    new[2] = 3                          # Slot 0 priority
+    new[0x40:0x43] = b"\x01\x02\x03"
+    new[0x3FF] = 0
+    old_image, new_image = decode_dump(_dump(old)), decode_dump(_dump(new))
+    assert new_image.diff(old_image) == [(2, 3), (0x40, 0x43), (0x3FF, 0x400)]
+    assert new_image.changed_slots(old_image) == [0]
+    lines = format_diff(new_image, old_image)
+    assert lines[0] == "0x0002-0x0002 (1 B, slot 0 header): 01 -> 03"
+    assert lines[-1].startswith("Slot 0: ID=1 TYPE=0 PRIORITY=3")
+    assert change_counts([old_image, new_image, new_image])[0x40] == 1
+
+
+def test_truncated_dump_is_not_compared():
+    old = _eeprom()
+    new = bytearray(old)
+    new[0x20] = 0
+    new[0x300] = 0
+    truncated = decode_dump(_dump(new, rows=16))  # First 256 bytes only
+    assert not truncated.complete
+    assert truncated.diff(decode_dump(_dump(old))) == [(0x20, 0x21)]
+
+
+def test_memory_map():
+    data = _eeprom(build_task_header(2, 0, 1, 4))
+    data[0x100:0x108] = bytes(8)      # Part of a row written
+    data[0x200:0x210] = bytes(16)     # A whole row written
+    image = decode_dump(_dump(data))
+    lines = image.memory_map().splitlines()
+    assert lines[0] == "0000: H" + "h" * 6 + "." * 9 + "+" + "." * 15  # 32 rows of 16 bytes per line
+    assert lines[1] == "0200: #" + "." * 31
+    assert lines[-2] == "Slots 1/10  0:ID2 1:-- 2:-- 3:-- 4:-- 5:-- 6:-- 7:-- 8:-- 9:--"
+    usage = image.usage()
+    assert usage["free_runs"] == 3 and usage["data_free"] == EEPROM_SIZE - 100 - 24
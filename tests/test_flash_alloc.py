@@ -0,0 +1,59 @@
+import pytest
+
+from flash_alloc import FlashAllocator, pages
+from rtos_parser import TaskRecord
+
+
+def _allocator():
+    allocator = FlashAllocator(0x5000, 0x7000, 128)
+    allocator.reserve(1, 0x5000, 128)   # Free after it: 0x5080-0x5100 (1 page)
+    allocator.reserve(2, 0x5100, 100)   # Free after it: 0x5180-0x5400 (5 pages)
+    allocator.reserve(3, 0x5400, 128)   # Free after it: 0x5480-0x7000
+    return allocator
+
+
+def test_pages():
+    assert pages(0) == 1 and pages(128) == 1 and pages(129) == 2
+
+
+def test_best_fit():
+    allocator = _allocator()
+    assert allocator.allocate(4, 100) == 0x5080   # The one-page gap, not the first big run
+    assert allocator.allocate(5, 300) == 0x5180   # 3 pages: the 5-page gap beats the tail
+    assert allocator.free_regions() == [(0x5300, 0x100), (0x5480, 0x7000 - 0x5480)]
+
+
+def test_reupload_keeps_its_region_while_it_fits():
+    allocator = _allocator()
+    assert allocator.allocate(2, 128) == 0x5100
+    # Outgrew its page: re-placed with its old page counted as free, so it may slide into the gap before it
+    assert allocator.allocate(2, 200) == 0x5080
+    assert allocator.regions[2] == (0x5080, 256)
+    assert allocator.free_regions()[0] == (0x5180, 0x5400 - 0x5180)
+
+
+def test_full_region():
+    allocator = FlashAllocator(0x5000, 0x5200, 128)
+    allocator.allocate(1, 256)
+    with pytest.raises(ValueError, match="largest free: 256"):
+        allocator.allocate(2, 300)
+
+
+def test_reserve_rejects_overlaps_and_misalignment():
+    allocator = _allocator()
+    with pytest.raises(ValueError, match="overlaps task 2"):
+        allocator.reserve(9, 0x5100, 10)
+    with pytest.raises(ValueError, match="page aligned"):
+        allocator.reserve(9, 0x5090, 10)
+    with pytest.raises(ValueError, match="outside"):
+        allocator.reserve(9, 0x6F80, 256)
+
+
+def test_from_tasks_skips_unplaced_tasks():
+    tasks = [TaskRecord(1, size=100, addr=0x5000), TaskRecord(2, size=30, addr=0),
+             {"id": 3, "size": 300, "addr": 0x5200}]
+    allocator = FlashAllocator.from_tasks(tasks, start=0x5000, end=0x7000)
+    assert allocator.regions == {1: (0x5000, 128), 3: (0x5200, 384)}
+    usage = allocator.usage()
+    assert usage["used"] == 512 and usage["free_runs"] == 2
+    assert usage["largest_free"] == 0x7000 - 0x5380
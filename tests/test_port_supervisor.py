@@ -0,0 +1,100 @@
+from port_supervisor import ConnectionSupervisor
+import rtos_client
+from rtos_emulator import EmulatedSerial
+from serial_worker import SerialWorker
+from task_upload import build_task_header
+
+
+class _DyingSerial(EmulatedSerial):
+    """ Emulated port that can be unplugged """
+    dead = False
+
+    def _check(self):
+        if self.dead:
+            raise OSError("device disconnected")
+
+    def read(self, size=1):
+        self._check()
+        return super().read(size)
+
+    def write(self, data):
+        self._check()
+        return super().write(data)
+
+    @property
+    def in_waiting(self):
+        self._check()
+        return super().in_waiting
+
+
+def _board(task_id):
+    ser = _DyingSerial(baud_rate=115200)
+    ser.emulator.store(build_task_header(task_id, 0, 1, 4), bytes(4))
+    return ser
+
+
+def _supervisor(attempts, **options):
+    """ Supervisor whose open attempts are taken from attempts: a port, None (nothing found) or an exception """
+    events = []
+    supervisor = ConnectionSupervisor("emu://", 115200, scanner=object(), on_event=events.append,
+                                      backoff_start=0.01, backoff_max=0.02, **options)
+    attempts = list(attempts)
+
+    def attempt():
+        outcome = attempts.pop(0) if attempts else None
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    supervisor._attempt = attempt
+    return supervisor, events
+
+
+def _worker(ser, supervisor):
+    states = []
+    worker = SerialWorker(ser, reconnect=supervisor.reconnect,
+                          on_state=lambda event, detail: states.append(event)).start()
+    return worker, states
+
+
+def test_request_is_resent_after_a_failed_then_successful_reconnect():
+    old, new = _board(1), _board(2)
+    supervisor, events = _supervisor([OSError("port busy"), None, new])
+    worker, states = _worker(old, supervisor)
+    try:
+        old.dead = True
+        reply = worker.request(rtos_client.list_request()).result(5)
+        assert "ID=2 " in reply[1]  # Answered by the board on the new port
+        assert worker.ser is new and worker.connected
+    finally:
+        worker.stop()
+    worker.process_callbacks()
+    assert states == ["lost", "reconnected"]
+    assert supervisor.reconnects == 1
+    assert events[0] == "Reconnect attempt 1 failed: port busy"
+
+
+def test_interrupted_exclusive_command_runs_again_on_the_new_port():
+    old, new = _board(1), _board(2)
+    supervisor, _ = _supervisor([new])
+    worker, _ = _worker(old, supervisor)
+    try:
+        old.dead = True
+        info = worker.submit(rtos_client.task_info, 2).result(5)
+    finally:
+        worker.stop()
+    assert info["id"] == 2
+
+
+def test_gives_up_after_max_attempts():
+    old = _board(1)
+    supervisor, events = _supervisor([None, OSError("gone")], max_attempts=2)
+    worker, states = _worker(old, supervisor)
+    old.dead = True
+    failed = worker.request(rtos_client.list_request())
+    assert isinstance(failed.exception(5), OSError)
+    worker.stop()
+    worker.process_callbacks()
+    assert states == ["lost", "gave up"]
+    assert events[-1] == "Giving up after 2 reconnect attempts"
+    assert isinstance(worker.request(rtos_client.list_request()).exception(1), RuntimeError)
@@ -0,0 +1,21 @@
+import rtos_cli
+import rtos_client
+from rtos_emulator import EmulatedSerial
+from task_upload import build_task_header
+
+
+def _run(monkeypatch, argv, *task_ids):
+    ser = EmulatedSerial(baud_rate=115200)
+    for task_id in task_ids:
+        ser.emulator.store(build_task_header(task_id, 0, 1, 4), bytes(4))
+    monkeypatch.setattr(rtos_client, "connect", lambda port, baud_rate, capture=None: ser)
+    return rtos_cli.main(["-p", "emu://"] + argv)
+
+
+def test_error_reply_exits_1(monkeypatch, capsys):
+    assert _run(monkeypatch, ["delete", "7"]) == 1
+    assert "not found" in capsys.readouterr().err
+
+
+def test_confirmed_reply_exits_0(monkeypatch):
+    assert _run(monkeypatch, ["delete", "7"], 7) == 0
@@ -0,0 +1,52 @@
+import os
+import select
+import sys
+import time
+
+import pytest
+
+from rtos_emulator import RTOSEmulator, serve_pty
+from task_upload import KIND_START, SYNC, build_frame, build_task_header
+
+
+def test_text_command_after_a_frame_in_the_same_write():
+    emulator = RTOSEmulator()
+    frame = build_frame(KIND_START, 0, build_task_header(1, 0, 1, 4))
+    assert emulator.feed(frame + b"<LIST>\n") == b"ACK:S0\nNo stored tasks found.\n<END>\n"
+
+
+def test_frame_split_across_writes():
+    emulator = RTOSEmulator()
+    frame = build_frame(KIND_START, 0, build_task_header(1, 0, 1, 4))
+    assert emulator.feed(frame[:5]) == b""
+    assert emulator.feed(frame[5:] + b"<INFO:1>") == b"ACK:S0\nTask 1 not found.\n<END>\n"
+
+
+def test_stray_sync_byte_is_skipped():
+    emulator = RTOSEmulator()
+    assert emulator.feed(bytes([SYNC]) + b"xyz<LIST>\n") == b"No stored tasks found.\n<END>\n"
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="counts fds through /proc")
+def test_serve_pty_keeps_no_slave_fd_and_serves_reopens():
+    import tty
+
+    before = set(os.listdir("/proc/self/fd"))
+    path, stop_event = serve_pty()
+    try:
+        assert len(set(os.listdir("/proc/self/fd")) - before) == 1  # Only the master end
+        for _ in range(2):
+            fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+            try:
+                tty.setraw(fd)
+                os.write(fd, b"<LIST>\n")
+                reply = b""
+                deadline = time.monotonic() + 2
+                while b"<END>" not in reply and time.monotonic() < deadline:
+                    if select.select([fd], [], [], 0.1)[0]:
+                        reply += os.read(fd, 1024)
+            finally:
+                os.close(fd)
+            assert reply == b"No stored tasks found.\n<END>\n"
+    finally:
+        stop_event.set()
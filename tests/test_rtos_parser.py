@@ -0,0 +1,33 @@
+from rtos_parser import DumpRow, LineParser, Malformed, TaskRecord, parse_line, parse_task_list
+
+
+def test_list_reply():
+    lines = ["List of Tasks:", "Slot 0: ID=2 TYPE=1 PRIORITY=3 STATUS=1 SIZE=30 ADDR=0x5000 CRC=0x1234",
+             "Slot 3: ID=3 TYPE=0 PRIORITY=1 STATUS=0 SIZE=4 ADDR=0x0000"]
+    records = parse_task_list(lines)
+    assert records[0] == TaskRecord(2, 1, 3, 30, 1, 0x5000, 0, 0x1234)
+    assert records[1].crc is None and records[1].slot == 3
+
+
+def test_fields_in_another_order():
+    record = parse_line("ID=4 SIZE=12 STATUS=1 PRIORITY=2 TYPE=0")
+    assert isinstance(record, TaskRecord) and record.id == 4 and record.size == 12
+
+
+def test_byte_at_a_time_feeding():
+    stream = b"Slot 1: ID=1 TYPE=0 PRIORITY=1 STATUS=1 SIZE=8 ADDR=0x0000\n0010: FF 00 01\n<END>\nID=x\n"
+    parser = LineParser()
+    records = []
+    for index in range(len(stream)):
+        records += parser.feed(stream[index:index + 1])
+    assert isinstance(records[0], TaskRecord)
+    assert isinstance(records[1], DumpRow) and records[1].address == 0x10 and records[1].data == b"\xff\x00\x01"
+    assert isinstance(records[2], Malformed)
+    assert parser.malformed == 1
+
+
+def test_overlong_line_is_malformed():
+    parser = LineParser()
+    records = parser.feed(b"A" * 600) + parser.feed(b"B\nID=1 TYPE=0\n")
+    assert isinstance(records[0], Malformed)
+    assert isinstance(records[1], TaskRecord)
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+import rtos_client
+from rtos_emulator import EmulatedSerial
+from serial_worker import SerialWorker
+from task_upload import build_task_header
+
+
+def _board(*task_ids, baud_rate=115200):
+    ser = EmulatedSerial(baud_rate=baud_rate)
+    for task_id in task_ids:
+        ser.emulator.store(build_task_header(task_id, 0, 1, 4), bytes(4))
+    return ser
+
+
+def test_exclusive_commands_run_on_the_worker_thread():
+    worker = SerialWorker(_board(1)).start()
+    try:
+        threads = []
+        future = worker.submit(lambda ser: threads.append(threading.current_thread().name)
+                               or rtos_client.list_tasks(ser))
+        assert "ID=1 " in future.result(5)[1]
+        assert threads == ["serial-worker"]
+    finally:
+        worker.stop()
+
+
+def test_callbacks_run_on_the_caller_thread():
+    worker = SerialWorker(_board(1)).start()
+    try:
+        seen = []
+        future = worker.submit(rtos_client.task_info, 1, callback=lambda done: seen.append(done.result()["id"]))
+        future.result(5)
+        assert seen == []  # Queued until process_callbacks()
+        worker.process_callbacks()
+        assert seen == [1]
+    finally:
+        worker.stop()
+
+
+def test_stop_fails_what_is_still_queued():
+    worker = SerialWorker(_board()).start()
+    release = threading.Event()
+    busy = worker.submit(lambda ser: release.wait(5))
+    queued = worker.request(rtos_client.list_request())
+    threading.Timer(0.2, release.set).start()
+    worker.stop()
+    assert busy.result(5) is True
+    assert queued.cancelled() or isinstance(queued.exception(5), RuntimeError)
+    with pytest.raises(RuntimeError):
+        worker.request(rtos_client.list_request()).result(1)
+
+
+def _chatty(ser):
+    """ Make the board print task output inside every reply, after its first line """
+    feed = ser.emulator.feed
+    ser.emulator.feed = lambda data: feed(data).replace(b"\n", b"\ntick\n", 1)
+    return ser
+
+
+def test_pipelined_replies_are_demultiplexed():
+    output = []
+    ser = _chatty(_board(1, 2))
+    worker = SerialWorker(ser, on_line=output.append, max_in_flight=4).start()
+    try:
+        futures = [worker.request(rtos_client.list_request()),
+                   worker.request(rtos_client.info_request(1)),
+                   worker.request(rtos_client.info_request(7)),
+                   worker.request(rtos_client.edit_request(2, 1, 3, 0)),
+                   worker.request(rtos_client.list_request())]
+        first, info, missing, edit, second = [future.result(5) for future in futures]
+    finally:
+        worker.stop()
+    worker.process_callbacks()
+
+    assert first[0] == "List of Tasks:" and len(first) == 3 and "tick" not in first
+    assert info.id == 1
+    assert missing is None
+    assert edit == ["Task 2 updated."]
+    assert "PRIORITY=3" in second[2]
+    assert output == ["tick"] * 5
+
+
+def test_output_between_commands_goes_to_on_line():
+    output = []
+    ser = _board(baud_rate=9600)
+    worker = SerialWorker(ser, on_line=output.append).start()
+    try:
+        ser.inject(b"LED on\nLED off\n")
+        assert worker.request(rtos_client.list_request()).result(5) == ["No stored tasks found."]
+    finally:
+        worker.stop()
+    worker.process_callbacks()
+    assert output == ["LED on", "LED off"]
@@ -0,0 +1,83 @@
+import pytest
+
+from task_budget import CONTEXT_BYTES, analyze, check_budget, parse_disassembly
+
+# avr-objdump -d of a task that calls helper() -> leaf() and then _delay()s on a
+# word counter of 1000 (sbiw + brne, 4 cycles per turn) in an endless loop
+DISASSEMBLY = """
+00000000 <task>:
+   0:\t0e 94 10 00 \tcall\t0x20\t; 0x20 <helper>
+   4:\t88 ee       \tldi\tr24, 0xE8\t; 232
+   6:\t93 e0       \tldi\tr25, 0x03\t; 3
+   8:\t01 97       \tsbiw\tr24, 0x01\t; 1
+   a:\tf1 f7       \tbrne\t.-4      \t; 0x8 <task+0x8>
+   c:\tf9 cf       \trjmp\t.-14     \t; 0x0 <task>
+
+00000020 <helper>:
+  20:\tcf 93       \tpush\tr28
+  22:\t0e 94 18 00 \tcall\t0x30\t; 0x30 <leaf>
+  26:\tcf 91       \tpop\tr28
+  28:\t08 95       \tret
+
+00000030 <leaf>:
+  30:\t08 95       \tret
+"""
+
+STACK_USAGE = "task.c:5:6:task\t0\tstatic\ntask.c:1:13:helper\t3\tstatic\n"
+
+
+def test_parse_disassembly():
+    functions = parse_disassembly(DISASSEMBLY)
+    assert list(functions) == ["task", "helper", "leaf"]
+    call = functions["task"][0]
+    assert (call.address, call.size, call.mnemonic, call.target, call.symbol) == (0, 4, "call", 0x20, "helper")
+
+
+def test_delay_loop_cycles():
+    budget = analyze(DISASSEMBLY, STACK_USAGE, f_cpu=8000000)
+    assert budget["loop"]
+    assert budget["delays"] == [{"function": "task", "address": 0x8, "cycles": 1000 * 4 - 1,
+                                 "ms": 3999 * 1000 / 8000000}]
+    # call 4 + helper (push 2, call 4, leaf ret 4, pop 2, ret 4) + ldi 1 + ldi 1 + rjmp 2
+    assert budget["busy_cycles"] == 24
+    assert budget["delay_cycles"] == 3999
+    assert budget["cpu_share"] == pytest.approx(24 / 4023)
+    assert budget["notes"] == []
+
+
+def test_stack_depth_follows_the_deepest_chain():
+    budget = analyze(DISASSEMBLY, STACK_USAGE)
+    # leaf: no .su entry and no pushes; helper: frame 3 + call into leaf; task: call into helper
+    assert budget["frames"]["leaf"] == {"frame": 0, "worst": 0}
+    assert budget["frames"]["helper"] == {"frame": 3, "worst": 5}
+    assert budget["stack"] == 7 + CONTEXT_BYTES
+
+
+def test_recursion_makes_the_stack_unbounded():
+    recursive = DISASSEMBLY.replace("  30:\t08 95       \tret",
+                                    "  30:\t0e 94 10 00 \tcall\t0x20\t; 0x20 <helper>\n  34:\t08 95       \tret")
+    budget = analyze(recursive, STACK_USAGE)
+    assert budget["stack"] is None
+    assert any("recursion" in note for note in budget["notes"])
+    with pytest.raises(ValueError, match="unbounded"):
+        check_budget(budget, 1)
+
+
+def test_missing_entry():
+    with pytest.raises(ValueError):
+        analyze(DISASSEMBLY, STACK_USAGE, entry="main")
+
+
+def test_cpu_share_limit_depends_on_priority():
+    budget = {"stack": 60, "cpu_share": 0.4, "notes": []}
+    check_budget(budget, 1)
+    check_budget(budget, 2)
+    with pytest.raises(ValueError, match="priority 3 allows 25%"):
+        check_budget(budget, 3)
+
+
+def test_stack_limit():
+    budget = {"stack": 200, "cpu_share": 0.1, "notes": []}
+    with pytest.raises(ValueError, match="200 bytes"):
+        check_budget(budget, 1, stack_budget=128)
+    check_budget(budget, 1, stack_budget=256)
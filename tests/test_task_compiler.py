@@ -0,0 +1,29 @@
+import os
+
+import task_compiler
+
+
+def _store(cache_dir, tmp_path, key, size, max_bytes):
+    bin_file = tmp_path / f"{key}.out"
+    bin_file.write_bytes(bytes(size))
+    report = {"symbols": [{"name": "x" * 100, "size": 1, "address": 0}] * 20}
+    task_compiler._cache_store(str(cache_dir), key, str(bin_file), max_bytes, report)
+
+
+def test_size_reports_count_toward_the_cap(tmp_path):
+    cache_dir = tmp_path / "cache"
+    _store(cache_dir, tmp_path, "a", 100, 10_000)
+    stats = task_compiler.cache_stats(str(cache_dir))
+    assert stats["entries"] == 1
+    assert stats["bytes"] == os.path.getsize(cache_dir / "a.bin") + os.path.getsize(cache_dir / "a.json")
+
+
+def test_eviction_removes_a_key_with_its_report(tmp_path):
+    cache_dir = tmp_path / "cache"
+    _store(cache_dir, tmp_path, "old", 100, 10_000)
+    entry = os.path.getsize(cache_dir / "old.bin") + os.path.getsize(cache_dir / "old.json")
+    os.utime(cache_dir / "old.bin", (1, 1))
+    os.utime(cache_dir / "old.json", (1, 1))
+    _store(cache_dir, tmp_path, "new", 100, entry + 50)  # Room for one entry, not for the .bin files alone
+    assert sorted(os.listdir(cache_dir)) == ["new.bin", "new.json"]
+    assert task_compiler.cache_stats(str(cache_dir))["bytes"] <= entry + 50
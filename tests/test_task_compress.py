@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from task_compress import COMPRESSED_FLAG, compress, decompress, pack, unpack_task, WINDOW_SIZE
+from task_upload import build_task_header, MAX_TASK_SIZE
+
+
+def _images():
+    rng = random.Random(7)
+    yield b""
+    yield b"\x00"
+    yield bytes(MAX_TASK_SIZE)
+    yield bytes(rng.randrange(256) for _ in range(MAX_TASK_SIZE))
+    yield bytes(range(256)) * 2  # A match exactly WINDOW_SIZE back
+    for _ in range(200):
+        size = rng.randint(0, MAX_TASK_SIZE)
+        yield bytes(rng.choice(b"\x00\x0c\x94\xff") for _ in range(size))
+
+
+def test_round_trip():
+    for image in _images():
+        assert decompress(compress(image), len(image)) == image
+
+
+def test_matches_stay_in_the_window():
+    image = bytes(range(256)) + bytes(range(256))
+    stream = compress(image)
+    assert len(stream) < len(image)
+    assert decompress(stream, len(image)) == image
+    assert WINDOW_SIZE == 256
+
+
+def test_pack_only_when_smaller():
+    for image in _images():
+        payload, packed = pack(image)
+        assert len(payload) <= len(image)
+        assert packed or payload == image
+
+
+def test_corrupt_streams_are_rejected():
+    image = bytes(range(32)) * 8
+    stream = compress(image)
+    with pytest.raises(ValueError):
+        decompress(stream[:-1], len(image))
+    with pytest.raises(ValueError):
+        decompress(stream + b"\x00", len(image))
+    with pytest.raises(ValueError):
+        decompress(b"\x00\x05\x00", 3)  # Match before any output
+
+
+def test_unpack_task_restores_header():
+    image = bytes(100)
+    payload, packed = pack(image)
+    assert packed
+    header = build_task_header(5, 1, 2, len(payload), 1 | COMPRESSED_FLAG, 0x5000)
+    stored_header, stored = unpack_task(header, payload)
+    assert stored == image
+    assert stored_header == build_task_header(5, 1, 2, len(image), 1, 0x5000)
+
+
+def test_unpack_task_passes_plain_uploads_through():
+    header = build_task_header(5, 1, 2, 3)
+    assert unpack_task(header, b"abc") == (header, b"abc")
@@ -0,0 +1,58 @@
+import json
+
+import task_manifest
+from rtos_emulator import EmulatedSerial
+from rtos_parser import TaskRecord
+from task_upload import crc16
+
+IMAGE = bytes(range(40))
+
+
+def _entry(task_id, image=IMAGE, **fields):
+    return dict({"id": task_id, "file": f"t{task_id}.bin", "type": 0, "priority": 1, "status": 1,
+                 "image": image}, **fields)
+
+
+def _record(task_id, image=IMAGE, **fields):
+    return TaskRecord(task_id, size=len(image), status=1, crc=crc16(image), **fields)
+
+
+def _actions(plan):
+    return {item["id"]: item["action"] for item in plan}
+
+
+def test_plan_sync():
+    entries = [_entry(1), _entry(2, priority=3), _entry(3, image=bytes(40)), _entry(4)]
+    records = [_record(1), _record(2), _record(3), _record(5), TaskRecord(4, size=40, status=1)]
+    plan = task_manifest.plan_sync(entries, records)
+    assert _actions(plan) == {1: "keep", 2: "edit", 3: "upload", 4: "upload", 5: "keep"}
+    assert _actions(task_manifest.plan_sync(entries, records, prune=True))[5] == "delete"
+
+
+def test_sync_then_resync_is_a_no_op(tmp_path):
+    (tmp_path / "a.bin").write_bytes(IMAGE)
+    (tmp_path / "b.bin").write_bytes(bytes(20))
+    path = tmp_path / "tasks.json"
+    path.write_text(json.dumps({"tasks": [{"id": 1, "file": "a.bin"}, {"id": 2, "file": "b.bin", "priority": 2}]}))
+    manifest = task_manifest.load_manifest(str(path))
+    assert manifest["prune"] is False
+
+    ser = EmulatedSerial(baud_rate=115200)
+    report = task_manifest.sync(ser, manifest)
+    assert report["applied"] and not report["failed"]
+    assert ser.emulator.flash[1] == IMAGE and ser.emulator.slot(2)["priority"] == 2
+
+    again = task_manifest.sync(ser, manifest)
+    assert set(_actions(again["plan"]).values()) == {"keep"}
+
+
+def test_sync_reports_failed_uploads(tmp_path):
+    (tmp_path / "a.bin").write_bytes(IMAGE)
+    path = tmp_path / "tasks.json"
+    path.write_text(json.dumps({"tasks": [{"id": 1, "file": "a.bin"}]}))
+
+    ser = EmulatedSerial(baud_rate=115200)
+    ser.emulator._task = lambda header, image: ["Error: EEPROM write failed."]
+    report = task_manifest.sync(ser, task_manifest.load_manifest(str(path)))
+    assert not report["applied"]
+    assert report["failed"] == [1]
@@ -0,0 +1,46 @@
+import pytest
+
+import rtos_client
+from rtos_emulator import EmulatedSerial, RTOSEmulator
+from task_upload import TaskUploadReceiver, build_frame, build_task_header, KIND_START
+
+
+def _image(size=300):
+    return bytes((i * 7) & 0xFF for i in range(size))
+
+
+def test_framed_upload_survives_corrupted_frames():
+    ser = EmulatedSerial(RTOSEmulator(error_rate=0.2, seed=3), baud_rate=115200)
+    image = _image()
+    stats = rtos_client.upload_task_image(ser, 4, 1, 2, image, framed=True)
+    assert stats["retransmits"] > 0
+    assert ser.emulator.flash[4] == image
+    assert ser.emulator.slot(4)["size"] == len(image)
+
+
+def test_receiver_naks_a_corrupted_frame():
+    receiver = TaskUploadReceiver()
+    frame = bytearray(build_frame(KIND_START, 0, build_task_header(1, 0, 1, 10)))
+    frame[-1] ^= 0xFF
+    assert receiver.feed(bytes(frame)) == [b"NAK:S0\n"]
+    assert receiver.frames_rejected == 1
+
+
+@pytest.mark.parametrize("framed", [False, True])
+def test_compressed_upload_is_stored_decoded(framed):
+    ser = EmulatedSerial(baud_rate=115200)
+    image = bytes(range(64)) * 6
+    rtos_client.upload_task_image(ser, 2, 0, 1, image, framed, compress=True)
+    assert ser.emulator.flash[2] == image
+    assert ser.emulator.slot(2)["size"] == len(image)
+    assert ser.emulator.slot(2)["status"] == 1
+
+
+def test_plain_upload_needs_the_stored_confirmation():
+    assert rtos_client.check_upload_reply(3, ["Task 3 stored (30 bytes)."])
+    with pytest.raises(RuntimeError):
+        rtos_client.check_upload_reply(3, [])
+    with pytest.raises(RuntimeError):
+        rtos_client.check_upload_reply(3, ["<TASK:\x03\x00\x01>"])  # Echo
+    with pytest.raises(RuntimeError):
+        rtos_client.check_upload_reply(3, ["Task 3 rejected: Compressed image is truncated."])
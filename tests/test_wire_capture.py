@@ -0,0 +1,55 @@
+import rtos_client
+from rtos_emulator import EmulatedSerial
+from task_upload import build_task_header
+from wire_capture import BAUD, Capture, CaptureSerial, ReplaySerial, RX, TX, replay_device, replay_parser
+
+
+def _board():
+    ser = EmulatedSerial(baud_rate=115200)
+    ser.emulator.store(build_task_header(2, 0, 1, 4), bytes(4))
+    return ser
+
+
+def _session(path):
+    ser = _board()
+    port = CaptureSerial(ser, str(path))
+    lines = rtos_client.list_tasks(port)
+    rtos_client.debug_dump(port)
+    port.close()
+    return ser, lines
+
+
+def test_reads_are_merged_into_few_records(tmp_path):
+    path = tmp_path / "wire.cap"
+    ser, _ = _session(path)
+    with Capture(str(path)) as capture:
+        summary = capture.summary()["directions"]
+        assert summary["RX"]["bytes"] == ser.bytes_out
+        assert summary["RX"]["records"] * 20 < summary["RX"]["bytes"]
+        assert summary["TX"]["bytes"] == ser.bytes_in
+
+
+def test_capture_replays_through_parser_device_and_port(tmp_path):
+    path = tmp_path / "wire.cap"
+    _, lines = _session(path)
+    with Capture(str(path)) as capture:
+        directions = [direction for _, direction, _ in capture.records()]
+        assert directions[0] == TX and RX in directions and BAUD not in directions
+        assert b"List of Tasks:" in capture.stream(RX)
+        parsed = replay_parser(capture)
+        assert parsed["records"] and parsed["malformed"] == 0
+        assert replay_device(capture, _board().emulator)["match"]
+
+    port = ReplaySerial(str(path), speed=0)
+    assert rtos_client.list_tasks(port) == lines
+
+
+def test_baud_changes_are_recorded(tmp_path):
+    path = tmp_path / "wire.cap"
+    port = CaptureSerial(EmulatedSerial(baud_rate=9600), str(path))
+    port.write(b"<LIST>\n")
+    port.baudrate = 115200
+    port.close()
+    with Capture(str(path)) as capture:
+        records = [(direction, bytes(data)) for _, direction, data in capture.records()]
+    assert records == [(TX, b"<LIST>\n"), (BAUD, (115200).to_bytes(4, "little"))]
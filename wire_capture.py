@@ -0,0 +1,385 @@
+import argparse
+import datetime
+import difflib
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from log_sink import LOG_DIR
+from rtos_parser import LineParser
+from serial_worker import END_MARKER
+
+# ---------------- Wire Capture & Replay ---------------- #
+#
+# CaptureSerial sits under the transport and appends every byte written and
+# read to a binary capture file:
+#   file header   magic "RTOSCAP1", wall-clock start (double), baud rate (uint32)
+#   record        microseconds since the previous record (uint32), direction
+#                 (uint8), length (uint16), then the bytes
+# Timestamps come from the monotonic clock. Reads and writes in the same
+# direction are merged into one record (stamped with its first byte) until the
+# direction changes or MERGE_SECONDS pass, since readers mostly read(1) and a
+# header per call would outweigh the data. Records are only ever appended and
+# flushed one by one, so a crash loses at most the record being collected; a
+# truncated last record is ignored when reading.
+# Capture reads a file through mmap without copying it, and the replay helpers
+# feed it back through the parser, the emulated board or any code that takes a
+# port (ReplaySerial, "replay://file" in rtos_client.open_port).
+
+MAGIC = b"RTOSCAP1"
+FILE_HEADER = struct.Struct("<8sdI")
+RECORD = struct.Struct("<IBH")
+MAX_RECORD = 0xFFFF
+MERGE_SECONDS = 0.02
+TX, RX, BAUD = 0, 1, 2  # host -> device, device -> host, port rate change (uint32 rate)
+DIRECTIONS = {TX: "TX", RX: "RX", BAUD: "BAUD"}
+
+
+def capture_path(name="wire"):
+    """ New capture file next to the session logs, e.g. ~/.cache/rtos-logs/wire-20250605-141500.cap """
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(LOG_DIR, f"{name}-{stamp}.cap")
+
+
+class CaptureSerial:
+    """ Port wrapper that records every byte read and written through it.
+
+    An existing capture file is appended to, so a reconnect keeps one log.
+    """
+
+    def __init__(self, ser, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file = open(path, "ab")
+        if file.tell() == 0:
+            file.write(FILE_HEADER.pack(MAGIC, time.time(), ser.baudrate or 0))
+            file.flush()
+        self.__dict__.update(ser=ser, path=path, _file=file, _lock=threading.Lock(), _last=time.monotonic_ns(),
+                             _pending=bytearray(), _pending_direction=None, _pending_at=0)
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.ser, name, value)  # timeout, baudrate, ... belong to the real port
+        if name == "baudrate":
+            self._record(BAUD, int(value).to_bytes(4, "little"))
+
+    def _record(self, direction, data):
+        with self._lock:
+            if self._file.closed:
+                return
+            now = time.monotonic_ns()
+            if self._pending and (direction != self._pending_direction or self._due(now)):
+                self._write_pending()
+            if not self._pending:
+                self.__dict__.update(_pending_direction=direction, _pending_at=now)
+            self._pending.extend(data)
+            if direction == BAUD:
+                self._write_pending()  # A rate change is a record of its own
+
+    def _due(self, now):
+        return now - self._pending_at >= MERGE_SECONDS * 1e9
+
+    def _write_pending(self):
+        """ Append the collected bytes as one record (more past MAX_RECORD); called with the lock held """
+        delta = min(max(0, self._pending_at - self._last) // 1000, 0xFFFFFFFF)
+        self.__dict__["_last"] = self._last + delta * 1000  # Keep the sub-microsecond rest
+        data = self._pending
+        for start in range(0, len(data), MAX_RECORD):
+            chunk = data[start:start + MAX_RECORD]
+            self._file.write(RECORD.pack(delta, self._pending_direction, len(chunk)))
+            self._file.write(chunk)
+            delta = 0
+        self._file.flush()
+        data.clear()
+
+    def flush_capture(self):
+        """ Write out a record whose merge window has passed """
+        with self._lock:
+            if self._pending and not self._file.closed and self._due(time.monotonic_ns()):
+                self._write_pending()
+
+    def read(self, size=1):
+        data = self.ser.read(size)
+        if data:
+            self._record(RX, data)
+        else:
+            self.flush_capture()  # Idle: don't hold the last reply back until the next byte
+        return data
+
+    def write(self, data):
+        data = bytes(data)
+        self._record(TX, data)
+        return self.ser.write(data)
+
+    def close(self):
+        with self._lock:
+            if self._pending and not self._file.closed:
+                self._write_pending()
+            self._file.close()
+        self.ser.close()
+
+
+class Capture:
+    """ Read-only, memory-mapped capture file.
+
+    records() yields (seconds since the start, direction, memoryview) without
+    copying the data; the views are only valid until close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        if os.fstat(self._file.fileno()).st_size < FILE_HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} is not a wire capture (too short)")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.started, self.baud_rate = FILE_HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a wire capture")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # Record views still alive; the map goes when they do
+        self._file.close()
+
+    def records(self, directions=(TX, RX, BAUD)):
+        view = memoryview(self._map)
+        offset = FILE_HEADER.size
+        micros = 0
+        while offset + RECORD.size <= len(view):
+            delta, direction, length = RECORD.unpack_from(view, offset)
+            offset += RECORD.size
+            if offset + length > len(view):
+                break  # Cut off mid-record
+            micros += delta
+            if direction in directions:
+                yield micros / 1e6, direction, view[offset:offset + length]
+            offset += length
+
+    def stream(self, direction=RX):
+        """ All bytes of one direction, concatenated """
+        return b"".join(data for _, _, data in self.records((direction,)))
+
+    def summary(self):
+        """ Record / byte counts and the time span of the capture """
+        counts = {name: {"records": 0, "bytes": 0} for name in DIRECTIONS.values()}
+        last = 0.0
+        for seconds, direction, data in self.records():
+            entry = counts[DIRECTIONS.get(direction, "BAUD")]
+            entry["records"] += 1
+            entry["bytes"] += len(data)
+            last = seconds
+        return {"path": self.path, "started": self.started, "baud_rate": self.baud_rate,
+                "seconds": last, "directions": counts}
+
+
+def _pace(start, seconds, speed):
+    """ Sleep until a record recorded `seconds` in is due at `speed` times real time """
+    if speed:
+        wait = start + seconds / speed - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+
+
+def replay_parser(capture, speed=None, parser=None, on_record=None):
+    """ Feed the device -> host bytes of a capture through a LineParser.
+
+    speed None replays as fast as possible (to measure the parser), otherwise
+    at speed times the recorded rate. on_record(record) sees every parsed
+    record. Returns throughput and parse counts.
+    """
+    parser = parser or LineParser()
+    records = 0
+    total = 0
+    start = time.perf_counter()
+    for seconds, _, data in capture.records((RX,)):
+        _pace(start, seconds, speed)
+        for record in parser.feed(bytes(data)):
+            records += 1
+            if on_record:
+                on_record(record)
+        total += len(data)
+    for record in parser.flush():
+        records += 1
+        if on_record:
+            on_record(record)
+    elapsed = time.perf_counter() - start
+    return {"bytes": total, "records": records, "lines": parser.lines, "malformed": parser.malformed,
+            "seconds": elapsed, "bytes_per_second": total / elapsed if elapsed > 0 else 0.0}
+
+
+def _lines(data):
+    """ Reply lines without <END>, which the host may not have read before closing the port """
+    lines = (line.strip() for line in data.decode("utf-8", errors="ignore").split("\n"))
+    return [line for line in lines if line and line != END_MARKER]
+
+
+def replay_device(capture, emulator=None, speed=None):
+    """ Send the host -> device bytes of a capture to an emulated board and compare its replies.
+
+    Returns the emulator's reply lines, the recorded ones and a diff of the two
+    (recorded task output shows up as lines only the capture has).
+    """
+    from rtos_emulator import RTOSEmulator
+
+    emulator = emulator or RTOSEmulator(baud_rate=capture.baud_rate or None)
+    replies = bytearray()
+    start = time.perf_counter()
+    for seconds, direction, data in capture.records((TX, BAUD)):
+        _pace(start, seconds, speed)
+        if direction == BAUD:
+            emulator.baud_rate = int.from_bytes(data, "little")
+            continue
+        replies += emulator.feed(bytes(data))
+        emulator.pending_baud = None  # The port rate change is recorded separately
+    emulated, recorded = _lines(bytes(replies)), _lines(capture.stream(RX))
+    diff = [line for line in difflib.unified_diff(recorded, emulated, "recorded", "emulated", lineterm="", n=1)]
+    return {"commands": emulator.commands, "emulated": emulated, "recorded": recorded, "diff": diff,
+            "match": not diff, "seconds": time.perf_counter() - start}
+
+
+class ReplaySerial:
+    """ pyserial-like port that plays back the device -> host bytes of a capture.
+
+    Bytes become readable at their recorded time divided by speed (speed 0:
+    all at once), counted from the first read or write. Writes are accepted and
+    counted but don't change what is played back.
+    """
+
+    def __init__(self, path, speed=1.0, timeout=1):
+        self.port = f"replay://{path}"
+        self.timeout = timeout
+        self.speed = speed
+        self.is_open = True
+        self.bytes_written = 0
+        self._times = []  # Recorded time of each RX record
+        self._ends = []   # Stream offset just past each RX record
+        chunks = []
+        with Capture(path) as capture:
+            self.baudrate = capture.baud_rate
+            for seconds, _, data in capture.records((RX,)):
+                chunks.append(bytes(data))
+                self._times.append(seconds)
+                self._ends.append((self._ends[-1] if self._ends else 0) + len(data))
+        self._data = b"".join(chunks)
+        self._position = 0  # Bytes read so far
+        self._ready = 0     # Records whose time has come
+        self._start = None
+
+    def _available(self):
+        if self._start is None:
+            self._start = time.monotonic()
+        elapsed = time.monotonic() - self._start
+        while self._ready < len(self._times) and (not self.speed or self._times[self._ready] / self.speed <= elapsed):
+            self._ready += 1
+        return (self._ends[self._ready - 1] if self._ready else 0) - self._position
+
+    @property
+    def in_waiting(self):
+        return self._available()
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            available = self._available()
+            if available:
+                break
+            now = time.monotonic()
+            if self._ready >= len(self._times):
+                if deadline is not None:
+                    time.sleep(max(0.0, deadline - now))
+                return b""  # Capture finished
+            if deadline is not None and now >= deadline:
+                return b""
+            due = self._start + self._times[self._ready] / self.speed
+            time.sleep(max(0.0, (due if deadline is None else min(due, deadline)) - now))
+
+        data = self._data[self._position:self._position + min(size, available)]
+        self._position += len(data)
+        return data
+
+    def write(self, data):
+        if self._start is None:
+            self._start = time.monotonic()
+        self.bytes_written += len(data)
+        return len(data)
+
+    def reset_input_buffer(self):
+        pass  # Keep the recording intact: replies would otherwise be thrown away on every command
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def format_records(capture, limit=None):
+    """ One line per record: time, direction, bytes as text (binary shown as hex) """
+    lines = []
+    for seconds, direction, data in capture.records():
+        if limit is not None and len(lines) >= limit:
+            break
+        if direction == BAUD:
+            text = f"{int.from_bytes(data, 'little')} baud"
+        else:
+            raw = bytes(data)
+            printable = all(32 <= byte < 127 or byte in (9, 10, 13) for byte in raw)
+            text = repr(raw.decode("ascii")) if printable else raw.hex(" ")
+        lines.append(f"{seconds:10.6f}  {DIRECTIONS.get(direction, '?'):4s} {len(data):5d}  {text}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and replay wire captures")
+    commands = parser.add_subparsers(dest="command", required=True)
+    show = commands.add_parser("show", help="list the records of a capture")
+    show.add_argument("capture")
+    show.add_argument("--limit", type=int)
+    replay = commands.add_parser("replay", help="feed a capture through the parser or the emulated board")
+    replay.add_argument("capture")
+    replay.add_argument("--to", choices=["parser", "device"], default="parser")
+    replay.add_argument("--speed", type=float, help="times real time (default: as fast as possible)")
+    args = parser.parse_args(argv)
+
+    with Capture(args.capture) as capture:
+        if args.command == "show":
+            summary = capture.summary()
+            print(f"{args.capture}: {summary['seconds']:.3f}s at {summary['baud_rate']} baud, " +
+                  ", ".join(f"{name} {entry['records']} records / {entry['bytes']} B"
+                            for name, entry in summary["directions"].items()))
+            for line in format_records(capture, args.limit):
+                print(line)
+            return 0
+
+        if args.to == "parser":
+            stats = replay_parser(capture, args.speed)
+            print(f"{stats['bytes']} B -> {stats['records']} records ({stats['malformed']} malformed) in "
+                  f"{stats['seconds']:.4f}s = {stats['bytes_per_second'] / 1e6:.2f} MB/s")
+            return 0
+
+        result = replay_device(capture, speed=args.speed)
+        print(f"{result['commands']} commands replayed in {result['seconds']:.3f}s: "
+              + ("replies match the capture" if result["match"] else "replies differ from the capture"))
+        for line in result["diff"]:
+            print(line)
+        return 0 if result["match"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())